@@ -0,0 +1,87 @@
+"""
+Event loop CPU time per LED frame against the number of fading LED bytes:
+one asyncio task per light (like LightPlatformSoftwareFade) compared with
+the vectorized FanTasTicFadeEngine.
+
+    $ python3 benchmarks/bench_fade.py
+"""
+import time
+import asyncio
+from fantastic_platform.fantastic_led_frame import FanTasTicLedFrame
+from fantastic_platform.fantastic_fade import FanTasTicFadeEngine
+
+UPDATE_HZ = 50
+DURATION = 1.0
+N_FADING = (30, 300, 1000, 3072, 9216)
+
+
+async def legacy_fade(loop, buf, ind, startB, startT, targetB, targetT):
+    """ Same loop as LightPlatformSoftwareFade, one task per light """
+    while True:
+        now = loop.time()
+        if now >= targetT:
+            buf[ind] = int(targetB * 255)
+            return
+        ratio = (now - startT) / (targetT - startT)
+        buf[ind] = int((startB + (targetB - startB) * ratio) * 255)
+        await asyncio.sleep(1 / UPDATE_HZ)
+
+
+def run_legacy(nFading):
+    loop = asyncio.new_event_loop()
+    frames = [FanTasTicLedFrame(ch) for ch in range(3)]
+    t0 = loop.time()
+    tasks = list()
+    for i in range(nFading):
+        frame = frames[i // FanTasTicLedFrame.MAX_BYTES]
+        tasks.append(loop.create_task(legacy_fade(
+            loop, frame.buf,
+            FanTasTicLedFrame.HEADER_LEN + i % FanTasTicLedFrame.MAX_BYTES,
+            0.0, t0, 1.0, t0 + DURATION
+        )))
+    tCpu = time.process_time()
+    loop.run_until_complete(asyncio.gather(*tasks))
+    tCpu = time.process_time() - tCpu
+    loop.close()
+    return tCpu
+
+
+def run_engine(nFading):
+    loop = asyncio.new_event_loop()
+    frames = [FanTasTicLedFrame(ch) for ch in range(3)]
+    engine = FanTasTicFadeEngine(frames)
+    t0 = loop.time()
+    for i in range(nFading):
+        engine.set_fade(
+            i // FanTasTicLedFrame.MAX_BYTES,
+            i % FanTasTicLedFrame.MAX_BYTES,
+            0.0, t0, 1.0, t0 + DURATION
+        )
+
+    async def ticker():
+        while True:
+            engine.update(loop.time())
+            await asyncio.sleep(1 / UPDATE_HZ)
+
+    task = loop.create_task(ticker())
+    tCpu = time.process_time()
+    loop.run_until_complete(asyncio.sleep(DURATION))
+    tCpu = time.process_time() - tCpu
+    task.cancel()
+    loop.run_until_complete(asyncio.sleep(0))
+    loop.close()
+    return tCpu
+
+
+def main():
+    nFrames = DURATION * UPDATE_HZ
+    print("CPU time per {0:.0f} ms LED frame".format(1000 / UPDATE_HZ))
+    print("{0:>8s} {1:>12s} {2:>12s}".format("fading", "legacy [ms]", "engine [ms]"))
+    for nFading in N_FADING:
+        tLegacy = run_legacy(nFading) / nFrames * 1e3
+        tEngine = run_engine(nFading) / nFrames * 1e3
+        print("{0:8d} {1:12.3f} {2:12.3f}".format(nFading, tLegacy, tEngine))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Compares the allocations and throughput of assembling `LED` frames the
+legacy way (`bytes(header) + ledByteData`) with the preallocated
+FanTasTicLedFrame buffers.
+
+`flush` measures the whole path a frame takes to the serial port:
+update_leds() and a flush of the communicator with a control command
+queued, into a writer which converts the data to bytes like pyserial does.
+The frames are copied once there, so the allocations are about the size of
+the frames sent.
+
+    $ python3 benchmarks/bench_led_frame.py
+"""
+import timeit
+import asyncio
+import tracemalloc
+from serial.serialutil import to_bytes
+from fantastic_platform.fantastic_led_frame import FanTasTicLedFrame
+from fake_platform import make_platform, attach_null_comm
+
+N_CHANNELS = 3
+N_BYTES = FanTasTicLedFrame.MAX_BYTES
+N_FRAMES = 2000
+
+
+class NullTransport:
+    """ Counts the bytes it is handed, like a transport which never blocks """
+    def __init__(self):
+        self.nBytes = 0
+
+    def send(self, msg):
+        self.nBytes += len(msg)
+
+
+def legacy_update(ledByteData, tx):
+    for channel, ledDat in enumerate(ledByteData):
+        if len(ledDat) > 0:
+            msg = bytes(
+                "LED {0} {1}\n".format(channel, len(ledDat)),
+                "utf8"
+            ) + ledDat
+            # FanTasTicSerialCommunicator.send() used to copy once more
+            tx.send(bytes(msg))
+
+
+def frame_update(ledFrames, tx):
+    for frame in ledFrames:
+        if frame.nBytes > 0:
+            tx.send(frame.get_frame(frame.nBytes))
+
+
+class PyserialWriter:
+    """ Takes the place of the transport, copies what it gets like pyserial """
+    def __init__(self):
+        self.transport = self
+        self.nBytes = 0
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def write(self, data):
+        self.nBytes += len(to_bytes(data))
+
+    def close(self):
+        pass
+
+
+def flush_update(platform, tx):
+    for frame in platform.ledFrames:
+        frame.dirtyLen = frame.nBytes
+    comm = platform.serialCom
+    comm.send(b"OUT 5 0\n")
+    platform.update_leds()
+    comm.flush()
+
+
+def measure(name, func, data):
+    tx = NullTransport()
+    func(data, tx)  # warm up (header cache, ...)
+    tracemalloc.start()
+    func(data, tx)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    t = timeit.timeit(lambda: func(data, tx), number=N_FRAMES)
+    print("{0:>8s}: {1:8.2f} us / frame, {2:8.1f} MB/s, {3:6d} B peak alloc".format(
+        name,
+        t / N_FRAMES * 1e6,
+        N_CHANNELS * N_BYTES * N_FRAMES / t / 1e6,
+        peak
+    ))
+
+
+def main():
+    print("{0} channels x {1} LEDs".format(N_CHANNELS, N_BYTES // 3))
+    ledByteData = [bytearray(N_BYTES) for _ in range(N_CHANNELS)]
+    measure("legacy", legacy_update, ledByteData)
+    ledFrames = [FanTasTicLedFrame(ch) for ch in range(N_CHANNELS)]
+    for frame in ledFrames:
+        frame.extend(N_BYTES)
+    measure("frame", frame_update, ledFrames)
+    platform = make_platform(asyncio.new_event_loop())
+    platform.flag_led_tick_registered = True
+    for ch in range(N_CHANNELS):
+        platform.configure_light(
+            "0, {0}-{1}".format(ch, N_BYTES // 3 - 1), None, {}
+        )
+    attach_null_comm(platform).writer = PyserialWriter()
+    measure("flush", flush_update, platform)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Event loop lag under a full LED load (3 channels of 1024 LEDs, all
+changing every frame, with gamma correction), with the bulk writer thread
+(`bulk_writer_thread: true`) off and on.
+
+The board reads at the speed of a full speed USB link, so the host sees
+back pressure like on the real hardware. A probe task sleeps 1 ms at a
+time and records how late it wakes up. That is the delay a switch event
+would see. `loop CPU` is the CPU time of the event loop thread per LED
+frame, without the probe.
+
+    $ python3 benchmarks/bench_led_writer.py
+"""
+import asyncio
+import time
+import numpy
+from fantastic_platform.fantastic_histogram import FanTasTicHistogram
+from fantastic_platform.fantastic_led_frame import FanTasTicLedFrame
+from fake_platform import make_platform
+from pty_board import ReplyBoard
+
+FRAME_RATE = 50
+DURATION = 3.0
+PROBE_INTERVAL = 0.001
+LINK_SPEED = 1e6    # [bytes / s]
+
+
+class UsbBoard(ReplyBoard):
+    """ Takes the data not faster than LINK_SPEED """
+
+    def receive(self, dat):
+        super().receive(dat)
+        time.sleep(len(dat) / LINK_SPEED)
+
+
+async def probe(hist, stopAt):
+    loop = asyncio.get_event_loop()
+    tCpu = 0.0
+    while loop.time() < stopAt:
+        t = loop.time()
+        await asyncio.sleep(PROBE_INTERVAL)
+        tc = time.thread_time()
+        hist.record(int((loop.time() - t - PROBE_INTERVAL) * 1e6))
+        tCpu += time.thread_time() - tc
+    return tCpu
+
+
+async def measure(name, nLeds, useThread):
+    loop = asyncio.get_event_loop()
+    board = UsbBoard()
+    board.start()
+    platform = make_platform(loop, {
+        "port": board.port,
+        "led_gamma": 2.2,
+        "bulk_writer_thread": useThread
+    })
+    await platform.initialize()
+    await platform.get_hw_switch_states()
+    lag = FanTasTicHistogram("loop lag ({0})".format(name), "us")
+    ramp = numpy.arange(max(nLeds, 1) * 3, dtype=numpy.uint8).reshape(-1, 3)
+    stopAt = loop.time() + DURATION
+    probeTask = loop.create_task(probe(lag, stopAt))
+    nBytes = board.nBytes
+    tCpu = time.thread_time()
+    i = 0
+    while loop.time() < stopAt:
+        if nLeds > 0:
+            for ch in range(3):
+                platform.set_leds_brightness(
+                    ch, slice(0, nLeds), ramp + numpy.uint8((i + ch) & 0xFF)
+                )
+            platform.update_leds()
+        i += 1
+        await asyncio.sleep(1 / FRAME_RATE)
+    tProbe = await probeTask
+    tCpu = time.thread_time() - tCpu - tProbe
+    await asyncio.sleep(0.1)
+    print(lag)
+    print("  loop CPU: {0:.0f} us per frame, {1:.0f} kB/s to the board, "
+          "{2} frames deferred".format(
+              tCpu / i * 1e6,
+              (board.nBytes - nBytes) / DURATION / 1e3,
+              platform.get_led_stats()["frames_deferred"]
+          ))
+    platform.stop()
+    await asyncio.sleep(0.01)
+    board.stop()
+
+
+async def run():
+    n = FanTasTicLedFrame.MAX_LEDS
+    await measure("idle", 0, False)
+    await measure("loop", n, False)
+    await measure("thread", n, True)
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
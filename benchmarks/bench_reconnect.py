@@ -0,0 +1,91 @@
+"""
+Recovery time after a firmware reset (`ER:` watchdog error): reconnect,
+replay the shadow state in one burst and re-sync the switches.
+
+The board is a pty stand-in. The platform is configured like a full
+machine: all switches, flipper rules, a held driver and 300 LEDs.
+
+    $ python3 benchmarks/bench_reconnect.py
+"""
+import asyncio
+import logging
+from mpf.core.platform import SwitchConfig, DriverConfig, SwitchSettings, \
+    DriverSettings
+from mpf.platforms.interfaces.driver_platform_interface import \
+    PulseSettings, HoldSettings
+from fantastic_platform.fantastic_histogram import FanTasTicHistogram
+from fake_platform import make_platform
+from pty_board import ReplyBoard
+
+N_RESETS = 20
+SWITCHES = [i for i in range(0x140) if i not in range(0x40, 0x47)]
+N_LEDS = 300
+ERR_WATCHDOG = b"ER:257\n"
+
+
+async def setup(board):
+    loop = asyncio.get_event_loop()
+    platform = make_platform(loop, {"port": board.port})
+    await platform.initialize()
+    for number in SWITCHES:
+        platform.configure_switch(
+            str(number), SwitchConfig(invert=False, debounce=True), {}
+        )
+    config = DriverConfig(30, 1.0, 0.25, False, None, 1.0, 1.0)
+    drivers = [platform.configure_driver(config, str(n), {}) for n in
+               (0x3C, 0x3D, 0x20, 0x21)]
+    switches = platform.boards[0].configuredSwitches
+    for sw, driver in zip((0x18, 0x19, 0x1A), drivers):
+        platform.set_pulse_on_hit_and_enable_and_release_rule(
+            SwitchSettings(switches[sw], False, False),
+            DriverSettings(driver, None, None, None)
+        )
+    drivers[3].enable(PulseSettings(1.0, 20), HoldSettings(0.5))
+    platform.set_leds_brightness(0, slice(0, N_LEDS), 0.5)
+    await platform.get_hw_switch_states()
+    return platform
+
+
+async def run():
+    board = ReplyBoard()
+    board.start()
+    platform = await setup(board)
+    changes = list()
+    platform.machine.switch_controller.handler = \
+        lambda num, state: changes.append((num, state))
+    tRecover = FanTasTicHistogram("recovery", "us")
+    nBytes = 0
+    for i in range(N_RESETS):
+        # Two switches change while the board is gone
+        board.switchBits ^= 1 << (i % 0x140) | 1 << 0x13F
+        del changes[:]
+        del board.lines[:]
+        bytesBefore = board.nBytes
+        t = platform.machine.clock.loop.time()
+        board.write(ERR_WATCHDOG)
+        board0 = platform.boards[0]
+        while board0.recoverTask is None:
+            await asyncio.sleep(0)
+        await board0.recoverTask
+        tRecover.record(int((platform.machine.clock.loop.time() - t) * 1e6))
+        nBytes += board.nBytes - bytesBefore
+        board0.recoverTask = None
+        assert board0.hw_switch_bits == board.switchBits
+        assert len(changes) == 2, changes
+    print(tRecover)
+    print("bytes per recovery: {0:.0f}".format(nBytes / N_RESETS))
+    kinds = dict()
+    for line in board.lines:
+        kind = line.split()[0].decode()
+        kinds[kind] = kinds.get(kind, 0) + 1
+    print("commands of the last recovery:", kinds)
+    platform.serialCom.read_task.cancel()
+    platform.serialCom.writer.close()
+    await asyncio.sleep(0.01)
+    board.stop()
+
+
+if __name__ == '__main__':
+    # The platform logs each reset as an error
+    logging.disable(logging.ERROR)
+    asyncio.run(run())
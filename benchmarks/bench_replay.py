@@ -0,0 +1,94 @@
+"""
+Replay the received side of a serial recording (`record_file:`) through
+`_parse_msg()` and the platform callbacks (`receive_se`, `receive_sw`,
+`receive_i2c`), as a repeatable load test built from a real game.
+The I2C requests are not replayed, so their replies are counted as
+unexpected.
+
+By default the chunks are fed as fast as possible, with one pass of the
+event loop after each (as when reading from the port). `--realtime` keeps
+the original timing. Commands the platform sends in response are counted
+and dropped.
+
+    $ python3 benchmarks/bench_replay.py recording.bin [--realtime]
+"""
+import sys
+import time
+import logging
+import asyncio
+import argparse
+from fantastic_platform.fantastic_recorder import FanTasTicRecorder, \
+    read_recording
+from fake_platform import make_platform, attach_null_comm
+
+
+def load(path):
+    """ Returns the received chunks as (time [s], data), bytes sent """
+    chunks = list()
+    nTx = 0
+    for t, direction, data in read_recording(path):
+        if direction == FanTasTicRecorder.RX:
+            chunks.append((t / 1e9, data))
+        else:
+            nTx += len(data)
+    return chunks, nTx
+
+
+async def replay(chunks, realtime):
+    loop = asyncio.get_event_loop()
+    platform = make_platform(loop, {"latency_stats": True})
+    # Not a warning per unexpected I2C reply
+    platform.log.setLevel(logging.ERROR)
+    board = platform.boards[0]
+    comm = attach_null_comm(platform)
+    nEvents = 0
+
+    def count(num, state):
+        nonlocal nEvents
+        nEvents += 1
+    platform.machine.switch_controller.handler = count
+
+    tCpu = time.process_time()
+    tStart = loop.time()
+    tFirst = chunks[0][0] if chunks else 0.0
+    for t, data in chunks:
+        if realtime:
+            await asyncio.sleep(tStart + t - tFirst - loop.time())
+        comm._parse_msg(data)
+        await asyncio.sleep(0)
+    tWall = loop.time() - tStart
+    tCpu = time.process_time() - tCpu
+    board.i2c.cancel_all()
+    return platform, comm, nEvents, tWall, tCpu
+
+
+async def run(args):
+    chunks, nTx = load(args.path)
+    nBytes = sum(len(data) for _, data in chunks)
+    duration = chunks[-1][0] - chunks[0][0] if chunks else 0.0
+    print("{0}: {1} chunks, {2} bytes received in {3:.1f} s".format(
+        args.path, len(chunks), nBytes, duration
+    ))
+    platform, comm, nEvents, tWall, tCpu = await replay(
+        chunks, args.realtime
+    )
+    print("replayed in {0:.3f} s ({1:.3f} s CPU), {2:.1f} us CPU per chunk, "
+          "{3} switch events".format(
+              tWall, tCpu, tCpu / max(len(chunks), 1) * 1e6, nEvents
+          ))
+    print("bytes sent: {0} recorded, {1} replayed".format(
+        nTx, comm.writer.nBytes
+    ))
+    print("I2C replies: {0}".format(
+        platform.boards[0].i2c.get_stats()["stale_replies"]
+    ))
+    print(platform.latency)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("path", help="file written with `record_file:`")
+    parser.add_argument(
+        "--realtime", action="store_true", help="keep the original timing"
+    )
+    asyncio.run(run(parser.parse_args(sys.argv[1:])))
@@ -0,0 +1,143 @@
+"""
+Coil reaction time to a switch edge, with quick-fire rules executed on the
+board versus a software rule on the host (SE: message -> MPF -> OUT).
+
+The board is a SimBoard (sim_board.py), which executes `RUL`, `RULE` and
+`OUT` like the firmware and reports switch edges once per scan period.
+The rules are written by the real platform, here for a flipper with EOS
+switch (set_pulse_on_hit_and_release_and_disable_rule). Then the hold
+and release of set_pulse_on_hit_and_enable_and_release_rule are checked
+on the outputs of the board.
+
+    $ python3 benchmarks/bench_rule_latency.py
+"""
+import time
+import asyncio
+import serial_asyncio
+from collections import namedtuple
+from mpf.core.platform import SwitchSettings, DriverSettings
+from fantastic_platform.fantastic_serial_communicator import \
+    FanTasTicSerialCommunicator
+from fantastic_platform.fantastic_histogram import FanTasTicHistogram
+from fake_platform import make_platform
+from sim_board import SimBoard
+
+N_TRIALS = 200
+SW_FLIPPER = 0x18
+SW_EOS = 0x19
+COIL = 5
+HwSwitch = namedtuple("HwSwitch", "number board hwIndex")
+HwDriver = namedtuple(
+    "HwDriver", "number board hwIndex tPulse pwmHigh pwmLow"
+)
+
+
+def switch_edge(board, sw, state):
+    """ Switch changes on the board, returns when """
+    t = time.perf_counter()
+    board.set_switch(sw, state)
+    return t
+
+
+async def measure(board, name):
+    """ Press and release the flipper button N_TRIALS times """
+    hist = FanTasTicHistogram(name, "us")
+    hostBytes = 0
+    for _ in range(N_TRIALS):
+        del board.coilEvents[:]
+        nBytes = board.nBytes
+        tEdge = switch_edge(board, SW_FLIPPER, False)
+        for _ in range(100):
+            await asyncio.sleep(0.001)
+            if board.coilEvents:
+                break
+        assert board.coilEvents, "coil did not react"
+        tCoil, out, pwmHigh, tPulse, source = board.coilEvents[0]
+        assert out == COIL and pwmHigh > 0
+        hist.record(int((tCoil - tEdge) * 1e6))
+        hostBytes += board.nBytes - nBytes
+        board.set_switch(SW_FLIPPER, True)
+        # Past the trigger hold-off of the rule (25 ms)
+        await asyncio.sleep(0.03)
+    print(hist)
+    print("  bytes sent by the host per trial: {0:.1f}".format(
+        hostBytes / N_TRIALS
+    ))
+
+
+async def run():
+    loop = asyncio.get_event_loop()
+    board = SimBoard()
+    board.start()
+    # Switches open, edges reported without the platform's `SWE 1`
+    board.set_switch(SW_FLIPPER, True)
+    board.set_switch(SW_EOS, True)
+    board.reportSwitches = True
+    platform = make_platform(loop)
+    comm = FanTasTicSerialCommunicator(
+        platform, board.port, {b"SE": platform.receive_se}
+    )
+    comm.reader, comm.writer = await serial_asyncio.open_serial_connection(
+        url=board.port, baudrate=115200
+    )
+    platform.boards[0].serialCom = comm
+    readTask = loop.create_task(comm._socket_reader())
+
+    flipper = SwitchSettings(
+        HwSwitch(SW_FLIPPER, 0, SW_FLIPPER), False, False
+    )
+    eos = SwitchSettings(HwSwitch(SW_EOS, 0, SW_EOS), False, False)
+    coil = DriverSettings(
+        HwDriver(COIL, 0, COIL, 30, 4000, 0), None, None, None
+    )
+
+    # Hardware rules: the host only gets notified
+    platform.set_pulse_on_hit_and_release_and_disable_rule(
+        flipper, eos, coil, None
+    )
+    await asyncio.sleep(0.05)
+    print("rules on the board:", sorted(board.rules.values()))
+    await measure(board, "quick-fire rule")
+    # The EOS switch and the release cut the pulse on the board
+    del board.coilEvents[:]
+    board.set_switch(SW_FLIPPER, False)
+    board.set_switch(SW_EOS, False)
+    assert board.output(COIL) == 0, "EOS did not cut the pulse"
+    board.set_switch(SW_FLIPPER, True)
+    board.set_switch(SW_EOS, True)
+    print("press, EOS, release:", [e[1:] for e in board.coilEvents])
+    platform.clear_hw_rule(flipper, coil)
+    platform.clear_hw_rule(eos, coil)
+
+    # Pulse, then hold until the release
+    holdCoil = DriverSettings(
+        HwDriver(COIL, 0, COIL, 30, 4000, 1000), None, None, None
+    )
+    platform.set_pulse_on_hit_and_enable_and_release_rule(flipper, holdCoil)
+    await asyncio.sleep(0.05)
+    tEdge = switch_edge(board, SW_FLIPPER, False)
+    pulse = board.output(COIL, tEdge + 0.01)
+    hold = board.output(COIL, tEdge + 0.05)
+    board.set_switch(SW_FLIPPER, True)
+    released = board.output(COIL)
+    print("pulse, hold, release:", (pulse, hold, released))
+    assert (pulse, hold, released) == (4000, 1000, 0)
+    platform.clear_hw_rule(flipper, holdCoil)
+
+    # Software rule: the host reacts to SE: with an OUT command
+
+    def swRule(num, state):
+        if num == SW_FLIPPER and state == 0:
+            comm.send("OUT {0} 0 30 4000\n".format(COIL))
+    platform.machine.switch_controller.handler = swRule
+    await asyncio.sleep(0.05)
+    await measure(board, "software rule")
+
+    readTask.cancel()
+    comm.writer.close()
+    await asyncio.sleep(0.01)
+    board.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
@@ -0,0 +1,80 @@
+"""
+Throughput of FanTasTicSerialCommunicator._parse_msg() for bursts of
+thousands of `SE:` lines, compared with the previous framer which
+re-partitioned the whole rx buffer for every line.
+
+The communicator reads up to RX_READ_LEN (4096) bytes at a time, it used
+to read 128. Compare the legacy framer at 128 with the framer at 4096.
+
+    $ python3 benchmarks/bench_rx_framer.py
+"""
+import time
+import asyncio
+from fantastic_platform.fantastic_serial_communicator import \
+    FanTasTicSerialCommunicator
+from fake_platform import FakePlatform
+
+N_LINES = (1000, 4000, 16000)
+# bytes per _parse_msg() call, None: all
+READ_SIZES = (128, FanTasTicSerialCommunicator.RX_READ_LEN, None)
+LINE = b"SE:0f8=1 0fa=0 \n"
+
+
+class LegacyCommunicator(FanTasTicSerialCommunicator):
+    """ rx framing as before: bytearray.partition() for every line """
+    def _addToRxBuffer(self, msg, sep='\n'):
+        self._legacyBuffer.extend(msg)
+        while True:
+            fullBuff, part, remaindBuff = self._legacyBuffer.partition(b'\n')
+            if part != b'\n':   # Found not even one complete message
+                break
+            self._legacyBuffer = remaindBuff
+            yield fullBuff
+
+    def _parse_msg(self, msg):
+        for completeMsg in self._addToRxBuffer(msg):
+            if completeMsg[2:3] != b':':
+                self._legacyBuffer.clear()
+                return
+            cmd = bytes(completeMsg[0:2])
+            payload = completeMsg[3:]
+            if cmd in self._serialCommands:
+                self._serialCommands[cmd](payload)
+
+
+def run(commClass, nLines, readSize):
+    loop = asyncio.new_event_loop()
+    nMsgs = [0]
+
+    def receive_se(payload):
+        nMsgs[0] += 1
+
+    comm = commClass(FakePlatform(loop), "bench", {b'SE': receive_se})
+    comm._legacyBuffer = bytearray()
+    burst = LINE * nLines
+    readSize = readSize or len(burst)
+    chunks = [burst[i:i + readSize] for i in range(0, len(burst), readSize)]
+    t = time.perf_counter()
+    for chunk in chunks:
+        comm._parse_msg(chunk)
+    t = time.perf_counter() - t
+    loop.close()
+    assert nMsgs[0] == nLines
+    return t
+
+
+def main():
+    print("{0:>7s} {1:>6s} {2:>14s} {3:>14s}".format(
+        "lines", "read", "legacy [ms]", "framer [ms]"
+    ))
+    for nLines in N_LINES:
+        for readSize in READ_SIZES:
+            tLegacy = run(LegacyCommunicator, nLines, readSize)
+            tFramer = run(FanTasTicSerialCommunicator, nLines, readSize)
+            print("{0:7d} {1:>6s} {2:14.2f} {3:14.2f}".format(
+                nLines, str(readSize or "all"), tLegacy * 1e3, tFramer * 1e3
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Switch event throughput: the simulated board (sim_board.py) toggles random
+switches at increasing rates, the platform receives the `SE:` reports and
+hands every edge to the switch controller.
+
+Reports the edges received per second, the CPU time of the event loop
+thread per edge and the `SE:` batch statistics of the platform.
+
+    $ python3 benchmarks/bench_se_storm.py
+"""
+import time
+import asyncio
+from fake_platform import make_platform
+from sim_board import SimBoard
+
+RATES = (1000, 10000, 50000)    # [edges / s]
+DURATION = 2.0
+
+
+async def measure(rate):
+    loop = asyncio.get_event_loop()
+    board = SimBoard()
+    board.start()
+    platform = make_platform(loop, {"port": board.port})
+    await platform.initialize()
+    await platform.get_hw_switch_states()
+    await asyncio.sleep(0.01)
+    nEdges = 0
+
+    def count(num, state):
+        nonlocal nEdges
+        nEdges += 1
+    platform.machine.switch_controller.handler = count
+    platform.seBatchSize.reset()
+    platform.seBatchLatency.reset()
+    tCpu = time.thread_time()
+    board.start_storm(rate, duration=DURATION, seed=rate)
+    await asyncio.sleep(DURATION + 0.05)
+    tCpu = time.thread_time() - tCpu
+    print("{0:6d} edges / s: {1:6d} of {2:6d} received, "
+          "{3:.1f} us CPU per edge".format(
+              rate, nEdges, board.nSwitchEvents,
+              tCpu / max(nEdges, 1) * 1e6
+          ))
+    print("  " + str(platform.seBatchSize))
+    print("  " + str(platform.seBatchLatency))
+    platform.stop()
+    await asyncio.sleep(0.01)
+    board.stop()
+
+
+async def run():
+    for rate in RATES:
+        await measure(rate)
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
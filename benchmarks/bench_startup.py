@@ -0,0 +1,68 @@
+"""
+Start-up time of the platform on a fully populated machine: initialize(),
+configure all switches, get_hw_switch_states(). With the staged
+configuration, which is pushed to the board in one burst, and without
+(every switch writes its own DEB / HI commands).
+
+The board is a pty stand-in which answers `*IDN?` and `SW?`. On a real
+board each write costs at least one 1 ms USB frame.
+
+    $ python3 benchmarks/bench_startup.py
+"""
+import asyncio
+from mpf.core.platform import SwitchConfig
+from fake_platform import make_platform
+from pty_board import ReplyBoard
+
+N_RUNS = 5
+SWITCHES = [i for i in range(0x140) if i not in range(0x40, 0x47)]
+
+
+async def run(staged):
+    loop = asyncio.get_event_loop()
+    board = ReplyBoard()
+    board.start()
+    platform = make_platform(loop, {"port": board.port})
+    t = loop.time()
+    await platform.initialize()
+    # Count the write syscalls from here on
+    serial = platform.serialCom.writer.transport.serial
+    serialWrite = serial.write
+    nWrites = [0]
+
+    def countingWrite(data):
+        nWrites[0] += 1
+        return serialWrite(data)
+    serial.write = countingWrite
+    if not staged:
+        platform.serialCom.uncork()
+    nReads = board.nReads
+    for i, number in enumerate(SWITCHES):
+        platform.configure_switch(
+            str(number), SwitchConfig(invert=False, debounce=i % 2), {}
+        )
+        # MPF awaits between the devices it configures
+        await asyncio.sleep(0)
+    await platform.get_hw_switch_states()
+    t = loop.time() - t
+    nReads = board.nReads - nReads
+    platform.serialCom.read_task.cancel()
+    platform.serialCom.writer.close()
+    await asyncio.sleep(0.01)
+    board.stop()
+    return t, nWrites[0], nReads
+
+
+def main():
+    print("{0} switches, best of {1} runs".format(len(SWITCHES), N_RUNS))
+    for staged in (False, True):
+        results = [asyncio.run(run(staged)) for _ in range(N_RUNS)]
+        t, nWrites, nReads = min(results)
+        print(
+            "staged={0!s:5}: {1:6.1f} ms, {2:4d} write syscalls, "
+            "{3:4d} board reads".format(staged, t * 1e3, nWrites, nReads)
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+Micro benchmarks of all hot paths of the platform, with JSON output and a
+comparison mode to catch regressions between two commits.
+
+The platform runs on the FakeMachine of fake_platform.py, with a
+communicator that is not connected, so only the host side is measured.
+Each case is timed in several rounds. `min` (ns per operation, the best
+round) is compared, as it is the least noisy.
+
+    $ python3 benchmarks/bench_suite.py --json base.json
+    $ git checkout <other commit>
+    $ python3 benchmarks/bench_suite.py --json new.json --compare base.json
+
+`--compare base.json new.json` compares two saved runs without running
+the suite. The exit code is 1 if a case got slower by more than
+`--threshold` percent.
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform as pyPlatform
+import subprocess
+import numpy
+from mpf.core.platform import SwitchConfig, DriverConfig, SwitchSettings, \
+    DriverSettings
+from mpf.platforms.interfaces.driver_platform_interface import \
+    PulseSettings
+from fake_platform import make_platform, attach_null_comm
+
+N_SE_EVENTS = 64
+N_LIGHTS = 384
+LIGHT_FANOUT = 8
+CASES = dict()
+
+
+def case(unit):
+    """ Register a benchmark. It returns the operation to time """
+    def register(setup):
+        CASES[setup.__name__] = (setup, unit)
+        return setup
+    return register
+
+
+def new_platform(config=None):
+    loop = asyncio.new_event_loop()
+    platform = make_platform(loop, config)
+    comm = attach_null_comm(platform)
+    return platform, comm
+
+
+@case("4 kB chunk")
+def parse_msg_burst():
+    """ _parse_msg() / _addToRxBuffer() on a burst of lines """
+    platform, comm = new_platform()
+    comm._serialCommands[b"SE"] = lambda payload: None
+    comm._serialCommands[b"I2"] = lambda payload: None
+    lines = b"SE:0f8=1 0fa=0 \n" * 7 + b"I2: 1, 00, ABCD\n"
+    burst = (lines * (4096 // len(lines) + 1))[:4096]
+    return lambda: comm._parse_msg(burst)
+
+
+@case("SE: message")
+def receive_se_batch():
+    """ receive_se() with N_SE_EVENTS switch changes """
+    platform, comm = new_platform()
+    payload = "".join(
+        "{0:03x}={1:d} ".format(i * 5, i & 1) for i in range(N_SE_EVENTS)
+    ).encode()
+    view = memoryview(payload)
+    return lambda: platform.receive_se(view)
+
+
+@case("SW: message")
+def receive_sw_full():
+    """ receive_sw() with the states of all 0x140 switches """
+    platform, comm = new_platform()
+    payload = memoryview(("5a5aa5a5" * 10).encode())
+    return lambda: platform.receive_sw(payload)
+
+
+@case("frame")
+def update_leds_3x1024():
+    """ update_leds() with all LEDs of 3 channels changed """
+    platform, comm = new_platform({"led_gamma": 2.2})
+    platform.flag_led_tick_registered = True
+    for ch in range(3):
+        platform.configure_light("0, {0}-1023".format(ch), None, {})
+    ramps = [
+        numpy.arange(1024 * 3, dtype=numpy.uint8).reshape(-1, 3) + i
+        for i in range(2)
+    ]
+    state = [0]
+
+    def op():
+        state[0] ^= 1
+        for ch in range(3):
+            platform.set_leds_brightness(ch, slice(0, 1024), ramps[state[0]])
+        platform.update_leds()
+        comm.flush()
+    return op
+
+
+@case("{0} lights x {1} LEDs".format(N_LIGHTS, LIGHT_FANOUT))
+def light_set_brightness():
+    """ FanTasTicLight.set_brightness() of lights driving several LEDs """
+    platform, comm = new_platform()
+    platform.flag_led_tick_registered = True
+    lights = list()
+    for i in range(N_LIGHTS):
+        ch, first = divmod(i * LIGHT_FANOUT, 1024)
+        number = "{0}, ".format(i % 3) + ", ".join(
+            "{0}-{1}".format(ch, first + j) for j in range(LIGHT_FANOUT)
+        )
+        lights.append(platform.configure_light(number, None, {}))
+    state = [0.0]
+
+    def op():
+        state[0] = 1.0 - state[0]
+        for light in lights:
+            light.set_brightness(state[0])
+    return op
+
+
+@case("64 rules on + off")
+def rule_cycle_64():
+    """ write_hw_rule() / clear_hw_rule() through all 64 rule slots """
+    platform, comm = new_platform()
+    swConfig = SwitchConfig(invert=False, debounce=True)
+    drConfig = DriverConfig(30, 1.0, 0.25, False, None, 1.0, 1.0)
+    pairs = [(
+        SwitchSettings(
+            platform.configure_switch(str(i), swConfig, {}), False, False
+        ),
+        DriverSettings(
+            platform.configure_driver(drConfig, str(i % 0x40), {}),
+            None, None, None
+        )
+    ) for i in range(platform.MAX_QUICK_RULES)]
+    comm.flush()
+
+    def op():
+        for sw, dr in pairs:
+            platform.set_pulse_on_hit_rule(sw, dr)
+        for sw, dr in pairs:
+            platform.clear_hw_rule(sw, dr)
+        comm.flush()
+    return op
+
+
+@case("pulse")
+def driver_pulse():
+    """ FanTasTicDriver.pulse(), encoding and writing the `OUT` """
+    platform, comm = new_platform()
+    driver = platform.configure_driver(
+        DriverConfig(30, 1.0, 0.25, False, None, 1.0, 1.0), "5", {}
+    )
+    settings = PulseSettings(1.0, 20)
+    return lambda: driver.pulse(settings)
+
+
+def measure(op, minTime, rounds):
+    """ Returns the ns per call of `op` of each round """
+    # Number of calls for one round of about minTime
+    n = 1
+    while True:
+        t = time.perf_counter_ns()
+        for _ in range(n):
+            op()
+        t = time.perf_counter_ns() - t
+        if t >= minTime * 1e9 / 10:
+            break
+        n *= 10
+    n = max(int(n * minTime * 1e9 / max(t, 1)), 1)
+    results = list()
+    for _ in range(rounds):
+        t = time.perf_counter_ns()
+        for _ in range(n):
+            op()
+        results.append((time.perf_counter_ns() - t) / n)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(names, minTime, rounds):
+    results = dict()
+    for name in names:
+        setup, unit = CASES[name]
+        times = sorted(measure(setup(), minTime, rounds))
+        results[name] = {
+            "unit": unit,
+            "min": times[0],
+            "median": times[len(times) // 2],
+            "max": times[-1],
+            "rounds": rounds
+        }
+        print("{0:24s} {1:12.0f} ns / {2} (median {3:.0f})".format(
+            name, times[0], unit, times[len(times) // 2]
+        ))
+    return {
+        "commit": git_commit(),
+        "python": pyPlatform.python_version(),
+        "machine": pyPlatform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results
+    }
+
+
+def compare(base, new, threshold):
+    """ Print the change of each case, returns the names of regressions """
+    print("{0:24s} {1:>12s} {2:>12s} {3:>8s}   ({4} -> {5})".format(
+        "", "base [ns]", "new [ns]", "change", base.get("commit"),
+        new.get("commit")
+    ))
+    regressions = list()
+    for name, result in new["results"].items():
+        if name not in base["results"]:
+            continue
+        tBase = base["results"][name]["min"]
+        tNew = result["min"]
+        change = (tNew - tBase) / tBase * 100
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print("{0:24s} {1:12.0f} {2:12.0f} {3:+7.1f}%{4}".format(
+            name, tBase, tNew, change, flag
+        ))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--json", help="save the results to this file")
+    parser.add_argument(
+        "--compare", nargs="+", metavar="JSON",
+        help="base results to compare with. With two files, compare them "
+             "without running the suite"
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=10.0,
+        help="slow down [%%] which counts as regression (default: 10)"
+    )
+    parser.add_argument(
+        "-k", dest="filter", default="", help="only cases containing this"
+    )
+    parser.add_argument("--time", type=float, default=0.2,
+                        help="[s] per round (default: 0.2)")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        return 1 if compare(base, new, args.threshold) else 0
+    names = [name for name in CASES if args.filter in name]
+    new = run_suite(names, args.time, args.rounds)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(new, f, indent=2)
+    if args.compare:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        print()
+        return 1 if compare(base, new, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Decoding of a full `SW:` switch state dump (0x140 switches): the previous
+struct.unpack() + bit loop compared with
+FanTasTicHardwarePlatform.decode_sw(). Also checks both give identical
+results.
+
+    $ python3 benchmarks/bench_sw_decode.py
+"""
+import random
+import struct
+import timeit
+from fantastic_platform.fantastic_hardware_platform import \
+    FanTasTicHardwarePlatform
+
+N_SWITCHES = 0x140
+N_RUNS = 2000
+
+
+def legacy_decode(payload):
+    hwBytes = bytearray.fromhex(str(payload, "ascii"))
+    hwLongs = struct.unpack(">{0}I".format(len(hwBytes) // 4), hwBytes)
+    hwBits = bytearray(len(hwLongs) * 32)
+    i = 0
+    for hwLong in hwLongs:
+        for n in range(32):
+            hwBits[i] = ((hwLong >> n) & 0x01)  # == 0
+            i += 1
+    return hwBits
+
+
+def main():
+    rng = random.Random(42)
+    payloads = [
+        memoryview(bytes(
+            "".join(rng.choice("0123456789ABCDEF") for _ in range(N_SWITCHES // 4)),
+            "ascii"
+        )) for _ in range(100)
+    ]
+    for payload in payloads:
+        hwBits, bitset = FanTasTicHardwarePlatform.decode_sw(payload)
+        assert hwBits == legacy_decode(payload)
+        assert all(((bitset >> n) & 1) == b for n, b in enumerate(hwBits))
+    payload = payloads[0]
+    tLegacy = timeit.timeit(lambda: legacy_decode(payload), number=N_RUNS)
+    tNew = timeit.timeit(
+        lambda: FanTasTicHardwarePlatform.decode_sw(payload), number=N_RUNS
+    )
+    oldBits = FanTasTicHardwarePlatform.decode_sw(payloads[0])[1]
+    newBits = oldBits ^ (1 << 0x48) ^ (1 << 0x13F)
+    tDiff = timeit.timeit(
+        lambda: list(FanTasTicHardwarePlatform.diff_switch_bits(oldBits, newBits)),
+        number=N_RUNS
+    )
+    print("{0} switches, results identical".format(N_SWITCHES))
+    print("  legacy: {0:8.2f} us".format(tLegacy / N_RUNS * 1e6))
+    print("  decode: {0:8.2f} us".format(tNew / N_RUNS * 1e6))
+    print("    diff: {0:8.2f} us (2 changed switches)".format(tDiff / N_RUNS * 1e6))
+
+
+if __name__ == '__main__':
+    main()
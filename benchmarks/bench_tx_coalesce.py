@@ -0,0 +1,78 @@
+"""
+Number of write syscalls and USB packets needed for a typical mix of
+commands issued within one event loop iteration, with and without the
+write coalescing of FanTasTicSerialCommunicator. The board is a pty
+stand-in.
+
+    $ python3 benchmarks/bench_tx_coalesce.py
+"""
+import asyncio
+import serial_asyncio
+from fantastic_platform.fantastic_serial_communicator import \
+    FanTasTicSerialCommunicator
+from fake_platform import FakePlatform
+from pty_board import PtyBoard
+
+N_ITERATIONS = 500
+USB_PACKET_LEN = 64     # full speed USB bulk endpoint
+# Commands issued within one event loop iteration
+WORKLOAD = (
+    "OUT 60 0 20 4000\n",
+    "RUL 0 24 60 25 20 4000 0 0\n",
+    "RUL 1 24 60 0 0 0 0 1\n",
+    "RULE 2 0\n",
+    "OUT 2 0\n",
+    "DEB 72 1\n",
+    "HI 72\n",
+    "I2C 0 64 0a01 0\n",
+)
+
+
+async def run(coalesce):
+    loop = asyncio.get_event_loop()
+    board = PtyBoard()
+    board.start()
+    _, writer = await serial_asyncio.open_serial_connection(
+        url=board.port, baudrate=115200
+    )
+    comm = FanTasTicSerialCommunicator(FakePlatform(loop), board.port)
+    comm.writer = writer
+    # Count write syscalls and the USB packets they turn into
+    serial = writer.transport.serial
+    serialWrite = serial.write
+    stats = {"syscalls": 0, "packets": 0}
+
+    def countingWrite(data):
+        stats["syscalls"] += 1
+        stats["packets"] += len(data) // USB_PACKET_LEN + 1
+        return serialWrite(data)
+    serial.write = countingWrite
+
+    for _ in range(N_ITERATIONS):
+        for cmd in WORKLOAD:
+            comm.send(cmd)
+            if not coalesce:
+                comm.flush()
+        await asyncio.sleep(0)
+    await writer.drain()
+    await asyncio.sleep(0.1)
+    writer.close()
+    board.stop()
+    stats["board_reads"] = board.nReads
+    stats["bytes"] = board.nBytes
+    return stats
+
+
+def main():
+    print("{0} iterations of {1} commands".format(N_ITERATIONS, len(WORKLOAD)))
+    for coalesce in (False, True):
+        stats = asyncio.run(run(coalesce))
+        print(
+            "coalesce={0!s:5s}: {syscalls:6d} write syscalls, "
+            "{packets:6d} USB packets, {board_reads:6d} board reads, "
+            "{bytes:7d} bytes".format(coalesce, **stats)
+        )
+
+
+if __name__ == '__main__':
+    main()
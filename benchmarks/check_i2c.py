@@ -0,0 +1,277 @@
+"""
+Behaviour checks of FanTasTicI2cManager: matching of the `I2:` replies to
+the requests, error flags, timeouts and retries, and the per-channel
+ordering. And of the register cache of the FanTasTicI2c devices.
+
+The manager runs on a real event loop with a communicator which records
+the `I2C` commands. TIMEOUT is shortened to keep the checks quick.
+
+    $ python3 benchmarks/check_i2c.py
+"""
+import sys
+import asyncio
+import logging
+from types import SimpleNamespace
+from fantastic_platform.fantastic_i2c import FanTasTicI2cManager, \
+    FanTasTicI2c
+
+CHECKS = list()
+
+
+def check(func):
+    CHECKS.append(func)
+    return func
+
+
+class CaptureCom:
+    """ Keeps the `I2C` commands sent to the board """
+    def __init__(self):
+        self.sent = list()
+
+    def send_bulk(self, msg, key=None, whileCorked=False):
+        self.sent.append(msg)
+
+    def take(self):
+        sent = self.sent
+        self.sent = list()
+        return sent
+
+
+def new_manager():
+    loop = asyncio.new_event_loop()
+    com = CaptureCom()
+    log = logging.getLogger("check_i2c")
+    return loop, com, FanTasTicI2cManager(loop, com, log)
+
+
+def new_device(i2c, number="1-64", autoIncrement=False):
+    """ FanTasTicI2c on the board of manager `i2c` """
+    platform = SimpleNamespace(
+        config={"i2c_auto_increment": [number] if autoIncrement else None},
+        boards=[SimpleNamespace(i2c=i2c)],
+        log=i2c.log,
+        debug_log=lambda *args: None
+    )
+    return i2c.add_device(FanTasTicI2c(number, platform))
+
+
+def wait(loop, nTimeouts):
+    loop.run_until_complete(
+        asyncio.sleep(nTimeouts * FanTasTicI2cManager.TIMEOUT)
+    )
+
+
+def failed_with(future, exc):
+    return future.done() and not future.cancelled() and \
+        isinstance(future.exception(), exc)
+
+
+@check
+def check_read_and_write():
+    loop, com, i2c = new_manager()
+    write = i2c.request(1, 0x40, b"\x00\x10", 0)
+    read = i2c.request(1, 0x40, b"\x00", 2)
+    # One request per channel on the wire
+    assert com.take() == ["I2C 1 64 0010 0\n"]
+    i2c.receive(b" 1, 00")
+    assert write.result() == b""
+    assert com.take() == ["I2C 1 64 00 2\n"]
+    i2c.receive(b" 1, 00, 10AB")
+    assert read.result() == b"\x10\xab"
+    assert i2c.get_stats()["pending"] == 0
+
+
+@check
+def check_nacked_write():
+    loop, com, i2c = new_manager()
+    write = i2c.request(1, 0x40, b"\x00\x10", 0)
+    nextReq = i2c.request(1, 0x40, b"\x01\x20", 0)
+    com.take()
+    i2c.receive(b" 1, 04")
+    assert failed_with(write, OSError)
+    # No retry, the next request goes out right away
+    assert com.take() == ["I2C 1 64 0120 0\n"]
+    assert i2c.get_stats()["errors"] == 1
+    assert not nextReq.done()
+
+
+@check
+def check_nacked_read_without_data():
+    loop, com, i2c = new_manager()
+    read = i2c.request(2, 0x50, b"\x00", 4)
+    i2c.receive(b" 2, 02")
+    # Fails at once, not after the retries
+    assert failed_with(read, OSError)
+    assert i2c.get_stats()["stale_replies"] == 0
+
+
+@check
+def check_wrong_length_is_stale():
+    loop, com, i2c = new_manager()
+    read = i2c.request(0, 0x50, b"\x00", 2)
+    i2c.receive(b" 0, 00, 01")
+    assert not read.done()
+    assert i2c.get_stats()["stale_replies"] == 1
+
+
+@check
+def check_timeout_and_retries():
+    loop, com, i2c = new_manager()
+    read = i2c.request(0, 0x50, b"\x00", 1)
+    wait(loop, FanTasTicI2cManager.RETRIES + 1.5)
+    assert failed_with(read, asyncio.TimeoutError)
+    assert len(com.take()) == FanTasTicI2cManager.RETRIES + 1
+    stats = i2c.get_stats()
+    assert stats["retries"] == FanTasTicI2cManager.RETRIES
+    assert stats["timeouts"] == 1
+
+
+@check
+def check_late_reply_not_taken_by_next_request():
+    loop, com, i2c = new_manager()
+    first = i2c.request(0, 0x50, b"\x00", 1)
+    wait(loop, FanTasTicI2cManager.RETRIES + 1.3)
+    assert failed_with(first, asyncio.TimeoutError)
+    com.take()
+    second = i2c.request(0, 0x50, b"\x01", 1)
+    # The channel is drained, the request waits
+    assert com.take() == []
+    # Late reply to `first`, same length as the one `second` expects
+    i2c.receive(b" 0, 00, AA")
+    assert not second.done()
+    assert i2c.get_stats()["stale_replies"] == 1
+    wait(loop, 1)
+    assert com.take() == ["I2C 0 80 01 1\n"]
+    i2c.receive(b" 0, 00, BB")
+    assert second.result() == b"\xbb"
+
+
+@check
+def check_retried_request_answered_twice():
+    loop, com, i2c = new_manager()
+    first = i2c.request(3, 0x20, b"\x00", 1)
+    second = i2c.request(3, 0x20, b"\x01", 1)
+    wait(loop, 1.5)
+    assert com.take() == ["I2C 3 32 00 1\n"] * 2
+    # The reply to the first attempt, then to the retry
+    i2c.receive(b" 3, 00, 11")
+    assert first.result() == b"\x11"
+    i2c.receive(b" 3, 00, 11")
+    assert not second.done()
+    wait(loop, 1.5)
+    assert com.take() == ["I2C 3 32 01 1\n"]
+    i2c.receive(b" 3, 00, 22")
+    assert second.result() == b"\x22"
+
+
+@check
+def check_channels_independent():
+    loop, com, i2c = new_manager()
+    slow = i2c.request(1, 0x40, b"\x00", 1)
+    fast = i2c.request(2, 0x40, b"\x00", 1)
+    assert com.take() == ["I2C 1 64 00 1\n", "I2C 2 64 00 1\n"]
+    i2c.receive(b" 2, 00, 05")
+    assert fast.result() == b"\x05"
+    assert not slow.done()
+    # A reply on a channel without requests
+    i2c.receive(b" 0, 00, 05")
+    assert i2c.get_stats()["stale_replies"] == 1
+
+
+@check
+def check_cancelled_request_skipped():
+    loop, com, i2c = new_manager()
+    first = i2c.request(1, 0x40, b"\x00", 1)
+    second = i2c.request(1, 0x40, b"\x01", 1)
+    third = i2c.request(1, 0x40, b"\x02", 1)
+    second.cancel()
+    com.take()
+    i2c.receive(b" 1, 00, 01")
+    assert first.result() == b"\x01"
+    assert com.take() == ["I2C 1 64 02 1\n"]
+    assert not third.done()
+
+
+@check
+def check_failed_write_is_sent_again():
+    loop, com, i2c = new_manager()
+    device = new_device(i2c)
+    device.i2c_write8(0x10, 0x55)
+    i2c.flush()
+    assert com.take() == ["I2C 1 64 1055 0\n"]
+    i2c.receive(b" 1, 04")
+    loop.run_until_complete(asyncio.sleep(0))
+    # The NACKed value is not taken for the register value
+    device.i2c_write8(0x10, 0x55)
+    i2c.flush()
+    assert com.take() == ["I2C 1 64 1055 0\n"]
+    i2c.receive(b" 1, 00")
+    loop.run_until_complete(asyncio.sleep(0))
+    device.i2c_write8(0x10, 0x55)
+    i2c.flush()
+    assert com.take() == []
+
+
+@check
+def check_block_write_past_last_register():
+    loop, com, i2c = new_manager()
+    device = new_device(i2c)
+    try:
+        device.i2c_write_block(0xFC, bytes(8))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Write past 0xFF did not raise ValueError")
+    assert len(device.regCache) == 256
+    assert device.pending == []
+    device.i2c_write_block(0xFC, b"\x01\x02\x03\x04")
+    i2c.flush()
+    assert com.take() == ["I2C 1 64 fc01020304 0\n"]
+
+
+@check
+def check_register_written_twice_in_one_frame():
+    loop, com, i2c = new_manager()
+    # A servo sweep: the last value of the frame goes out, once
+    device = new_device(i2c, autoIncrement=True)
+    for value in (10, 20, 30):
+        device.i2c_write8(0x06, value)
+    device.i2c_write8(0x07, 1)
+    assert device.pending == [[0x06, bytearray((30, 1))]]
+    i2c.flush()
+    assert com.take() == ["I2C 1 64 061e01 0\n"]
+    # Without auto-increment, one transaction per register
+    loop, com, i2c = new_manager()
+    device = new_device(i2c)
+    for value in (10, 20, 30):
+        device.i2c_write8(0x06, value)
+    device.i2c_write8(0x07, 1)
+    assert device.pending == [
+        [0x06, bytearray((30,))], [0x07, bytearray((1,))]
+    ]
+    # A block over staged and new registers
+    device.i2c_write_block(0x05, b"\x05\x06\x07\x08")
+    assert device.pending == [
+        [0x06, bytearray((6,))], [0x07, bytearray((7,))],
+        [0x05, bytearray((5,))], [0x08, bytearray((8,))]
+    ], device.pending
+    assert i2c.get_stats()["writes_suppressed"] == 4
+
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    FanTasTicI2cManager.TIMEOUT = 0.05
+    failed = 0
+    for func in CHECKS:
+        try:
+            func()
+        except AssertionError as e:
+            failed += 1
+            print("FAIL {0}: {1}".format(func.__name__, e))
+        else:
+            print("ok   {0}".format(func.__name__))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
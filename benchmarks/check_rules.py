@@ -0,0 +1,276 @@
+"""
+Behaviour checks of the quick-fire rule transactions: the commands
+FanTasTicRuleSlots.commit() emits for slot changes and shared rules, and
+the nesting and rollback of the platform's rule transactions.
+
+The platform runs on the FakeMachine of fake_platform.py, with a
+communicator which records what would be written to the board.
+
+    $ python3 benchmarks/check_rules.py
+"""
+import sys
+import asyncio
+from mpf.core.platform import SwitchConfig, DriverConfig, SwitchSettings, \
+    DriverSettings
+from fantastic_platform.fantastic_rules import FanTasTicRuleSlots
+from fake_platform import make_platform, attach_null_comm, NullWriter
+
+# (hwIndexSw, hwIndexOut, trHoldOff, tPulse, pwmHigh, pwmLow, posEdge)
+RULE_A = (10, 5, 25, 30, 255, 0, 0)
+RULE_A_OFF = (10, 5, 0, 0, 0, 0, 1)
+RULE_B = (11, 6, 25, 30, 255, 0, 0)
+CHECKS = list()
+
+
+def check(func):
+    CHECKS.append(func)
+    return func
+
+
+def rul(rulId, key):
+    return "RUL {0} {1} {2} {3} {4} {5} {6} {7}\n".format(rulId, *key)
+
+
+def transaction(slots, *ops):
+    """ Run `ops` (callables taking `slots`) in one transaction """
+    slots.begin()
+    for op in ops:
+        op(slots)
+    return slots.commit()
+
+
+class CaptureWriter(NullWriter):
+    """ Keeps what is written to the board """
+    def __init__(self):
+        super().__init__()
+        self.data = b""
+
+    def write(self, data):
+        super().write(data)
+        self.data += bytes(data)
+
+    def take(self):
+        data = self.data.decode()
+        self.data = b""
+        return data
+
+
+def new_platform():
+    platform = make_platform(asyncio.new_event_loop())
+    comm = attach_null_comm(platform)
+    comm.writer = CaptureWriter()
+    swConfig = SwitchConfig(invert=False, debounce=True)
+    drConfig = DriverConfig(30, 1.0, 0.25, False, None, 1.0, 1.0)
+
+    def pair(sw, dr):
+        """ Configured switch and driver, their `DEB` / `OUT` are dropped """
+        settings = (
+            SwitchSettings(
+                platform.configure_switch(str(sw), swConfig, {}), False, False
+            ),
+            DriverSettings(
+                platform.configure_driver(drConfig, str(dr), {}),
+                None, None, None
+            )
+        )
+        comm.flush()
+        comm.writer.take()
+        return settings
+    return platform, comm, pair
+
+
+@check
+def check_new_rule():
+    slots = FanTasTicRuleSlots()
+    assert transaction(slots, lambda s: s.enable(RULE_A)) == rul(0, RULE_A)
+    # Nothing changed, nothing to send
+    assert transaction(slots) == ""
+    assert transaction(slots, lambda s: s.enable(RULE_B)) == rul(1, RULE_B)
+
+
+@check
+def check_disable_and_reenable():
+    slots = FanTasTicRuleSlots()
+    transaction(slots, lambda s: s.enable(RULE_A))
+    # The coil is reset, as it may still be held by the rule
+    assert transaction(slots, lambda s: s.clear(10, 5)) == \
+        "RULE 0 0\nOUT 5 0\n"
+    # The disabled rule stays in its slot and is re-enabled with `RULE`
+    assert transaction(slots, lambda s: s.enable(RULE_A)) == "RULE 0 1\n"
+
+
+@check
+def check_clear_only_matching_coil():
+    slots = FanTasTicRuleSlots()
+    otherCoil = (10, 7, 25, 30, 255, 0, 0)
+    transaction(
+        slots, lambda s: s.enable(RULE_A), lambda s: s.enable(otherCoil)
+    )
+    assert transaction(slots, lambda s: s.clear(10, 7)) == \
+        "RULE 1 0\nOUT 7 0\n"
+    assert slots.ruleRefCounts[0] == 1
+
+
+@check
+def check_shared_rule():
+    slots = FanTasTicRuleSlots()
+    # Two users of an identical rule share one slot
+    assert transaction(
+        slots, lambda s: s.enable(RULE_A), lambda s: s.enable(RULE_A)
+    ) == rul(0, RULE_A)
+    assert slots.ruleRefCounts[0] == 2
+    # Releasing one user: the rule stays active, no `RULE`, no `OUT`
+    assert transaction(slots, lambda s: s.disable(0)) == ""
+    # Releasing the last one disables it and resets the coil
+    assert transaction(slots, lambda s: s.disable(0)) == \
+        "RULE 0 0\nOUT 5 0\n"
+
+
+@check
+def check_shared_clear_resets_coil_once():
+    slots = FanTasTicRuleSlots()
+    transaction(
+        slots, lambda s: s.enable(RULE_A), lambda s: s.enable(RULE_A_OFF)
+    )
+    # Both rules of the switch drive coil 5, it is reset once
+    assert transaction(slots, lambda s: s.clear(10, 5)) == \
+        "RULE 0 0\nRULE 1 0\nOUT 5 0\n"
+
+
+@check
+def check_disable_enable_in_one_transaction():
+    slots = FanTasTicRuleSlots()
+    transaction(slots, lambda s: s.enable(RULE_A))
+    # Net no change: no commands, and no `OUT` cutting a held coil
+    assert transaction(
+        slots, lambda s: s.clear(10, 5), lambda s: s.enable(RULE_A)
+    ) == ""
+
+
+@check
+def check_reuse_disabled_slot_when_full():
+    slots = FanTasTicRuleSlots()
+    n = FanTasTicRuleSlots.MAX_QUICK_RULES
+    keys = [(i, 5, 25, 30, 255, 0, 0) for i in range(n)]
+    transaction(slots, *(lambda s, k=k: s.enable(k) for k in keys))
+    transaction(slots, lambda s: s.clear(3, 5))
+    # Only slot 3 is left, its disabled rule is overwritten. The coil was
+    # already reset when it was disabled
+    assert transaction(slots, lambda s: s.enable(RULE_B)) == rul(3, RULE_B)
+    try:
+        transaction(slots, lambda s: s.enable((99, 5, 25, 30, 255, 0, 0)))
+    except OverflowError:
+        pass
+    else:
+        raise AssertionError("65th rule did not raise OverflowError")
+
+
+@check
+def check_rollback():
+    slots = FanTasTicRuleSlots()
+    transaction(slots, lambda s: s.enable(RULE_A))
+    before = (
+        list(slots.configuredRules), list(slots.ruleRefCounts),
+        dict(slots.ruleSlotIndex), slots.freeRuleSlots,
+        slots.inactiveRuleSlots
+    )
+    slots.begin()
+    slots.clear(10, 5)
+    slots.enable(RULE_B)
+    slots.rollback()
+    assert before == (
+        list(slots.configuredRules), list(slots.ruleRefCounts),
+        dict(slots.ruleSlotIndex), slots.freeRuleSlots,
+        slots.inactiveRuleSlots
+    )
+    assert transaction(slots) == ""
+
+
+@check
+def check_platform_overflow_rollback():
+    platform, comm, pair = new_platform()
+    n = platform.MAX_QUICK_RULES
+    pairs = [pair(i, i % 0x40) for i in range(n)]
+    for sw, dr in pairs[:n - 1]:
+        platform.set_pulse_on_hit_rule(sw, dr)
+    comm.flush()
+    assert comm.writer.take().count("RUL ") == n - 1
+    rules = platform.boards[0].rules
+    before = (list(rules.configuredRules), list(rules.ruleRefCounts))
+    # Needs 2 slots, only 1 is free: nothing is sent, nothing changes
+    sw, dr = pairs[n - 1]
+    try:
+        platform.set_pulse_on_hit_and_release_rule(sw, dr)
+    except OverflowError:
+        pass
+    else:
+        raise AssertionError("Rule overflow did not raise OverflowError")
+    comm.flush()
+    assert comm.writer.take() == ""
+    assert platform._ruleTxDepth == 0
+    assert before == (list(rules.configuredRules), list(rules.ruleRefCounts))
+    # The free slot is still usable
+    platform.set_pulse_on_hit_rule(sw, dr)
+    comm.flush()
+    assert comm.writer.take().startswith("RUL {0} ".format(n - 1))
+
+
+@check
+def check_platform_nested_transactions():
+    platform, comm, pair = new_platform()
+    (sw1, dr1), (sw2, dr2) = pair(1, 5), pair(2, 6)
+    with platform.rule_transaction():
+        platform.set_pulse_on_hit_rule(sw1, dr1)
+        with platform.rule_transaction():
+            platform.set_pulse_on_hit_rule(sw2, dr2)
+        # The inner commit sends nothing
+        comm.flush()
+        assert comm.writer.take() == ""
+    comm.flush()
+    cmd = comm.writer.take()
+    assert cmd.startswith("RUL 0 ") and "\nRUL 1 " in cmd, cmd
+    assert cmd.count("\n") == 2
+    # A raise in a nested transaction rolls back the outer one as well
+    try:
+        with platform.rule_transaction():
+            platform.clear_hw_rule(sw1, dr1)
+            with platform.rule_transaction():
+                platform.clear_hw_rule(sw2, dr2)
+                raise RuntimeError("test")
+    except RuntimeError:
+        pass
+    comm.flush()
+    assert comm.writer.take() == ""
+    assert platform._ruleTxDepth == 0
+    assert platform.boards[0].rules.ruleRefCounts[:2] == [1, 1]
+
+
+@check
+def check_platform_clear_shared_rule():
+    platform, comm, pair = new_platform()
+    (sw, dr) = pair(1, 5)
+    platform.set_pulse_on_hit_rule(sw, dr)
+    platform.set_pulse_on_hit_rule(sw, dr)
+    comm.flush()
+    assert comm.writer.take().count("RUL ") == 1
+    # clear_hw_rule() releases all rules of the switch driving the coil
+    platform.clear_hw_rule(sw, dr)
+    comm.flush()
+    assert comm.writer.take() == "RULE 0 0\nOUT 5 0\n"
+
+
+def main():
+    failed = 0
+    for func in CHECKS:
+        try:
+            func()
+        except AssertionError as e:
+            failed += 1
+            print("FAIL {0}: {1}".format(func.__name__, e))
+        else:
+            print("ok   {0}".format(func.__name__))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
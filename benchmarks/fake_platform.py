@@ -0,0 +1,125 @@
+"""
+Just enough of an MPF machine and of FanTasTicHardwarePlatform to run
+parts of the platform outside of MPF.
+"""
+import logging
+import serial_asyncio
+
+
+class FakeClock:
+    def __init__(self, loop):
+        self.loop = loop
+
+    def get_time(self):
+        return self.loop.time()
+
+    def schedule_interval(self, callback, frequency):
+        pass
+
+    async def open_serial_connection(self, limit=None, **kwargs):
+        return await serial_asyncio.open_serial_connection(**kwargs)
+
+
+class FakeConfigValidator:
+    """ Fills in the defaults of the `fantastic:` config spec """
+    def validate_config(self, config_spec, source):
+        from fantastic_platform.fantastic_hardware_platform import \
+            FanTasTicHardwarePlatform
+        spec = FanTasTicHardwarePlatform.get_config_spec()[0]
+        config = {"console_log": "basic", "file_log": "basic"}
+        for line in spec.strip().splitlines():
+            key, val = [x.strip() for x in line.split(":", 1)]
+            if key.startswith("__"):
+                continue
+            kind, valType, default = val.split("|")
+            conv = {"int": int, "float": float, "str": str}.get(valType)
+            if key in source:
+                config[key] = source[key]
+            elif default == "None":
+                config[key] = None
+            elif kind == "list":
+                config[key] = [conv(x) for x in default.split(",")]
+            elif valType == "bool":
+                config[key] = default == "True"
+            else:
+                config[key] = conv(default)
+        return config
+
+
+class FakeSwitchController:
+    """ Calls `handler(num, state)` for each switch change """
+    def __init__(self):
+        self.handler = None
+
+    def process_switch_by_num(self, num, state, platform, logical=False,
+                              timestamp=None):
+        if self.handler:
+            self.handler(num, state)
+
+
+class FakeMachine:
+    def __init__(self, loop, config=None):
+        self.clock = FakeClock(loop)
+        self.config = {"fantastic": config or {}}
+        self.config_validator = FakeConfigValidator()
+        self.switch_controller = FakeSwitchController()
+        self.options = {"production": False}
+
+    def stop(self, reason=None):
+        raise RuntimeError(reason)
+
+
+class FakePlatform:
+    """ What FanTasTicSerialCommunicator needs from the platform """
+    def __init__(self, loop):
+        self.machine = FakeMachine(loop)
+        self.log = logging.getLogger("bench")
+        self.config = {"debug": False}
+        self.latency = None
+
+
+class NullTransport:
+    def get_write_buffer_size(self):
+        return 0
+
+
+class NullWriter:
+    """ Takes the place of the serial port, counts what is written """
+
+    def __init__(self):
+        self.transport = NullTransport()
+        self.nBytes = 0
+
+    def write(self, data):
+        self.nBytes += len(data)
+
+    def close(self):
+        pass
+
+
+def attach_null_comm(platform, board=None):
+    """
+    Give `board` (default: board 0) of a platform from make_platform() a
+    communicator which is not connected and drops everything written to it.
+    Returns the communicator.
+    """
+    from fantastic_platform.fantastic_serial_communicator import \
+        FanTasTicSerialCommunicator
+    from fantastic_platform.fantastic_i2c import FanTasTicI2cManager
+    board = board or platform.boards[0]
+    comm = FanTasTicSerialCommunicator(
+        platform, "null", platform.get_serial_callbacks(board)
+    )
+    comm.writer = NullWriter()
+    board.serialCom = comm
+    board.i2c = FanTasTicI2cManager(
+        platform.machine.clock.loop, comm, platform.log, platform.latency
+    )
+    return comm
+
+
+def make_platform(loop, config=None):
+    """ A real FanTasTicHardwarePlatform on a FakeMachine, not connected """
+    from fantastic_platform.fantastic_hardware_platform import \
+        FanTasTicHardwarePlatform
+    return FanTasTicHardwarePlatform(FakeMachine(loop, config))
@@ -0,0 +1,93 @@
+"""
+Minimal stand-in for the Fan-Tas-Tic board on a pseudo terminal.
+It counts reads and bytes arriving at the board side and hands them to
+`receive()`, which subclasses can override.
+"""
+import os
+import tty
+import threading
+
+
+class PtyBoard:
+    """ `port` can be opened like the serial port of a real board """
+
+    def __init__(self) -> None:
+        self.master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self.nReads = 0
+        self.nBytes = 0
+        self._thread = threading.Thread(target=self._reader, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        os.close(self._slave)
+        os.close(self.master)
+
+    def _reader(self):
+        while True:
+            try:
+                dat = os.read(self.master, 4096)
+            except OSError:
+                return
+            if not dat:
+                return
+            self.nReads += 1
+            self.nBytes += len(dat)
+            self.receive(dat)
+
+    def receive(self, dat):
+        """ Called from the reader thread with each chunk received """
+        pass
+
+    def write(self, dat):
+        """ Send `dat` from the board to the host """
+        os.write(self.master, dat)
+
+
+class ReplyBoard(PtyBoard):
+    """
+    Keeps the received command lines and answers the queries sent during
+    start-up: `*IDN?`, and `SW?` with the switch states in `switchBits`
+    (bit n = switch n).
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.lines = list()
+        self.switchBits = 0
+        self._rxBuf = bytearray()
+        # Binary payload bytes of an `LED` command still to be skipped
+        self._skip = 0
+
+    def receive(self, dat):
+        buf = self._rxBuf
+        buf += dat
+        while True:
+            if self._skip:
+                n = min(self._skip, len(buf))
+                del buf[:n]
+                self._skip -= n
+                if self._skip:
+                    return
+            pos = buf.find(b"\n")
+            if pos < 0:
+                return
+            line = bytes(buf[:pos])
+            del buf[:pos + 1]
+            if not line:
+                continue
+            self.lines.append(line)
+            if line.startswith(b"LED "):
+                self._skip = int(line.split()[2])
+            elif line == b"*IDN?":
+                self.write(b"ID:MB:bench\n")
+            elif line == b"SW?":
+                # 0x140 switches in 32 bit words, as big endian hex
+                words = "".join(
+                    "{0:08x}".format(self.switchBits >> i & 0xFFFFFFFF)
+                    for i in range(0, 0x140, 32)
+                )
+                self.write(b"SW:" + words.encode() + b"\n")
@@ -0,0 +1,432 @@
+"""
+Simulated Fan-Tas-Tic board on a pseudo terminal, for load tests without
+hardware. The platform connects to `SimBoard().port` like to a real board.
+
+It implements the commands the platform sends: `*IDN?`, `SW?`, `SWE`,
+`SOE`, `RUL`, `RULE`, `OUT`, `DEB`, `HI`, `LEC`, `LED` and `I2C`, runs the
+quick-fire rules on switch edges and answers invalid commands with the
+`ER:` codes of the firmware. Each output pulses at pwmHigh for tPulse [ms],
+then holds at pwmLow until a rule or `OUT` changes it, see `output()`. `linkSpeed` and `cmdCost` model the USB link
+and the time the firmware takes to parse a command, the host sees the
+resulting back pressure.
+
+Switch edges come from `set_switch()`, a script (`play()`) or a random
+storm (`start_storm()`). Edges within one scan period are reported in one
+`SE:` message, like the firmware does.
+
+Run it on its own to point a machine config at it:
+
+    $ python3 benchmarks/sim_board.py --se-rate 200
+"""
+import time
+import random
+import argparse
+import threading
+from pty_board import PtyBoard
+
+N_SWITCHES = 0x140
+N_OUTPUTS = 0x40
+MAX_QUICK_RULES = 64
+N_LED_CHANNELS = 3
+N_I2C_CHANNELS = 4
+CUSTOM_I2C_BUF_LEN = 32
+MAX_LED_BYTES = 1024 * 3
+# Error codes, see FanTasTicSerialCommunicator.errStrs
+ER_BAD_CMD = 0x0006
+ER_INVALID_ARG = 0x0007
+ER_TOO_FEW_ARGS = 0x0008
+ER_DEB_SWITCH = 0x000D
+ER_OUT_INDEX = 0x0010
+ER_RULE_ID = 0x0013
+ER_RUL_ID = 0x0014
+ER_RUL_SWITCH = 0x0015
+ER_RUL_OUT = 0x0018
+ER_LEC_CHANNEL = 0x0019
+ER_LED_BYTES = 0x001A
+ER_LED_CHANNEL = 0x001C
+ER_I2C_CHANNEL = 0x001E
+ER_I2C_RX_LEN = 0x001F
+ER_I2C_TX_LEN = 0x0020
+ER_WATCHDOG = 0x0101
+
+
+class SimBoard(PtyBoard):
+    """
+    The state of the simulated firmware. All methods can be called from any
+    thread, a lock serializes them with the command parser.
+
+        linkSpeed   bytes / s the board reads, None = as fast as possible
+        cmdCost     [s] the firmware spends per command
+        scanPeriod  [s] between two `SE:` reports
+    """
+
+    def __init__(self, linkSpeed=1e6, cmdCost=10e-6, scanPeriod=1e-3):
+        super().__init__()
+        self.linkSpeed = linkSpeed
+        self.cmdCost = cmdCost
+        self.scanPeriod = scanPeriod
+        self.lock = threading.RLock()
+        self.switchBits = 0
+        self.debounced = set()
+        self.pullups = set()
+        self.reportSwitches = False     # SWE
+        self.solenoidPower = False      # SOE
+        self.rules = dict()     # rulId: (sw, out, holdOff, tPulse, ...)
+        self.enabled = set()
+        self.ruleFired = dict()     # rulId: time it fired last
+        # PWM of each output after its pulse: the hold power, 0 = off
+        self.outputs = [0] * N_OUTPUTS
+        # PWM of the last pulse of each output and perf_counter at its end
+        self.pulsePwm = [0] * N_OUTPUTS
+        self.pulseEnd = [0.0] * N_OUTPUTS
+        # (perf_counter, out, pwm, tPulse, "rule" or "host")
+        self.coilEvents = list()
+        self.ledClocks = [3200000] * N_LED_CHANNELS
+        self.ledData = [bytearray() for _ in range(N_LED_CHANNELS)]
+        # (channel, address): 256 registers, auto-incrementing
+        self.i2cDevices = dict()
+        self.errors = list()
+        self.nCommands = 0
+        self.nSwitchEvents = 0
+        self._rxBuf = bytearray()
+        # Binary `LED` payload still to be received: (channel, bytes left)
+        self._led = None
+        self._busyUntil = 0.0
+        self._pendingSe = list()
+        self._scanner = threading.Thread(target=self._scan, daemon=True)
+        self._running = False
+        self._txLock = threading.Lock()
+        self._storm = None
+
+    # ------------------------------------------------------------------
+    #  Host -> board
+    # ------------------------------------------------------------------
+    def receive(self, dat):
+        with self.lock:
+            nCommands = self._consume(dat)
+        t = nCommands * self.cmdCost
+        if self.linkSpeed:
+            t += len(dat) / self.linkSpeed
+        self._throttle(t)
+
+    def _throttle(self, t):
+        """ Block the reader for `t` seconds, in steps of 0.5 ms """
+        now = time.perf_counter()
+        self._busyUntil = max(self._busyUntil, now) + t
+        if self._busyUntil - now > 0.5e-3:
+            time.sleep(self._busyUntil - now)
+
+    def _consume(self, dat):
+        """ Execute the complete commands, returns how many """
+        buf = self._rxBuf
+        buf += dat
+        nCommands = 0
+        while buf:
+            if self._led is not None:
+                channel, n = self._led
+                chunk = buf[:n]
+                del buf[:len(chunk)]
+                if channel is not None:
+                    self.ledData[channel] += chunk
+                n -= len(chunk)
+                self._led = (channel, n) if n else None
+                continue
+            pos = buf.find(b"\n")
+            if pos < 0:
+                break
+            line = bytes(buf[:pos]).strip()
+            del buf[:pos + 1]
+            if line:
+                nCommands += 1
+                self._command(line.split())
+        self.nCommands += nCommands
+        return nCommands
+
+    def _command(self, args):
+        handler = SimBoard.COMMANDS.get(args[0].decode(errors="replace"))
+        if handler is None:
+            self.error(ER_BAD_CMD)
+            return
+        try:
+            handler(self, [int(x, 0) for x in args[1:]]
+                    if args[0] != b"I2C" else args[1:])
+        except (ValueError, IndexError):
+            self.error(ER_INVALID_ARG)
+
+    def _idn(self, args):
+        self.write(b"ID:MB:sim\n")
+
+    def _sw(self, args):
+        # 0x140 switches in 32 bit words, as big endian hex
+        words = "".join(
+            "{0:08x}".format(self.switchBits >> i & 0xFFFFFFFF)
+            for i in range(0, N_SWITCHES, 32)
+        )
+        self.write(b"SW:" + words.encode() + b"\n")
+
+    def _swe(self, args):
+        self.reportSwitches = bool(args[0])
+
+    def _soe(self, args):
+        self.solenoidPower = bool(args[0])
+
+    def _rul(self, args):
+        if len(args) < 8:
+            return self.error(ER_TOO_FEW_ARGS)
+        rulId, sw, out = args[:3]
+        if not 0 <= rulId < MAX_QUICK_RULES:
+            return self.error(ER_RUL_ID)
+        if not 0 <= sw < N_SWITCHES:
+            return self.error(ER_RUL_SWITCH)
+        if not 0 <= out < N_OUTPUTS:
+            return self.error(ER_RUL_OUT)
+        self.rules[rulId] = tuple(args[1:8])
+        self.enabled.add(rulId)
+
+    def _rule(self, args):
+        if len(args) < 2:
+            return self.error(ER_TOO_FEW_ARGS)
+        if not 0 <= args[0] < MAX_QUICK_RULES:
+            return self.error(ER_RULE_ID)
+        if args[1] and args[0] in self.rules:
+            self.enabled.add(args[0])
+        else:
+            self.enabled.discard(args[0])
+
+    def _out(self, args):
+        if len(args) < 2:
+            return self.error(ER_TOO_FEW_ARGS)
+        out, pwmLow = args[:2]
+        if not 0 <= out < N_OUTPUTS:
+            return self.error(ER_OUT_INDEX)
+        tPulse, pwmHigh = args[2:4] if len(args) >= 4 else (0, pwmLow)
+        self._fire(out, pwmHigh, tPulse, pwmLow, "host")
+
+    def _deb(self, args):
+        if not 0 <= args[0] < N_SWITCHES:
+            return self.error(ER_DEB_SWITCH)
+        if args[1]:
+            self.debounced.add(args[0])
+        else:
+            self.debounced.discard(args[0])
+
+    def _hi(self, args):
+        self.pullups.add(args[0])
+
+    def _lec(self, args):
+        if not 0 <= args[0] < N_LED_CHANNELS:
+            return self.error(ER_LEC_CHANNEL)
+        self.ledClocks[args[0]] = args[1]
+
+    def _led_cmd(self, args):
+        if len(args) < 2:
+            return self.error(ER_TOO_FEW_ARGS)
+        channel, n = args[:2]
+        if not 0 <= n <= MAX_LED_BYTES:
+            return self.error(ER_LED_BYTES)
+        if 0 <= channel < N_LED_CHANNELS:
+            self.ledData[channel] = bytearray()
+        else:
+            # The payload is skipped all the same
+            self.error(ER_LED_CHANNEL)
+            channel = None
+        if n:
+            self._led = (channel, n)
+
+    def _i2c(self, args):
+        """ `I2C <channel> <address> <hex tx> <nRx>` """
+        if len(args) < 4:
+            return self.error(ER_TOO_FEW_ARGS)
+        channel, address, nRx = int(args[0]), int(args[1]), int(args[3])
+        tx = bytes.fromhex(args[2].decode())
+        if not 0 <= channel < N_I2C_CHANNELS:
+            return self.error(ER_I2C_CHANNEL)
+        if len(tx) > CUSTOM_I2C_BUF_LEN:
+            return self.error(ER_I2C_TX_LEN)
+        if nRx > CUSTOM_I2C_BUF_LEN:
+            return self.error(ER_I2C_RX_LEN)
+        regs = self.i2cDevices.setdefault((channel, address), bytearray(256))
+        reply = "I2: {0}, 00".format(channel)
+        if tx:
+            reg = tx[0]
+            data = tx[1:]
+            for i, value in enumerate(data):
+                regs[(reg + i) & 0xFF] = value
+            if nRx:
+                rx = bytes(regs[(reg + i) & 0xFF] for i in range(nRx))
+                reply += ", " + rx.hex().upper()
+        self.write((reply + "\n").encode())
+
+    COMMANDS = {
+        "*IDN?": _idn, "SW?": _sw, "SWE": _swe, "SOE": _soe, "RUL": _rul,
+        "RULE": _rule, "OUT": _out, "DEB": _deb, "HI": _hi, "LEC": _lec,
+        "LED": _led_cmd, "I2C": _i2c
+    }
+
+    # ------------------------------------------------------------------
+    #  Board -> host
+    # ------------------------------------------------------------------
+    def write(self, dat):
+        with self._txLock:
+            super().write(dat)
+
+    def error(self, code):
+        """ Report error `code` like the firmware: `ER:<decimal code>` """
+        self.errors.append(code)
+        self.write("ER:{0:d}\n".format(code).encode())
+
+    def reset(self):
+        """ Watchdog reset: all state is lost, the host gets told """
+        with self.lock:
+            self.rules.clear()
+            self.enabled.clear()
+            self.outputs = [0] * N_OUTPUTS
+            self.pulseEnd = [0.0] * N_OUTPUTS
+            self.reportSwitches = False
+            self.solenoidPower = False
+            self._pendingSe.clear()
+        self.error(ER_WATCHDOG)
+
+    def _fire(self, out, pwmHigh, tPulse, pwmLow, source):
+        """ Pulse `out`, then hold it at `pwmLow`. Cuts a running pulse """
+        now = time.perf_counter()
+        self.pulsePwm[out] = pwmHigh
+        self.pulseEnd[out] = now + tPulse / 1e3
+        self.outputs[out] = pwmLow
+        self.coilEvents.append((now, out, pwmHigh, tPulse, source))
+
+    def output(self, out, now=None):
+        """ PWM of `out` at perf_counter `now`: pulse, hold or 0 """
+        with self.lock:
+            if now is None:
+                now = time.perf_counter()
+            if now < self.pulseEnd[out]:
+                return self.pulsePwm[out]
+            return self.outputs[out]
+
+    def set_switch(self, sw, state):
+        """
+        A switch changes on the board: run the quick-fire rules right away,
+        report it with the next `SE:` message
+        """
+        with self.lock:
+            bit = 1 << sw
+            if bool(self.switchBits & bit) == bool(state):
+                return
+            self.switchBits ^= bit
+            now = time.perf_counter()
+            # In the order of the rule slots, like the firmware
+            for rulId in sorted(self.enabled):
+                sw_, out, holdOff, tPulse, pwmHigh, pwmLow, posEdge = \
+                    self.rules[rulId]
+                if sw_ != sw or bool(posEdge) != bool(state):
+                    continue
+                if now - self.ruleFired.get(rulId, -1e9) < holdOff / 1e3:
+                    continue
+                self.ruleFired[rulId] = now
+                self._fire(out, pwmHigh, tPulse, pwmLow, "rule")
+            if not self.reportSwitches:
+                return
+            self._pendingSe.append((sw, 1 if state else 0))
+            self.nSwitchEvents += 1
+
+    def _scan(self):
+        """ Report the switch edges of each scan period in one `SE:` """
+        while self._running:
+            time.sleep(self.scanPeriod)
+            with self.lock:
+                events = self._pendingSe
+                self._pendingSe = list()
+            if events:
+                self.write(b"SE:" + "".join(
+                    "{0:03x}={1:d} ".format(sw, state)
+                    for sw, state in events
+                ).encode() + b"\n")
+
+    def play(self, script):
+        """
+        Run a script of (delay [s], switch, state) steps, the delay is
+        relative to the previous step. Blocks until done.
+        """
+        for delay, sw, state in script:
+            if delay > 0:
+                time.sleep(delay)
+            self.set_switch(sw, state)
+
+    def start_storm(self, rate, switches=None, duration=None, seed=0):
+        """
+        Toggle random `switches` (all by default) at `rate` edges / s,
+        from a thread, until stop_storm() or `duration` [s] passed
+        """
+        self.stop_storm()
+        switches = list(switches if switches is not None else
+                        range(N_SWITCHES))
+        rng = random.Random(seed)
+        stopEvent = threading.Event()
+
+        def run():
+            interval = 1 / rate
+            tNext = time.perf_counter()
+            tEnd = tNext + duration if duration is not None else None
+            while not stopEvent.is_set():
+                now = time.perf_counter()
+                if tEnd is not None and now >= tEnd:
+                    return
+                # Catch up in bursts, sleep() is too coarse for the rate
+                while tNext <= now:
+                    sw = rng.choice(switches)
+                    self.set_switch(sw, not (self.switchBits >> sw) & 1)
+                    tNext += interval
+                time.sleep(max(tNext - time.perf_counter(), 0))
+        thread = threading.Thread(target=run, daemon=True)
+        self._storm = (thread, stopEvent)
+        thread.start()
+        return thread
+
+    def stop_storm(self):
+        if self._storm is not None:
+            thread, stopEvent = self._storm
+            stopEvent.set()
+            thread.join()
+            self._storm = None
+
+    def start(self):
+        self._running = True
+        self._scanner.start()
+        super().start()
+
+    def stop(self):
+        self.stop_storm()
+        self._running = False
+        self._scanner.join()
+        super().stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--se-rate", type=float, default=0,
+        help="random switch edges per second (default: none)"
+    )
+    parser.add_argument(
+        "--link-speed", type=float, default=1e6, help="bytes / s"
+    )
+    parser.add_argument(
+        "--cmd-cost", type=float, default=10e-6, help="[s] per command"
+    )
+    args = parser.parse_args()
+    board = SimBoard(args.link_speed, args.cmd_cost)
+    board.start()
+    print("Simulated board on {0}, Ctrl-C to stop".format(board.port))
+    try:
+        while True:
+            time.sleep(1)
+            if args.se_rate and board.reportSwitches and board._storm is None:
+                board.start_storm(args.se_rate)
+            print("{0} commands, {1} switch events, {2} coil events, "
+                  "errors: {3}".format(
+                      board.nCommands, board.nSwitchEvents,
+                      len(board.coilEvents), board.errors[-5:]
+                  ))
+    except KeyboardInterrupt:
+        board.stop()
@@ -0,0 +1,68 @@
+""" State of one Fan-Tas-Tic board, several of them can share a platform """
+import re
+import asyncio
+from fantastic_platform.fantastic_rules import FanTasTicRuleSlots
+
+# `b<board index>-<number on that board>`
+BOARD_NUMBER_REGEX = re.compile(r'^\s*b(\d+)-(.*)$', re.IGNORECASE)
+
+
+def split_board_number(number):
+    """
+    Split a device number like `b1-0x3C` into the board index (1) and the
+    number on that board (`0x3C`). Numbers without prefix are on board 0.
+    """
+    m = BOARD_NUMBER_REGEX.match(str(number))
+    if m is None:
+        return 0, str(number).strip()
+    return int(m.group(1)), m.group(2).strip()
+
+
+def parse_board_number(number):
+    """
+    Returns (board index, hwIndex) of a switch or driver number like `60`,
+    `0x3C` or `b1-0x3C`
+    """
+    board, number = split_board_number(number)
+    if number.lower().startswith("0x"):
+        return board, int(number, 16)
+    return board, int(number)
+
+
+class FanTasTicBoard:
+    """
+    Everything the platform keeps per board: the serial communicator, I2C
+    transactions, LED frames, quick-fire rule slots, switch states and the
+    shadow of the configuration, to restore it after the board was lost.
+    """
+    N_LED_CHANNELS = 3
+    __slots__ = [
+        "index", "port", "serialCom", "i2c", "ledFrames", "rules",
+        "configuredSwitches", "configuredDrivers", "hw_switch_data",
+        "hw_switch_bits", "hw_switch_gotit", "recoverTask", "tStartup",
+        "nStartupCommands"
+    ]
+
+    def __init__(self, index: int, port: str) -> None:
+        self.index = index
+        self.port = port
+        self.serialCom = None   # Serial communicator object
+        self.i2c = None         # FanTasTicI2cManager, set with serialCom
+        # FanTasTicLedFrame objects of the 3 LED channels, set by the platform
+        self.ledFrames = list()
+        self.rules = FanTasTicRuleSlots()
+        self.configuredSwitches = dict()
+        self.configuredDrivers = dict()
+        # State of _ALL_ posisble input switches as Binary bit-field
+        self.hw_switch_data = None
+        # ... and as bitset (int, bit n = switch n), for diffing resyncs
+        self.hw_switch_bits = 0
+        self.hw_switch_gotit = asyncio.Event()
+        self.recoverTask = None
+        # loop.time() when initialize() started, until the switch states
+        # are known
+        self.tStartup = None
+        self.nStartupCommands = 0
+
+    def __repr__(self):
+        return '<FanTasTic board {0} on {1}>'.format(self.index, self.port)
@@ -1,5 +1,6 @@
 from mpf.platforms.interfaces.driver_platform_interface import \
     DriverPlatformInterface, PulseSettings, HoldSettings
+from fantastic_platform.fantastic_board import parse_board_number
 
 
 class FanTasTicDriver(DriverPlatformInterface):
@@ -8,13 +9,27 @@ class FanTasTicDriver(DriverPlatformInterface):
     MAX_HW_PWM_VALUE = 4000     # Max value for HW PWM drivers
     # Channels which support high resolution hardware PWM
     HW_PWM_CHANNELS = (0x3C, 0x3D, 0x3E, 0x3F)
-    __slots__ = ["serialCom", "hwIndex", "tPulse", "pwmHigh", "pwmLow"]
+    # Max. number of encoded `OUT` commands to remember per driver
+    CMD_CACHE_SIZE = 16
+    __slots__ = [
+        "serialCom", "board", "hwIndex", "maxPwm", "tPulse", "pwmHigh",
+        "pwmLow", "holdPower", "_cmdCache"
+    ]
 
     def __init__(self, config, number, serialCom):
         super().__init__(config, number)
         self.serialCom = serialCom
-        self.hwIndex = int(number)
+        self.board, self.hwIndex = parse_board_number(number)
         # TODO sanity check the hwIndex
+        if self.hwIndex in FanTasTicDriver.HW_PWM_CHANNELS:
+            self.maxPwm = FanTasTicDriver.MAX_HW_PWM_VALUE  # Hardware PWM channel
+        else:
+            self.maxPwm = FanTasTicDriver.MAX_PWM_VALUE    # I2C BCM channel
+        # Encoded `OUT` commands by (powerOff, tOn, powerOn)
+        # Oldest entries are evicted first
+        self._cmdCache = dict()
+        # Power the driver is held at after the pulse (0: off)
+        self.holdPower = 0
         # -------------------------------------------------------------
         #  Parse default values (used to setup quickfire rules)
         # -------------------------------------------------------------
@@ -58,6 +73,29 @@ class FanTasTicDriver(DriverPlatformInterface):
 
     def setSolenoid(self, powerOff, tOn=None, powerOn=None):
         """ Send the command  OUT   : <hwIndex> <PWMlow> [tPulse] [PWMhigh] """
+        key = (powerOff, tOn, powerOn)
+        cmd = self._cmdCache.get(key)
+        if cmd is None:
+            cmd = self.encodeSolenoid(powerOff, tOn, powerOn)
+            if len(self._cmdCache) >= FanTasTicDriver.CMD_CACHE_SIZE:
+                del self._cmdCache[next(iter(self._cmdCache))]
+            self._cmdCache[key] = cmd
+        self.serialCom.send(cmd)
+        # Coil latency matters, don't wait for the end of the loop iteration
+        self.serialCom.flush()
+        self.holdPower = powerOff or 0
+
+    def get_hold_cmd(self):
+        """
+        `OUT` command restoring the held state of this driver, without the
+        pulse. None if the driver is off.
+        """
+        if self.getPwmValue(self.holdPower) <= 0:
+            return None
+        return self.encodeSolenoid(self.holdPower)
+
+    def encodeSolenoid(self, powerOff, tOn=None, powerOn=None):
+        """ Returns the encoded `OUT` command, see setSolenoid() """
         pwmOff = self.getPwmValue(powerOff)
         cmd = "OUT {:d} {:d}".format(self.hwIndex, pwmOff)
         if tOn is not None:
@@ -70,7 +108,7 @@ class FanTasTicDriver(DriverPlatformInterface):
             pwmOn = self.getPwmValue(powerOn)
             cmd += " {:d} {:d}".format(tOn, pwmOn)
         cmd += "\n"
-        self.serialCom.send(cmd)
+        return cmd.encode()
 
     def getPwmValue(self, power):
         """
@@ -80,12 +118,8 @@ class FanTasTicDriver(DriverPlatformInterface):
             power = 0
         if not (0 <= power <= 1):
             raise ValueError("PWM power level outside range", power)
-        if(self.hwIndex in FanTasTicDriver.HW_PWM_CHANNELS):
-            maxPwm = FanTasTicDriver.MAX_HW_PWM_VALUE  # Hardware PWM channel
-        else:
-            maxPwm = FanTasTicDriver.MAX_PWM_VALUE    # I2C BCM channel
         # round result up so maxPwm can be reached
-        return int(power * maxPwm + 0.5)
+        return int(power * self.maxPwm + 0.5)
 
     def get_board_name(self):
         """Return the name of the board of this driver."""
@@ -0,0 +1,90 @@
+""" Vectorized software fades for all WS2811 LED channels """
+import numpy
+from fantastic_platform.fantastic_led_frame import FanTasTicLedFrame
+
+
+class FanTasTicFadeEngine:
+    """
+    Does the software fades of every byte of every LED channel.
+
+    Instead of running one asyncio task per fading light, the start / target
+    brightness and the start / target time of each fade is kept in numpy
+    arrays (one entry per payload byte). All active fades are evaluated in
+    a single vectorized pass by `update()`, which the platform calls right
+    before it flushes the LED frames.
+    """
+    __slots__ = [
+        "frames", "startB", "targetB", "startT", "targetT", "active",
+        "nActive"
+    ]
+
+    def __init__(self, ledFrames: list) -> None:
+        n = FanTasTicLedFrame.MAX_BYTES
+        self.frames = ledFrames
+        self.startB = [numpy.zeros(n) for _ in ledFrames]
+        self.targetB = [numpy.zeros(n) for _ in ledFrames]
+        self.startT = [numpy.zeros(n) for _ in ledFrames]
+        self.targetT = [numpy.ones(n) for _ in ledFrames]
+        self.active = [numpy.zeros(n, dtype=bool) for _ in ledFrames]
+        # Number of active fades per channel
+        self.nActive = [0] * len(ledFrames)
+
+    def set_fade(self, channel, ind, startB, startT, targetB, targetT):
+        """
+        Start fading payload byte `ind` of LED `channel`.
+        Replaces any fade already running on that byte.
+        `targetT` must be > `startT`.
+        """
+        active = self.active[channel]
+        if not active[ind]:
+            active[ind] = True
+            self.nActive[channel] += 1
+        self.startB[channel][ind] = startB
+        self.targetB[channel][ind] = targetB
+        self.startT[channel][ind] = startT
+        self.targetT[channel][ind] = targetT
+
+    def cancel(self, channel, ind):
+        """ Stop fading payload byte `ind` of LED `channel` """
+        active = self.active[channel]
+        if active[ind]:
+            active[ind] = False
+            self.nActive[channel] -= 1
+
+    def cancel_leds(self, channel, ledInds):
+        """ Stop fading all colors of the LEDs at positions `ledInds` """
+        if self.nActive[channel] <= 0:
+            return
+        active = self.active[channel].reshape(FanTasTicLedFrame.MAX_LEDS, 3)
+        active[ledInds] = False
+        self.nActive[channel] = int(numpy.count_nonzero(active))
+
+    def update(self, now: float):
+        """
+        Write the current brightness of all active fades to the LED frames
+        and update their dirty length. Finished fades are removed.
+        """
+        for channel, frame in enumerate(self.frames):
+            if self.nActive[channel] <= 0:
+                continue
+            inds = numpy.flatnonzero(self.active[channel])
+            startT = self.startT[channel][inds]
+            ratio = (now - startT) / (self.targetT[channel][inds] - startT)
+            numpy.clip(ratio, 0.0, 1.0, out=ratio)
+            startB = self.startB[channel][inds]
+            vals = startB + (self.targetB[channel][inds] - startB) * ratio
+            # Same rounding as FanTasTicLight.set_brightness()
+            vals = (vals * 255).astype(numpy.uint8)
+            data = frame.data
+            changed = data[inds] != vals
+            if changed.any():
+                changedInds = inds[changed]
+                data[changedInds] = vals[changed]
+                # `inds` is sorted, the last one is the highest changed byte
+                nDirty = int(changedInds[-1]) + 1
+                if nDirty > frame.dirtyLen:
+                    frame.dirtyLen = nDirty
+            done = inds[ratio >= 1.0]
+            if done.size > 0:
+                self.active[channel][done] = False
+                self.nActive[channel] -= done.size
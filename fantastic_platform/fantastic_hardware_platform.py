@@ -11,31 +11,108 @@ Required modifications:
     fantastic:
       __valid_in__: machine
       port: single|str|None
+      boards: list|str|None
       led_clock_0: single|int|3200000
       led_clock_1: single|int|3200000
       led_clock_2: single|int|3200000
+      led_gamma: single|float|1.0
+      led_white_balance: list|float|1.0, 1.0, 1.0
+      led_brightness: single|float|1.0
+      bulk_writer_thread: single|bool|False
+      i2c_auto_increment: list|str|None
+      latency_stats: single|bool|False
+      record_file: single|str|None
+      telemetry_interval: single|float|1.0
+      telemetry_file: single|str|None
+      telemetry_event: single|bool|False
 
     pulse_power: single|int|None
     hold_power: single|int|None
+
+Several boards:
+    `boards:` lists the serial port of each board, `port:` is ignored then.
+    Device numbers on the boards after the first one are prefixed with
+    `b<board index>-`, like `b1-0x3C` (driver), `b1-1-45` (LED) or
+    `b1-0-64` (I2C). Each board has its own quick-fire rules, so a rule can
+    only connect a switch and a driver of the same board.
+
+I2C register writes:
+    Writes of an unchanged register value are dropped, the others go out
+    at the end of the frame. `i2c_auto_increment:` lists the I2C devices
+    (numbers as configured) which auto-increment the register address.
+    Their writes to consecutive registers are merged into one transaction.
+
+Bulk writer thread:
+    `bulk_writer_thread: True` writes the LED frames and I2C commands from
+    a thread, see FanTasTicBulkWriter. Control commands (coil pulses,
+    rules) then wait for the bulk write in progress, they no longer go out
+    first. It showed no measurable gain, so it is off by default.
+
+Recording:
+    `record_file:` logs all serial traffic of the board(s) with timestamps,
+    see FanTasTicRecorder. Each start writes new files, the start time is
+    added to the name: `game.bin` is recorded to `game-20260101-201500.bin`
+    (board 0) and `game-20260101-201500.b1.bin` (board 1).
+    `benchmarks/bench_replay.py` feeds the received part back through the
+    platform, as a load test built from a real game.
+
+Telemetry:
+    The commands and bytes sent and the messages received per type, the
+    error codes of the boards and the TX backlog are always counted, see
+    get_telemetry().
+    Every `telemetry_interval:` seconds they are written to
+    `telemetry_file:` in the Prometheus text format (for the node exporter
+    textfile collector) and / or posted as the MPF event
+    `fantastic_telemetry` (`telemetry_event: True`), which BCP clients and
+    the monitor can subscribe to.
 """
 
-import struct
+import os
+import re
+import time
 import asyncio
-from collections import defaultdict     # For dict of lists
+import numpy
+from functools import partial
+from contextlib import contextmanager
+from mpf.core.utility_functions import Util
 from mpf.core.platform import LightsPlatform, SwitchPlatform, DriverPlatform, \
     DriverConfig, DriverSettings, SwitchSettings, SwitchConfig, I2cPlatform
 from fantastic_platform.fantastic_serial_communicator import \
     FanTasTicSerialCommunicator
+from fantastic_platform.fantastic_writer import FanTasTicBulkWriter
 from fantastic_platform.fantastic_driver import FanTasTicDriver
 from fantastic_platform.fantastic_light import FanTasTicLight
+from fantastic_platform.fantastic_led_frame import FanTasTicLedFrame
+from fantastic_platform.fantastic_fade import FanTasTicFadeEngine
 from fantastic_platform.fantastic_switch import FanTasTicSwitch
-from fantastic_platform.fantastic_i2c import FanTasTicI2c
+from fantastic_platform.fantastic_i2c import \
+    FanTasTicI2c, FanTasTicI2cManager
+from fantastic_platform.fantastic_histogram import FanTasTicHistogram
+from fantastic_platform.fantastic_latency import FanTasTicLatency
+from fantastic_platform.fantastic_telemetry import format_prometheus
+from fantastic_platform.fantastic_board import FanTasTicBoard, \
+    split_board_number
+from fantastic_platform.fantastic_rules import FanTasTicRuleSlots
 
 
 class FanTasTicHardwarePlatform(
     SwitchPlatform, DriverPlatform, LightsPlatform, I2cPlatform
 ):
-    MAX_QUICK_RULES = 64    # must match bit_rules.h
+    MAX_QUICK_RULES = FanTasTicRuleSlots.MAX_QUICK_RULES
+    N_SWITCHES = FanTasTicSwitch.N_SWITCHES
+    # `<hex switch id>=<state>` pairs of the SE: message
+    SE_REGEX = re.compile(rb'([0-9a-fA-F]+)=([01])')
+    # Lookup of the hex switch ids as sent by the firmware
+    SW_IDS = {"{0:03x}".format(i).encode(): i for i in range(N_SWITCHES)}
+    # Reconnecting after the board was lost: timeout [s] of one attempt,
+    # pause [s] between attempts and number of attempts
+    RECONNECT_TIMEOUT = 1.0
+    RECONNECT_INTERVAL = 0.01
+    RECONNECT_RETRIES = 500
+    # Disables all quick-fire rules
+    RULES_OFF_CMD = "".join(
+        "RULE {0} 0\n".format(i) for i in range(MAX_QUICK_RULES)
+    ).encode()
 
     def __init__(self, machine) -> None:
         """ Initialize FanTasTic PCB """
@@ -55,29 +132,75 @@ class FanTasTicHardwarePlatform(
         # ----------------------------------------------------------------
         #  Global (state) variables
         # ----------------------------------------------------------------
-        self.serialCom = None  # Serial communicator object
+        # One serial connection, set of LED frames and rule slots per board
+        ports = self.config["boards"] or [self.config["port"]]
+        if self.config["bulk_writer_thread"]:
+            for port in ports:
+                if not FanTasTicBulkWriter.supports_port(port):
+                    raise AssertionError(
+                        "bulk_writer_thread: needs the device path of the "
+                        "serial port on Linux / macOS, got {0}".format(port)
+                    )
+        self.boards = [
+            FanTasTicBoard(index, port) for index, port in enumerate(ports)
+        ]
+        # Switch changes of one SE: message, reused
+        self._seBatch = list()
+        self.seBatchSize = FanTasTicHistogram("SE batch size", "events")
+        self.seBatchLatency = FanTasTicHistogram("SE batch latency", "us")
+        # Optional histograms of the serial hot paths, see FanTasTicLatency
+        self.latency = None
+        if self.config["latency_stats"]:
+            self.latency = FanTasTicLatency()
+        # Start time in the names of the `record_file:` of all boards
+        self._recordStamp = time.strftime("%Y%m%d-%H%M%S")
 
-        # State of _ALL_ posisble input switches as Binary bit-field
-        self.hw_switch_data = None
-        self.hw_switch_gotit = asyncio.Event()
-
-        # to notify an I2C object waiting on receiving data
-        self.i2c_rx_data = bytearray()
-        self.i2c_channel = None
-        self.i2c_flags = 0
-        self.i2c_gotit = asyncio.Event()
-
-        # Keep the state of the WS2811 LEDs in bytearrays
+        # Keep the state of the WS2811 LEDs in preallocated frame buffers
         # This is efficient and close to the hardware
         # as data can be dumped to serial port without conversion
-        # We got 3 channels of up to 1024 LEDs with 3 bytes
-        # These arrays start with size 0 and are extended on demand
-        self.ledByteData = [bytearray(), bytearray(), bytearray()]
+        # We got 3 channels of up to 1024 LEDs with 3 bytes per board,
+        # frame `3 * board + channel` in `ledFrames`.
+        # The used part of each frame is extended on demand.
+        # Each frame tracks the number of leading bytes which changed since
+        # the last frame was sent (index of the highest changed byte + 1).
+        # Written by FanTasTicLight.set_brightness(), reset by update_leds()
+        self.ledFrames = list()
+        for board in self.boards:
+            board.ledFrames = [
+                FanTasTicLedFrame(
+                    ch, len(self.ledFrames) + ch
+                ) for ch in range(FanTasTicBoard.N_LED_CHANNELS)
+            ]
+            self.ledFrames += board.ledFrames
+        # Gamma, white balance and global dimming, applied when sending
+        ledLut = self._build_led_lut()
+        for frame in self.ledFrames:
+            frame.set_lut(ledLut)
+        # Assemble the frame of a channel when the communicator writes it
+        self._ledFrameTakers = [
+            partial(self._take_led_frame, frame) for frame in self.ledFrames
+        ]
+        self._ledFrameBoards = [
+            board for board in self.boards for _ in board.ledFrames
+        ]
+        # Does the software fades of all LEDs, before each frame is sent
+        self.fadeEngine = FanTasTicFadeEngine(self.ledFrames)
+        # Optionally, LED frames and I2C commands are written from a thread.
+        # Then the frames are assembled in the thread, from a copy of the
+        # dirty bytes taken on the loop
+        if self.config["bulk_writer_thread"]:
+            for frame in self.ledFrames:
+                frame.enable_back_buffer()
+        # Statistics of the dirty tracking
+        self.ledFramesSent = 0
+        self.ledFramesSkipped = 0
+        self.ledFramesDeferred = 0
+        self.ledBytesSent = 0
+        self.ledBytesSkipped = 0
         self.flag_led_tick_registered = False
-        # List to store all configured rules (active and inactive) in tuple fmt
-        self.configuredRules = [None] * \
-            FanTasTicHardwarePlatform.MAX_QUICK_RULES
-        self.swNameToRuleIdDict = defaultdict(list)
+        # Nesting depth of the open rule transaction. The rule slots of each
+        # board are in `FanTasTicBoard.rules`
+        self._ruleTxDepth = 0
 
     @classmethod
     def get_config_spec(cls):
@@ -85,65 +208,270 @@ class FanTasTicHardwarePlatform(
     __valid_in__: machine
     debug:       single|bool|False
     port:        single|str|None
+    boards:      list|str|None
     led_clock_0: single|int|3200000
     led_clock_1: single|int|3200000
     led_clock_2: single|int|3200000
+    led_gamma:   single|float|1.0
+    led_white_balance: list|float|1.0, 1.0, 1.0
+    led_brightness: single|float|1.0
+    bulk_writer_thread: single|bool|False
+    i2c_auto_increment: list|str|None
+    latency_stats: single|bool|False
+    record_file: single|str|None
+    telemetry_interval: single|float|1.0
+    telemetry_file: single|str|None
+    telemetry_event: single|bool|False
     pulse_power: single|int|None
     hold_power:  single|int|None
         """, "fantastic"
 
+    @property
+    def serialCom(self):
+        """ Serial communicator of the first board """
+        return self.boards[0].serialCom
+
     async def initialize(self):
+        await asyncio.gather(
+            *(self._initialize_board(board) for board in self.boards)
+        )
+        if self.config["telemetry_file"] or self.config["telemetry_event"]:
+            self.machine.clock.schedule_interval(
+                self.export_telemetry, self.config["telemetry_interval"]
+            )
+
+    async def _initialize_board(self, board):
         # ----------------------------------------------------------------
         #  Open serial connection (baudrate is ignored by hardware)
         # ----------------------------------------------------------------
         comm = FanTasTicSerialCommunicator(
             platform=self,
-            port=self.config["port"],
-            serialCommandCallbacks={
-                b'SW': self.receive_sw,   # States of all switches
-                b'SE': self.receive_se,   # States of changed switches
-                b'I2': self.receive_i2c   # Result of I2C transaction
-            }
+            port=board.port,
+            serialCommandCallbacks=self.get_serial_callbacks(board),
+            bulkWriterThread=self.config["bulk_writer_thread"],
+            recordFile=self._get_record_file(board)
+        )
+        board.serialCom = comm
+        board.i2c = FanTasTicI2cManager(
+            self.machine.clock.loop, comm, self.log, self.latency
         )
-        self.serialCom = comm
+        board.tStartup = self.machine.clock.loop.time()
         await comm.connect()
         # ----------------------------------------------------------------
         #  Set some global firmware parameters
         # ----------------------------------------------------------------
         comm.send("SWE 0\n")
         comm.send("SOE 0\n")
-        CMD = ""
-        for rulId in range(FanTasTicHardwarePlatform.MAX_QUICK_RULES):
-            CMD += "RULE {0} 0\n".format(rulId)
-        comm.send(CMD)
+        comm.flush()
+        # ----------------------------------------------------------------
+        #  Stage the configuration (rules, LEC, DEB, HI, ...) until
+        #  get_hw_switch_states() pushes it to the board in one burst
+        # ----------------------------------------------------------------
+        board.nStartupCommands = comm.txCommands
+        comm.cork()
+        comm.send(FanTasTicHardwarePlatform.RULES_OFF_CMD)
         # ----------------------------------------------------------------
         #  Configure LED channel speeds
         # ----------------------------------------------------------------
+        CMD = self._get_lec_cmd()
+        comm.send(CMD)
+        self.debug_log(CMD)
+
+    def get_serial_callbacks(self, board):
+        """ Handlers of the messages from `board` """
+        return {
+            # States of all switches
+            b'SW': partial(self.receive_sw, board=board),
+            # States of changed switches
+            b'SE': partial(self.receive_se, board=board),
+            # Result of I2C transaction
+            b'I2': partial(self.receive_i2c, board=board)
+        }
+
+    def _get_record_file(self, board):
+        """
+        `record_file:` with the start time and, for the boards after the
+        first one, `.b<index>` before the extension
+        """
+        path = self.config["record_file"]
+        if not path:
+            return path
+        root, ext = os.path.splitext(path)
+        if board.index:
+            ext = ".b{0}{1}".format(board.index, ext)
+        return "{0}-{1}{2}".format(root, self._recordStamp, ext)
+
+    def _get_lec_cmd(self):
+        CMD = ""
         for i in range(3):
             ledKey = "led_clock_{0}".format(i)
             if ledKey in self.config:
                 tempSpeed = int(self.config[ledKey])
-                comm.send("LEC {0} {1}\n".format(i, tempSpeed))
-                self.debug_log("LEC {0} {1}\n".format(i, tempSpeed))
+                CMD += "LEC {0} {1}\n".format(i, tempSpeed)
+        return CMD
 
     def stop(self):
-        if self.serialCom:
+        for board in self.boards:
+            comm = board.serialCom
+            if not comm:
+                continue
+            board.i2c.cancel_all()
             # Disable 24 V solenoid power
-            self.serialCom.send("SOE 0\n")
+            comm.send("SOE 0\n")
             # Disable all quickfire rules
-            CMD = ""
-            for rulId in range(FanTasTicHardwarePlatform.MAX_QUICK_RULES):
-                CMD += "RULE {0} 0\n".format(rulId)
-            self.serialCom.send(CMD)
+            comm.send(FanTasTicHardwarePlatform.RULES_OFF_CMD)
             # Turn off leds
-            for channel, ledDat in enumerate(self.ledByteData):
-                if len(ledDat) > 0:
-                    msg = bytes(
-                        'LED {0} {1}\n'.format(channel, len(ledDat)), 'utf8'
-                    ) + b'\0' * len(ledDat)
-                    self.serialCom.send(msg)
+            for frame in board.ledFrames:
+                if frame.nBytes > 0:
+                    frame.clear()
+                    # Not keyed, so it is never dropped
+                    comm.send_bulk(self._ledFrameTakers[frame.index])
+            self.debug_log(
+                "TX stats board %d: %s", board.index, comm.get_tx_stats()
+            )
+            self.debug_log(
+                "I2C stats board %d: %s", board.index, board.i2c.get_stats()
+            )
             # Close serial connection
-            self.serialCom.stop()
+            comm.stop()
+        self.debug_log("LED stats: %s", self.get_led_stats())
+        self.debug_log("Switch stats: %s", self.get_switch_stats())
+        self.log_latency_stats()
+
+    def get_latency_stats(self):
+        """ Latency histograms [us] per path, empty if not enabled """
+        if self.latency is None:
+            return dict()
+        return self.latency.get_stats()
+
+    def log_latency_stats(self):
+        """ Log the latency histograms, if enabled """
+        if self.latency is not None:
+            self.info_log("Latency stats:\n%s", self.latency)
+
+    def get_telemetry(self):
+        """
+        Traffic counters, rolling byte rates and TX backlog per board index.
+        Each call adds a sample to the rolling window of the rates.
+        """
+        now = self.machine.clock.loop.time()
+        return {
+            board.index: board.serialCom.get_telemetry(now)
+            for board in self.boards if board.serialCom
+        }
+
+    def export_telemetry(self):
+        """ Write `telemetry_file:` and / or post `fantastic_telemetry` """
+        stats = self.get_telemetry()
+        path = self.config["telemetry_file"]
+        if path:
+            # Replaced in one step, a scraper never reads a partial file
+            tmpPath = path + ".tmp"
+            try:
+                with open(tmpPath, "w") as f:
+                    f.write(format_prometheus(stats))
+                os.replace(tmpPath, path)
+            except OSError as e:
+                self.log.warning("Writing %s failed: %s", path, e)
+        if self.config["telemetry_event"]:
+            for index, s in stats.items():
+                self.machine.events.post(
+                    "fantastic_telemetry",
+                    board=index,
+                    tx_commands=sum(t["commands"] for t in s["tx"].values()),
+                    tx_bytes=sum(t["bytes"] for t in s["tx"].values()),
+                    rx_messages=sum(s["rx"].values()),
+                    rx_bytes=s["rx_bytes"],
+                    errors=sum(s["errors"].values()),
+                    tx_bytes_per_s=s["tx_bytes_per_s"],
+                    rx_bytes_per_s=s["rx_bytes_per_s"],
+                    queue_control=s["queue_depth"]["control"],
+                    queue_bulk=s["queue_depth"]["bulk"],
+                    write_buffer=s["write_buffer"]
+                )
+
+    # ----------------------------------------------------------------------
+    #  Recovery after a board was lost or reset
+    # ----------------------------------------------------------------------
+    def get_shadow_cmd(self, board=None):
+        """
+        Returns the commands which bring a freshly reset board to the state
+        configured so far: LED clocks, switch settings, quick-fire rules and
+        held drivers. The solenoid power and switch reports are off.
+        """
+        if board is None:
+            board = self.boards[0]
+        CMD = "SWE 0\nSOE 0\n" + self._get_lec_cmd()
+        for switch in board.configuredSwitches.values():
+            CMD += switch.get_config_cmd()
+        CMD += board.rules.get_shadow_cmd()
+        CMD = CMD.encode()
+        for driver in board.configuredDrivers.values():
+            holdCmd = driver.get_hold_cmd()
+            if holdCmd:
+                CMD += holdCmd
+        return CMD
+
+    def connection_lost(self, comm=None):
+        """
+        Called by the serial communicator `comm` when the connection to its
+        board was lost or the board was reset.
+        """
+        board = self.boards[0]
+        for b in self.boards:
+            if b.serialCom is comm:
+                board = b
+        if board.recoverTask is not None and not board.recoverTask.done():
+            return
+        board.recoverTask = self.machine.clock.loop.create_task(
+            self._recover(board)
+        )
+        board.recoverTask.add_done_callback(Util.raise_exceptions)
+
+    async def _recover(self, board):
+        """
+        Reconnect, replay the shadow state in one burst and re-sync the
+        switches, reporting the ones which changed in the meantime.
+        The other boards keep running.
+        """
+        loop = self.machine.clock.loop
+        tStart = loop.time()
+        comm = board.serialCom
+        oldBits = board.hw_switch_bits
+        for _ in range(FanTasTicHardwarePlatform.RECONNECT_RETRIES):
+            try:
+                await asyncio.wait_for(
+                    comm.reconnect(),
+                    FanTasTicHardwarePlatform.RECONNECT_TIMEOUT
+                )
+                break
+            except (OSError, asyncio.TimeoutError):
+                await asyncio.sleep(
+                    FanTasTicHardwarePlatform.RECONNECT_INTERVAL
+                )
+        else:
+            self.machine.stop("Fan-Tas-Tic connection lost")
+            return
+        comm.cork()
+        comm.send(self.get_shadow_cmd(board))
+        board.i2c.invalidate()
+        # LED frames are sent completely with the next update
+        for frame in board.ledFrames:
+            if frame.nBytes > 0:
+                frame.dirtyLen = frame.nBytes
+                comm.send_bulk(self._ledFrameTakers[frame.index], key=frame)
+        await self._get_board_switch_states(board)
+        offset = board.index * FanTasTicHardwarePlatform.N_SWITCHES
+        batch = [
+            (offset + n, state) for n, state in
+            self.diff_switch_bits(oldBits, board.hw_switch_bits)
+        ]
+        if batch:
+            self.dispatch_switch_batch(batch, loop.time())
+        self.info_log(
+            "Board %d restored in %.1f ms, %d switches changed",
+            board.index, (loop.time() - tStart) * 1e3, len(batch)
+        )
 
     def __repr__(self):
         """String name you'd like to show up in logs and stuff when a
@@ -163,29 +491,103 @@ class FanTasTicHardwarePlatform(
         This method returns a reference to a driver's platform interface
         object which will be called to access the hardware.
         """
-        return FanTasTicDriver(config, number, self.serialCom)
+        board = self._get_board(number)
+        driver = FanTasTicDriver(config, number, board.serialCom)
+        board.configuredDrivers[driver.hwIndex] = driver
+        return driver
+
+    def _get_board(self, number):
+        """ The FanTasTicBoard a (prefixed) device number belongs to """
+        boardIndex, _ = split_board_number(number)
+        if not 0 <= boardIndex < len(self.boards):
+            raise AssertionError(
+                "{0}: there is no board {1}, check `boards:`".format(
+                    number, boardIndex
+                )
+            )
+        return self.boards[boardIndex]
 
     # ----------------------------------------------------------------------
     #  Hardware quickfire rules !!!
     # ----------------------------------------------------------------------
-    # First some helper functions ...
-    def _findFreeSpotForRules(self, nFree=1):
+    # First a helper function ...
+    def _enableRule(self, switch_obj, driver_obj, *rulParams):
         """
-        Find `nFree` consequtive `None` elements in a list
-        and return the first index
+        Make sure the rule of `switch_obj` driving `driver_obj` is active on
+        their board. Must be called in a rule transaction.
         """
-        nFound = 0
-        for i, rulTuple in enumerate(self.configuredRules):
-            if rulTuple is None:
-                nFound += 1
-            else:
-                nFound = 0
-            if nFound >= nFree:
-                return i - (nFree - 1)
-        raise OverflowError(
-            "_findFreeSpotForRules(): No free slot for quick-fire rule found!"
+        if switch_obj.board != driver_obj.board:
+            raise AssertionError(
+                "Quick-fire rule of switch {0} and driver {1}: both need to "
+                "be on the same board".format(
+                    switch_obj.number, driver_obj.number
+                )
+            )
+        self.boards[switch_obj.board].rules.enable(
+            (switch_obj.hwIndex, driver_obj.hwIndex) + rulParams
         )
 
+    # ----------------------------------------------------------------------
+    #  Rule transactions
+    # ----------------------------------------------------------------------
+    def begin_rules(self):
+        """
+        Start collecting rule changes. Nothing is sent to the hardware until
+        the outermost `commit_rules()`. Transactions can be nested and can
+        span several boards.
+        """
+        self._ruleTxDepth += 1
+        if self._ruleTxDepth > 1:
+            return
+        for board in self.boards:
+            board.rules.begin()
+
+    def rollback_rules(self):
+        """ Forget all rule changes since `begin_rules()` """
+        if self._ruleTxDepth <= 0:
+            raise RuntimeError("rollback_rules(): No rule transaction open")
+        for board in self.boards:
+            board.rules.rollback()
+        self._ruleTxDepth = 0
+
+    def commit_rules(self):
+        """
+        Close the rule transaction. The outermost commit sends the difference
+        between the rule slots before and after the transaction, in one
+        write per board. Returns the command string (of all boards).
+        """
+        if self._ruleTxDepth <= 0:
+            raise RuntimeError("commit_rules(): No rule transaction open")
+        self._ruleTxDepth -= 1
+        if self._ruleTxDepth > 0:
+            return ""
+        CMD = ""
+        for board in self.boards:
+            boardCmd = board.rules.commit()
+            if boardCmd:
+                self.info_log("Rules board {0}: {1}".format(
+                    board.index, boardCmd.replace('\n', ', ')
+                ))
+                board.serialCom.send(boardCmd)
+                CMD += boardCmd
+        return CMD
+
+    @contextmanager
+    def rule_transaction(self):
+        """
+        Context manager around `begin_rules()` / `commit_rules()`.
+        Rolls back all rule changes if anything raises (like running out of
+        rule slots), so the hardware never sees half of them.
+        """
+        self.begin_rules()
+        try:
+            yield self
+        except BaseException:
+            if self._ruleTxDepth > 0:
+                self.rollback_rules()
+            raise
+        self.commit_rules()
+
     def write_hw_rule(self, switch_obj, sw_activity, driver_obj, driver_action,
                       disable_on_release=True, drive_now=False, trHoldOff=25):
         """
@@ -216,52 +618,44 @@ class FanTasTicHardwarePlatform(
             pwmLow = 0
         else:
             pwmLow = driver_obj.pwmLow
-        hwIndexSw = switch_obj.number
-        hwIndexOut = driver_obj.number
         # `triggerHoldOff` is equivalent to the trigger-hold-off time on a
         # scope (dead time after trigger)
         # TODO: Add custom property to set triggerHoldOff in yaml
-        # Get the next free index for a quick-fire-rule slot
-        rulId = self._findFreeSpotForRules(1)
-        rulTuple = (
-            rulId,
-            hwIndexSw,
-            hwIndexOut,
-            trHoldOff,
-            tPulse,
-            pwmHigh,
-            pwmLow,
-            int(isPosEdge)
-        )
-        CMD = "RUL {0} {1} {2} {3} {4} {5} {6} {7}\n".format(*rulTuple)
-        # Remember which rules are associated with this switch-name
-        self.swNameToRuleIdDict[switch_obj.number].append(rulId)
-        # We keep the current state of all rule-slots
-        self.configuredRules[rulId] = rulTuple
-        # --------------------------------------------------
-        #  For `disable_on_release` we need to configure a
-        #  second quickfirerule, triggering on the other
-        #  edge, disabling the coil
-        # --------------------------------------------------
-        if disable_on_release:
-            rulId = self._findFreeSpotForRules(1)
-            rulTuple = (
-                rulId,
-                hwIndexSw,
-                hwIndexOut,
-                0, 0, 0, 0,
-                int(not isPosEdge)
+        with self.rule_transaction():
+            self._enableRule(
+                switch_obj,
+                driver_obj,
+                trHoldOff,
+                tPulse,
+                pwmHigh,
+                pwmLow,
+                int(isPosEdge)
             )
-            CMD += "RUL {0} {1} {2} {3} {4} {5} {6} {7}\n".format(*rulTuple)
-            self.swNameToRuleIdDict[switch_obj.number].append(rulId)
-            self.configuredRules[rulId] = rulTuple
-        self.info_log(
-            "{0} [{1}]".format(
-                CMD.replace('\n', ', '),
-                switch_obj.number
+            # --------------------------------------------------
+            #  For `disable_on_release` we need to configure a
+            #  second quickfirerule, triggering on the other
+            #  edge, disabling the coil
+            # --------------------------------------------------
+            if disable_on_release:
+                self._enableRule(
+                    switch_obj,
+                    driver_obj,
+                    0, 0, 0, 0,
+                    int(not isPosEdge)
+                )
+
+    def write_hw_off_rule(self, switch_obj, sw_activity, driver_obj):
+        """
+        Switch off `driver_obj` when `switch_obj` becomes active (1) or
+        inactive (0). Cuts a running pulse or hold.
+        """
+        with self.rule_transaction():
+            self._enableRule(
+                switch_obj,
+                driver_obj,
+                0, 0, 0, 0,
+                int(sw_activity == 1)
             )
-        )
-        self.serialCom.send(CMD)
 
     def clear_hw_rule(self, switch: SwitchSettings, coil: DriverSettings):
         """Clear a hardware switch rule for this switch.
@@ -273,28 +667,41 @@ class FanTasTicHardwarePlatform(
         This is what you'd use to disable flippers and autofire_coils during
         tilt, game over, etc.
 
+        Only the rules of this switch driving `coil` are cleared, so the main
+        and hold coil of a dual wound flipper can be cleared independently.
         """
-        sw_name = switch.hw_switch.number
-        rulIds = self.swNameToRuleIdDict.pop(sw_name)
-        # print( "clear_hw_rule:", rulIds, self.configuredRules )
-        CMD = ""
-        for rulId in rulIds:
-            rulTuple = self.configuredRules[rulId]
-            self.configuredRules[rulId] = None
-            # Disable the rule
-            CMD += "RULE {0} 0\n".format(rulId)
-            # Just in case the flipper still in hold state, reset the coil
-            CMD += "OUT {0} 0\n".format(rulTuple[2])
-        del rulIds
-        self.info_log("{0} [{1}]".format(CMD.replace('\n', ', '), sw_name))
-        self.serialCom.send(CMD)
+        hwSwitch = switch.hw_switch
+        if hwSwitch.board != coil.hw_driver.board:
+            return
+        with self.rule_transaction():
+            # Disables the rules, but keeps them around for re-enabling
+            self.boards[hwSwitch.board].rules.clear(
+                hwSwitch.hwIndex, coil.hw_driver.hwIndex
+            )
+
+    def _check_repulse(self, coil, repulse_settings):
+        # Quick-fire rules trigger on a single switch edge and can not check
+        # if the flipper button is still held when the EOS switch opens.
+        # A repulse rule would also fire when the flipper drops on release.
+        if repulse_settings and repulse_settings.enable_repulse:
+            self.warning_log(
+                "Repulse on EOS open is not supported in hardware, "
+                "ignored for %s", coil.hw_driver.number
+            )
 
     def set_pulse_on_hit_and_release_rule(
         self,
         enable_switch: SwitchSettings,
         coil: DriverSettings
     ):
-        raise NotImplementedError
+        # Second rule cancels the pulse on release
+        self.write_hw_rule(
+            enable_switch.hw_switch,
+            0,
+            coil.hw_driver,
+            "pulse",
+            disable_on_release=True
+        )
 
     def set_pulse_on_hit_and_enable_and_release_rule(
         self,
@@ -308,18 +715,47 @@ class FanTasTicHardwarePlatform(
         enable_switch: SwitchSettings,
         eos_switch: SwitchSettings,
         coil: DriverSettings,
-        repulse_settings
+        repulse_settings=None
     ):
-        raise NotImplementedError
-
+        """
+        3 quick-fire rules: pulse on hit, off on release and off when the
+        EOS switch is hit. All done by the firmware, no host round-trip.
+        """
+        self._check_repulse(coil, repulse_settings)
+        with self.rule_transaction():
+            self.write_hw_rule(
+                enable_switch.hw_switch,
+                0,
+                coil.hw_driver,
+                "pulse",
+                disable_on_release=True
+            )
+            self.write_hw_off_rule(eos_switch.hw_switch, 0, coil.hw_driver)
 
     def set_pulse_on_hit_and_enable_and_release_and_disable_rule(
         self,
         enable_switch: SwitchSettings,
         disable_switch: SwitchSettings,
-        coil: DriverSettings
+        coil: DriverSettings,
+        repulse_settings=None
     ):
-        raise NotImplementedError
+        """
+        Pulse and hold on hit, off on release.
+
+        Switching to hold power when the EOS switch is hit would need a
+        rule which only fires while the flipper button is held. Otherwise a
+        bouncing EOS switch after release could latch the coil in hold.
+        So the EOS switch is not used, the pulse time limits the full power
+        phase instead.
+        """
+        self._check_repulse(coil, repulse_settings)
+        self.write_hw_rule(
+            enable_switch.hw_switch,
+            0,
+            coil.hw_driver,
+            "hold",
+            disable_on_release=True
+        )
 
     def set_pulse_on_hit_rule(
         self,
@@ -347,83 +783,192 @@ class FanTasTicHardwarePlatform(
         This method should returns the reference to the switch's platform
         interface object which will be called to access the hardware.
         """
-        return FanTasTicSwitch(config, number, self.serialCom)
+        board = self._get_board(number)
+        switch = FanTasTicSwitch(config, number, board.serialCom)
+        board.configuredSwitches[switch.hwIndex] = switch
+        return switch
 
     async def get_hw_switch_states(self):
-        """get the state of all Switches at once"""
-        self.hw_switch_gotit.clear()
-        self.serialCom.send("SW?\n")  # Request current state of all switches
-        self.info_log("Waiting for response to `SW?` command")
-        await self.hw_switch_gotit.wait()
+        """
+        get the state of all Switches of all boards at once. Switch n of
+        board b is at index `b * N_SWITCHES + n`.
+        """
+        await asyncio.gather(
+            *(self._get_board_switch_states(board) for board in self.boards)
+        )
+        if len(self.boards) == 1:
+            return self.boards[0].hw_switch_data
+        n = FanTasTicHardwarePlatform.N_SWITCHES
+        hw_switch_data = bytearray(n * len(self.boards))
+        for board in self.boards:
+            boardData = board.hw_switch_data[:n]
+            start = board.index * n
+            hw_switch_data[start:start + len(boardData)] = boardData
+        return hw_switch_data
+
+    async def _get_board_switch_states(self, board):
+        """get the state of all Switches of one board"""
+        comm = board.serialCom
+        board.hw_switch_gotit.clear()
+        latency = self.latency
+        if latency is not None:
+            tSent = latency.now()
+        comm.send("SW?\n")  # Request current state of all switches
+        # Push the staged configuration and `SW?` in one write
+        nWrites = comm.txWrites
+        comm.uncork()
+        nWrites = comm.txWrites - nWrites
+        self.info_log(
+            "Waiting for response to `SW?` command of board %d", board.index
+        )
+        await board.hw_switch_gotit.wait()
+        if latency is not None:
+            latency.record(latency.swRoundTrip, tSent)
+        if board.tStartup is not None:
+            self.debug_log(
+                "Startup of board %d took %.1f ms, "
+                "%d config commands in %d write(s)",
+                board.index,
+                (self.machine.clock.loop.time() - board.tStartup) * 1e3,
+                comm.txCommands - board.nStartupCommands,
+                nWrites
+            )
+            board.tStartup = None
         # ----------------------------------------------------------------
         #  Engage Solenoid 24 V power relay and start reporting switches
         # ----------------------------------------------------------------
-        self.serialCom.send("SOE 1\n")
-        self.serialCom.send("SWE 1\n")
-        return self.hw_switch_data
+        comm.send("SOE 1\n")
+        comm.send("SWE 1\n")
 
-    def receive_sw(self, payload):
+    def receive_sw(self, payload, board=None):
         """Callback for the SW: command response.
         Payload contains state of all switches.
-        Parse data and set hw_switch_data to bitArray
+        Parse data and set hw_switch_data of the board to bitArray
+        """
+        # self.debug_log("Received SW: %s", payload)
+        if board is None:
+            board = self.boards[0]
+        board.hw_switch_data, board.hw_switch_bits = self.decode_sw(payload)
+        board.hw_switch_gotit.set()
+
+    @staticmethod
+    def decode_sw(payload):
+        """
+        Decode the payload of the SW: command response.
+
+        Returns a bytearray with one byte (0 / 1) per switch, as MPF expects
+        it and the same states as bitset: an int with bit n = switch n.
         """
         # msg = b"00000000123456789ABCDEF0AFFE0000DEAD0000BEEF0000 ...
         # Process Hex values in groups of 8 (little endian)
         # hwIndex[0] = 0: b"FFFFFFFE...
-        # self.debug_log("Received SW: %s", payload)
-        hwBytes = bytearray.fromhex(payload.decode())
-        hwLongs = struct.unpack(">{0}I".format(len(hwBytes) // 4), hwBytes)
-        # Now we have an array of bytes, but MPF expects an array of bits
-        # so lets go ahead with extracting them
-        hwBits = bytearray(len(hwLongs) * 32)
-        i = 0
-        for hwLong in hwLongs:
-            for n in range(32):
-                hwBits[i] = ((hwLong >> n) & 0x01)  # == 0
-                i += 1
-        self.hw_switch_data = hwBits
-        self.hw_switch_gotit.set()
-
-    def receive_se(self, payload):
+        hwBytes = bytes.fromhex(str(payload, 'ascii'))
+        nWords = len(hwBytes) // 4
+        # Swap the bytes of each 32 bit word, then bit n of the whole byte
+        # string (lsb first) is the state of switch n
+        hwBytes = numpy.frombuffer(hwBytes, dtype=">u4", count=nWords)
+        hwBytes = hwBytes.astype("<u4").view(numpy.uint8)
+        hwBits = numpy.unpackbits(hwBytes, bitorder="little")
+        return bytearray(hwBits), int.from_bytes(hwBytes.tobytes(), "little")
+
+    @staticmethod
+    def diff_switch_bits(oldBits, newBits):
+        """
+        Yields (switch number, new state) for all switches with a different
+        state in the two bitsets (as returned by decode_sw())
+        """
+        changed = oldBits ^ newBits
+        while changed:
+            lowest = changed & -changed
+            n = lowest.bit_length() - 1
+            yield n, (newBits >> n) & 1
+            changed ^= lowest
+
+    def receive_se(self, payload, board=None):
         """Callback for the SE: command response.
-            Payload contains a list of switches which have changed state
+            Payload contains a list of switches which have changed state.
+            All of them are handed to the switch controller as one batch,
+            stamped with the time the data was received.
         """
         # payload = b"0f8=1 0fa=1 0fc=0 0fe=1 "
-        for se in payload.split(b' '):
-            if len(se) <= 0:
-                continue
-            swId, swState = se.split(b'=')
-            self.machine.switch_controller.process_switch_by_num(
-                num=int(swId, 16),
-                state=int(swState),
-                platform=self
+        if board is None:
+            board = self.boards[0]
+        rxTime = board.serialCom.rxTime
+        offset = board.index * FanTasTicHardwarePlatform.N_SWITCHES
+        swIds = FanTasTicHardwarePlatform.SW_IDS
+        batch = self._seBatch
+        # Keep the bitset current, a resync after a reset diffs against it
+        bits = board.hw_switch_bits
+        for swId, swState in self.SE_REGEX.findall(payload):
+            num = swIds.get(swId)
+            if num is None:
+                num = int(swId, 16)
+            if swState == b'1':
+                bits |= 1 << num
+                batch.append((offset + num, 1))
+            else:
+                bits &= ~(1 << num)
+                batch.append((offset + num, 0))
+        board.hw_switch_bits = bits
+        latency = self.latency
+        if latency is None:
+            self.dispatch_switch_batch(batch, rxTime)
+        else:
+            # Commands sent by the switch handlers are timed from here
+            latency.tTrigger = latency.tRx
+            self.dispatch_switch_batch(batch, rxTime)
+            latency.tTrigger = None
+            latency.record(latency.swDispatch, latency.tRx)
+        self.seBatchSize.record(len(batch))
+        self.seBatchLatency.record(
+            int((self.machine.clock.loop.time() - rxTime) * 1e6)
+        )
+        batch.clear()
+
+    def dispatch_switch_batch(self, batch, timestamp):
+        """
+        Hand a batch of switch changes to the switch controller.
+
+        Args:
+            batch: list of (switch number, state) tuples
+            timestamp: when the batch was received (loop.time())
+        """
+        switchController = self.machine.switch_controller
+        for num, state in batch:
+            switchController.process_switch_by_num(
+                num=num,
+                state=state,
+                platform=self,
+                timestamp=timestamp
             )
 
+    def get_switch_stats(self):
+        """ Histograms of SE: batch sizes and receive to dispatched latency """
+        return {
+            "se_batch_size": self.seBatchSize.get_stats(),
+            "se_batch_latency_us": self.seBatchLatency.get_stats()
+        }
+
     # ----------------------------------------------------------------------
     #  I2C !!!
     # ----------------------------------------------------------------------
     async def configure_i2c(self, number: str) -> "I2cPlatformInterface":
-        ''' `number` must be in `<CHANNEL>-<I2C_ADDR[7]>` format '''
-        return FanTasTicI2c(number, self)
+        ''' `number` must be in `[b<BOARD>-]<CHANNEL>-<I2C_ADDR[7]>` format
+        '''
+        device = FanTasTicI2c(number, self)
+        # One register mirror per device
+        return device.i2c.add_device(device)
 
-    def receive_i2c(self, payload):
+    def receive_i2c(self, payload, board=None):
         """
         callback when the result of an I2C read / write operation was
         received
         payload = b' 1, 01[, ABCDEF]'
         """
-        self.debug_log("receive_i2c(): %s", payload)
-        tok = payload.split(b',')
-        self.i2c_channel = int(tok[0])
-        self.i2c_flags = int(tok[1], 16)
-        if len(tok) == 3:
-            rxHex = tok[2]
-            self.i2c_rx_data = bytearray.fromhex(rxHex.decode())
-            self.debug_log("receive_i2c(): RX %s", self.i2c_rx_data)
-            # notify the I2C object that new data has been received
-            self.i2c_gotit.set()
-        else:
-            self.i2c_rx_data = bytearray()
+        self.debug_log("receive_i2c(): %s", bytes(payload))
+        if board is None:
+            board = self.boards[0]
+        board.i2c.receive(payload)
 
     # ----------------------------------------------------------------------
     #  Lights !!!
@@ -452,6 +997,10 @@ class FanTasTicHardwarePlatform(
 
                 l_captive_t:
                     number: 1-45, 1-46
+
+            LEDs of the other boards are prefixed with the board index:
+
+                    number: b1-1-45
         """
         # **************** configure_light() ****** 1-38:1 None None
         # **************** configure_light() ****** 1-38:2 None None
@@ -463,28 +1012,151 @@ class FanTasTicHardwarePlatform(
                 1 / self.machine.config['mpf']['default_light_hw_update_hz']
             )
             self.flag_led_tick_registered = True
-        software_fade_ms = int(
-            1 / self.machine.config['mpf']['default_light_hw_update_hz'] * 1000
-        )
         # number = <colorIndex>, 1-38, 1-39
         return FanTasTicLight(
             self.machine.clock.loop,
-            software_fade_ms,
             number,
-            self.ledByteData
+            self.ledFrames,
+            self.fadeEngine
         )
 
+    def _build_led_lut(self):
+        """
+        Returns the (3, 256) lookup table applied to the LED data when it is
+        sent, or None if the config asks for no correction.
+        Index 0 is the color index (as in the light number), 1 the value.
+
+            out = 255 * (value / 255) ** led_gamma *
+                  led_white_balance[colorIndex] * led_brightness
+        """
+        gamma = self.config["led_gamma"]
+        whiteBalance = self.config["led_white_balance"]
+        brightness = self.config["led_brightness"]
+        if len(whiteBalance) != 3:
+            raise AssertionError(
+                "led_white_balance needs 3 values, one per color index"
+            )
+        if gamma == 1.0 and brightness == 1.0 and \
+                all(wb == 1.0 for wb in whiteBalance):
+            return None
+        lut = (numpy.arange(256) / 255.0) ** gamma * 255.0 * brightness
+        lut = numpy.outer(whiteBalance, lut)
+        return numpy.clip(numpy.rint(lut), 0, 255).astype(numpy.uint8)
+
+    def set_leds_brightness(self, channel, leds, brightness):
+        """
+        Set the brightness of many LEDs of one channel with a single call.
+        Writes through the numpy view of the LED frame, bypassing the
+        FanTasTicLight objects (which still work as before).
+
+        Args:
+            channel: LED channel (0 - 2), plus 3 * board index
+            leds: positions of the LEDs along the chain (0 - 1023). Either a
+                `slice`, a `range` or an integer numpy array of indices
+            brightness: numpy array of floats in the range [0.0 - 1.0].
+                Shape (n, 3) sets each color of each LED individually,
+                shape (n,) sets all colors of a LED the same and a scalar
+                sets all LEDs the same. uint8 arrays are written as is.
+        """
+        frame = self.ledFrames[channel]
+        if isinstance(leds, range):
+            leds = slice(leds.start, leds.stop, leds.step)
+        if isinstance(leds, slice):
+            ledInds = numpy.arange(*leds.indices(FanTasTicLedFrame.MAX_LEDS))
+        else:
+            ledInds = numpy.asarray(leds, dtype=numpy.intp)
+            leds = ledInds
+        if ledInds.size <= 0:
+            return
+        # numpy would count negative indices from the end of the chain
+        if int(ledInds.min()) < 0:
+            raise IndexError("Negative LED index in {0}".format(leds))
+        vals = numpy.asarray(brightness)
+        if vals.dtype != numpy.uint8:
+            # astype() would wrap out of range values, as 1.01 -> 1
+            if not (vals.min() >= 0.0 and vals.max() <= 1.0):
+                raise ValueError(
+                    "brightness must be in the range [0.0 - 1.0]"
+                )
+            # Same rounding as FanTasTicLight.set_brightness()
+            vals = (vals * 255).astype(numpy.uint8)
+        if vals.ndim == 1 and vals.shape[0] == ledInds.size:
+            vals = vals[:, numpy.newaxis]
+        vals = numpy.broadcast_to(vals, (ledInds.size, 3))
+        # Raises IndexError for LEDs beyond the end of the frame, before
+        # anything is written
+        ledView = frame.leds[leds]
+        frame.extend((int(ledInds.max()) + 1) * 3)
+        self.fadeEngine.cancel_leds(channel, leds)
+        changed = numpy.any(ledView != vals, axis=1)
+        if not changed.any():
+            return
+        frame.leds[leds] = vals
+        # Remember the highest changed byte of this channel
+        nDirty = (int(ledInds[changed].max()) + 1) * 3
+        if nDirty > frame.dirtyLen:
+            frame.dirtyLen = nDirty
+
     def update_leds(self):
         """
-        Fire the LED command to update the 3 strings of WS2811 LEDs.
-        This is done once per game loop. All LEDs must be updated at once by
-        duming the bytearray `self.ledByteData` to the hardware.
+        Fire the LED command to update the 3 strings of WS2811 LEDs of each
+        board.
+        This is done once per game loop. First the fade engine writes the
+        current brightness of all fading LEDs. Only channels which changed since
+        the last frame are sent, and only up to the highest changed byte.
+        LEDs further down the chain do not receive new data and keep their
+        current color.
         Note that inidividual adressing of LEDs is not supported.
+
+        Frames are queued as bulk data in the serial communicator. The frame
+        itself is only assembled (by _take_led_frame()) when it is written,
+        so it always carries the newest data. While a frame of a channel is
+        still queued because the link is busy, no further one is queued.
         """
-        for channel, ledDat in enumerate(self.ledByteData):
-            if len(ledDat) > 0:
-                msg = bytes(
-                    "LED {0} {1}\n".format(channel, len(ledDat)),
-                    "utf8"
-                ) + ledDat
-                self.serialCom.send(msg)
+        self.fadeEngine.update(self.machine.clock.get_time())
+        for frame, takeFrame, board in zip(
+            self.ledFrames, self._ledFrameTakers, self._ledFrameBoards
+        ):
+            nTotal = frame.nBytes
+            if nTotal <= 0:
+                continue
+            if frame.dirtyLen <= 0:
+                self.ledBytesSkipped += nTotal
+                self.ledFramesSkipped += 1
+                continue
+            # Each board has its own link, they are all written at once
+            if not board.serialCom.send_bulk(takeFrame, key=frame):
+                self.ledFramesDeferred += 1
+
+    def _take_led_frame(self, frame):
+        """
+        Returns a memoryview of the `LED` command for the dirty part of
+        `frame`, or None if nothing changed. Resets the dirty tracking.
+
+        The transport keeps a reference to the data it could not write yet.
+        The serial communicator only takes bulk data while the transport has
+        nothing buffered, so the header is never re-written while in use.
+        """
+        nDirty = frame.dirtyLen
+        if nDirty <= 0:
+            return None
+        frame.dirtyLen = 0
+        self.ledFramesSent += 1
+        self.ledBytesSent += nDirty
+        self.ledBytesSkipped += frame.nBytes - nDirty
+        if self.config["bulk_writer_thread"]:
+            # Only copy the dirty bytes here, the writer thread assembles
+            # the frame from the copy
+            frame.snapshot(nDirty)
+            return partial(frame.get_frame, nDirty)
+        return frame.get_frame(nDirty)
+
+    def get_led_stats(self):
+        """ Returns a dict with the statistics of the LED dirty tracking """
+        return {
+            "frames_sent": self.ledFramesSent,
+            "frames_skipped": self.ledFramesSkipped,
+            "frames_deferred": self.ledFramesDeferred,
+            "bytes_sent": self.ledBytesSent,
+            "bytes_skipped": self.ledBytesSkipped
+        }
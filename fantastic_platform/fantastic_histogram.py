@@ -0,0 +1,103 @@
+""" Fixed size log-linear histograms for sizes and latencies """
+
+
+class FanTasTicHistogram:
+    """
+    HDR style histogram of non-negative integers (sizes, latencies in [us]).
+
+    Values are grouped in power of 2 ranges, each of them split into
+    2**subBits linear buckets. This keeps the relative error below
+    2**-subBits over the whole range, with a small, preallocated list of
+    counters. Values above 2**maxBits go into the last bucket.
+    """
+    __slots__ = [
+        "name", "unit", "subBits", "maxIndex", "counts", "n", "total",
+        "min", "max"
+    ]
+
+    def __init__(self, name: str, unit: str = "", subBits=4, maxBits=32):
+        self.name = name
+        self.unit = unit
+        self.subBits = subBits
+        self.maxIndex = self._index(1 << maxBits)
+        self.counts = [0] * (self.maxIndex + 1)
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.n = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        """ Bucket index of `value` """
+        subBits = self.subBits
+        exponent = value.bit_length() - subBits - 1
+        if exponent <= 0:
+            return value
+        return (exponent << subBits) + (value >> exponent)
+
+    def _lowest(self, index: int) -> int:
+        """ Smallest value which goes into bucket `index` """
+        subBits = self.subBits
+        exponent = (index >> subBits) - 1
+        if exponent <= 0:
+            return index
+        subBucket = index - (exponent << subBits)
+        return subBucket << exponent
+
+    def record(self, value: int):
+        """ Add one (integer) value """
+        if value < 0:
+            value = 0
+        index = self._index(value)
+        if index > self.maxIndex:
+            index = self.maxIndex
+        self.counts[index] += 1
+        self.n += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def percentile(self, p: float) -> int:
+        """ Smallest value of the bucket holding the `p` [%] percentile """
+        if self.n <= 0:
+            return 0
+        limit = self.n * p / 100
+        acc = 0
+        for index, count in enumerate(self.counts):
+            acc += count
+            if count and acc >= limit:
+                return self._lowest(index)
+        return self.max
+
+    def get_stats(self) -> dict:
+        return {
+            "n": self.n,
+            "min": self.min or 0,
+            "mean": self.total / self.n if self.n else 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max
+        }
+
+    def get_buckets(self) -> list:
+        """ List of (lowest value, count) for all non-empty buckets """
+        return [
+            (self._lowest(index), count)
+            for index, count in enumerate(self.counts) if count
+        ]
+
+    def __str__(self):
+        stats = self.get_stats()
+        return (
+            "{0}: n={1[n]} min={1[min]} mean={1[mean]:.1f} p50={1[p50]} "
+            "p90={1[p90]} p99={1[p99]} max={1[max]} {2}".format(
+                self.name, stats, self.unit
+            )
+        )
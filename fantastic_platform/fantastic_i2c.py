@@ -1,28 +1,297 @@
+import asyncio
+from collections import deque
+from functools import partial
 from mpf.platforms.interfaces.i2c_platform_interface \
     import I2cPlatformInterface
+from fantastic_platform.fantastic_board import split_board_number
+
+
+class FanTasTicI2cRequest:
+    """ One `I2C` transaction and the future waiting for its result """
+    __slots__ = [
+        "channel", "address", "cmd", "nRead", "future", "retries", "tSent"
+    ]
+
+    def __init__(self, channel, address, txData: bytes, nRead: int, future):
+        self.channel = channel
+        self.address = address
+        self.cmd = "I2C {:d} {:d} {:s} {:d}\n".format(
+            channel, address, txData.hex(), nRead
+        )
+        self.nRead = nRead
+        self.future = future
+        self.retries = 0
+        self.tSent = 0.0
+
+
+class FanTasTicI2cManager:
+    """
+    The I2C transactions of one board.
+
+    Each of the 4 channels has a FIFO of requests. One request per channel
+    is on the wire at a time, so each `I2:` reply belongs to the oldest
+    request of its channel. The channels run in parallel: a servo
+    controller on one channel does not wait for a sensor poll on another.
+
+    A request which gets no reply within TIMEOUT [s] is sent again, up to
+    RETRIES times. Then its future fails with asyncio.TimeoutError. The
+    replies carry no request id, so after a timeout the channel is drained
+    for TIMEOUT [s] before its next request goes out: late replies which
+    arrive meanwhile are dropped instead of being taken for the reply to
+    the next request. A reply with error flags (NACK) fails the future
+    with OSError.
+
+    Register writes of the devices are staged and flushed once per event
+    loop iteration, so all writes of one frame go out together.
+    """
+    N_CHANNELS = 4
+    TIMEOUT = 0.1
+    RETRIES = 2
+    __slots__ = [
+        "loop", "serialCom", "log", "latency", "queues", "timers", "devices",
+        "draining", "_dirty", "_flushHandle", "nRequests", "nRetries",
+        "nTimeouts", "nErrors", "nStale", "nWritesSuppressed",
+        "nWritesMerged"
+    ]
+
+    def __init__(self, loop, serialCom, log, latency=None) -> None:
+        self.loop = loop
+        self.serialCom = serialCom
+        self.log = log
+        # Optional FanTasTicLatency of the platform
+        self.latency = latency
+        # Requests per channel. The first one is on the wire
+        self.queues = [deque() for _ in range(FanTasTicI2cManager.N_CHANNELS)]
+        # Timeout of the request on the wire, per channel
+        self.timers = [None] * FanTasTicI2cManager.N_CHANNELS
+        # Channels waiting for late replies, after a timeout
+        self.draining = [False] * FanTasTicI2cManager.N_CHANNELS
+        # FanTasTicI2c devices by (channel, address)
+        self.devices = dict()
+        # Devices with staged register writes
+        self._dirty = list()
+        self._flushHandle = None
+        self.nRequests = 0
+        self.nRetries = 0
+        self.nTimeouts = 0
+        # Replies with error flags set
+        self.nErrors = 0
+        # Replies which match no request: late, or of the wrong length
+        self.nStale = 0
+        # Register writes dropped because the value did not change or was
+        # overwritten in the same frame, and merged into the transaction
+        # of the previous register
+        self.nWritesSuppressed = 0
+        self.nWritesMerged = 0
+
+    def add_device(self, device):
+        """ Returns the device already known at that address, or `device` """
+        return self.devices.setdefault(
+            (device.channel, device.address), device
+        )
+
+    def stage(self, device):
+        """ `device` has register writes to flush with this frame """
+        if device in self._dirty:
+            return
+        self._dirty.append(device)
+        if self._flushHandle is None:
+            self._flushHandle = self.loop.call_soon(self.flush)
+
+    def flush(self):
+        """ Send the staged register writes of all devices """
+        self._flushHandle = None
+        for device in self._dirty:
+            device.flush()
+        self._dirty.clear()
+
+    def invalidate(self):
+        """ Forget the register values, after the board was lost """
+        for device in self.devices.values():
+            device.invalidate()
+
+    def request(self, channel, address, txData: bytes, nRead: int):
+        """
+        Write `txData` to the device at `address` on `channel`, then read
+        `nRead` bytes. Returns a future of the bytes read (empty for a
+        write only transaction).
+        """
+        if not 0 <= channel < FanTasTicI2cManager.N_CHANNELS:
+            raise ValueError("Invalid I2C channel {:}".format(channel))
+        req = FanTasTicI2cRequest(
+            channel, address, txData, nRead, self.loop.create_future()
+        )
+        self.nRequests += 1
+        queue = self.queues[channel]
+        queue.append(req)
+        if len(queue) == 1 and not self.draining[channel]:
+            self._send(req)
+        return req.future
+
+    def _send(self, req):
+        if self.latency is not None:
+            req.tSent = self.latency.now()
+        # Devices may await I2C reads while the platform is configured
+        self.serialCom.send_bulk(req.cmd, whileCorked=True)
+        self.timers[req.channel] = self.loop.call_later(
+            FanTasTicI2cManager.TIMEOUT, self._timeout, req.channel
+        )
+
+    def _next(self, channel, drain=False):
+        """
+        Done with the first request of `channel`, send the next one.
+        drain: first wait for the late replies to earlier attempts
+        """
+        self.queues[channel].popleft()
+        timer = self.timers[channel]
+        if timer is not None:
+            timer.cancel()
+            self.timers[channel] = None
+        if drain:
+            self.draining[channel] = True
+            self.timers[channel] = self.loop.call_later(
+                FanTasTicI2cManager.TIMEOUT, self._drained, channel
+            )
+            return
+        self._send_next(channel)
+
+    def _drained(self, channel):
+        self.timers[channel] = None
+        self.draining[channel] = False
+        self._send_next(channel)
+
+    def _send_next(self, channel):
+        queue = self.queues[channel]
+        # Skip the requests whose caller gave up (cancelled futures)
+        while queue and queue[0].future.done():
+            queue.popleft()
+        if queue:
+            self._send(queue[0])
+
+    def _timeout(self, channel):
+        self.timers[channel] = None
+        req = self.queues[channel][0]
+        if req.retries < FanTasTicI2cManager.RETRIES and \
+                not req.future.done():
+            req.retries += 1
+            self.nRetries += 1
+            self._send(req)
+            return
+        self.nTimeouts += 1
+        if not req.future.done():
+            req.future.set_exception(asyncio.TimeoutError(
+                "No reply to {:s}".format(req.cmd.strip())
+            ))
+        self._next(channel, True)
+
+    def receive(self, payload):
+        """
+        Match an `I2:` reply to its request.
+        payload = b' <channel>, <error flags>[, <hex rx data>]'
+        """
+        tok = bytes(payload).split(b',')
+        channel = int(tok[0])
+        flags = int(tok[1], 16)
+        rxData = bytearray.fromhex(tok[2].decode()) if len(tok) > 2 \
+            else bytearray()
+        queue = self.queues[channel] if 0 <= channel < len(self.queues) \
+            else None
+        if not queue or self.draining[channel] or \
+                (not flags and len(rxData) != queue[0].nRead):
+            # Late reply to a request which timed out
+            self.nStale += 1
+            self.log.warning("Unexpected I2C reply: %s", bytes(payload))
+            return
+        req = queue[0]
+        if self.latency is not None:
+            self.latency.record(self.latency.i2cRoundTrip, req.tSent)
+        if flags:
+            self.nErrors += 1
+            if not req.future.done():
+                req.future.set_exception(OSError(
+                    "I2C error 0x{:02X} on {:s}".format(
+                        flags, req.cmd.strip()
+                    )
+                ))
+        elif not req.future.done():
+            req.future.set_result(rxData)
+        # Replies to the earlier attempts may still be on their way
+        self._next(channel, req.retries > 0)
+
+    def cancel_all(self):
+        """ Cancel all requests, on shutdown """
+        if self._flushHandle is not None:
+            self._flushHandle.cancel()
+            self._flushHandle = None
+        self._dirty.clear()
+        for channel, queue in enumerate(self.queues):
+            for req in queue:
+                req.future.cancel()
+            queue.clear()
+            if self.timers[channel] is not None:
+                self.timers[channel].cancel()
+                self.timers[channel] = None
+            self.draining[channel] = False
+
+    def get_stats(self) -> dict:
+        return {
+            "requests": self.nRequests,
+            "retries": self.nRetries,
+            "timeouts": self.nTimeouts,
+            "errors": self.nErrors,
+            "stale_replies": self.nStale,
+            "writes_suppressed": self.nWritesSuppressed,
+            "writes_merged": self.nWritesMerged,
+            "pending": sum(len(queue) for queue in self.queues)
+        }
 
 
 class FanTasTicI2c(I2cPlatformInterface):
     """
     Represents a device with a certain address
-    on one of the four I2C channels
+    on one of the four I2C channels of a board
+
+    Keeps a mirror of the registers written so far. Writes of the value a
+    register already has are dropped. The other writes are staged and sent
+    at the end of the frame, as few transactions as possible. A register
+    written several times in one frame is sent once, with the last value.
+    Runs of consecutive registers go out as one transaction if the register
+    address of the device auto-increments (`i2c_auto_increment:`, always
+    for `i2c_write_block()`). The registers of a write which failed, by
+    error reply or timeout, are unknown again and written next time.
     """
-    __slots__ = ["platform", "address", "channel"]
+    # Max. bytes of one transaction, including the register byte.
+    # Must match the firmware
+    CUSTOM_I2C_BUF_LEN = 32
+    __slots__ = [
+        "platform", "i2c", "address", "channel", "autoIncrement",
+        "regCache", "pending"
+    ]
 
     def __init__(self, number: str, platform) -> None:
         if type(number) is not str or '-' not in number:
-            RuntimeError(
-                "I2C number must be of format `<CHANNEL>-<I2C_ADDR[7]>`"
+            raise RuntimeError(
+                "I2C number must be of format "
+                "`[b<BOARD>-]<CHANNEL>-<I2C_ADDR[7]>`"
             )
         super().__init__(number)
         self.platform = platform
+        self.autoIncrement = \
+            number in (platform.config["i2c_auto_increment"] or [])
+        board, number = split_board_number(number)
+        # Transaction manager of the board
+        self.i2c = platform.boards[board].i2c
         ch, adr, = number.lower().replace('bus', '').split("-")
         self.channel = int(ch)
         self.address = int(adr)  # 7 bit I2C address
-        if 0 > self.channel > 3:
+        if not 0 <= self.channel <= 3:
             raise RuntimeError("Invalid I2C channel {:}".format(self.channel))
-        if 0 > self.address > 127:
+        if not 0 <= self.address <= 127:
             raise RuntimeError("Invalid I2C address {:}".format(self.address))
+        # Last value written to each register, -1 = unknown
+        self.regCache = [-1] * 256
+        # Staged writes, in order: [first register, bytearray of values]
+        self.pending = list()
 
     def i2c_write8(self, register, value):
         self.platform.debug_log(
@@ -32,22 +301,108 @@ class FanTasTicI2c(I2cPlatformInterface):
             value
         )
         # Crashes the firmware on init when servoController is used :(
-        self.platform.serialCom.send("I2C {:d} {:d} {:02x}{:02x} 0\n".format(
-            self.channel, self.address, register & 0xFF, value & 0xFF
-        ))
+        self._stage(register & 0xFF, (value & 0xFF,), self.autoIncrement)
+
+    def i2c_write_block(self, register, data):
+        """
+        Write `data` to the registers starting at `register`, for devices
+        which auto-increment the register address. Unchanged registers at
+        the start and end of the block are not sent.
+        """
+        self._stage(register & 0xFF, data, True)
+
+    def _stage(self, register, data, merge):
+        if register + len(data) > len(self.regCache):
+            raise ValueError(
+                "I2C write of {:d} bytes at register 0x{:02X} runs past "
+                "register 0xFF".format(len(data), register)
+            )
+        cache = self.regCache
+        # Trim the values which are already in the registers
+        first, last = 0, len(data)
+        while first < last and cache[register + first] == data[first]:
+            first += 1
+        while last > first and cache[register + last - 1] == data[last - 1]:
+            last -= 1
+        self.i2c.nWritesSuppressed += len(data) - (last - first)
+        if first >= last:
+            return
+        register += first
+        data = data[first:last]
+        cache[register:register + len(data)] = data
+        # Registers staged before in this frame take the new value in place
+        end = register + len(data)
+        staged = [False] * len(data)
+        for prevReg, prevData in self.pending:
+            for reg in range(
+                max(register, prevReg), min(end, prevReg + len(prevData))
+            ):
+                prevData[reg - prevReg] = data[reg - register]
+                staged[reg - register] = True
+        self.i2c.nWritesSuppressed += staged.count(True)
+        # Append the runs of registers which are not staged yet
+        start = None
+        for i, isStaged in enumerate(staged + [True]):
+            if not isStaged and start is None:
+                start = i
+            elif isStaged and start is not None:
+                self._append(register + start, data[start:i], merge)
+                start = None
+        self.i2c.stage(self)
+
+    def _append(self, register, data, merge):
+        """ Stage the writes of registers which are not staged yet """
+        maxLen = FanTasTicI2c.CUSTOM_I2C_BUF_LEN - 1
+        pending = self.pending
+        if merge and pending:
+            # Continue the previous run if it ends right before `register`
+            prevReg, prevData = pending[-1]
+            n = min(
+                maxLen - len(prevData),
+                len(data) if prevReg + len(prevData) == register else 0
+            )
+            if n > 0:
+                prevData += bytes(data[:n])
+                self.i2c.nWritesMerged += n
+                register += n
+                data = data[n:]
+        for i in range(0, len(data), maxLen if merge else 1):
+            chunk = data[i:i + (maxLen if merge else 1)]
+            pending.append([register + i, bytearray(chunk)])
+
+    def flush(self):
+        """ Send the staged register writes """
+        for register, data in self.pending:
+            future = self.i2c.request(
+                self.channel, self.address,
+                bytes((register,)) + data, 0
+            )
+            future.add_done_callback(
+                partial(self._write_done, register, len(data))
+            )
+        self.pending.clear()
+
+    def _write_done(self, register, n, future):
+        """ Forget the values of a failed write (error reply or timeout) """
+        if future.cancelled() or future.exception() is None:
+            return
+        self.platform.log.warning(
+            "I2C write to %s failed: %s", self.number, future.exception()
+        )
+        # Unknown what the registers hold now. Write them next time
+        self.regCache[register:register + n] = [-1] * n
+
+    def invalidate(self):
+        """ Forget the register values, all writes go out again """
+        self.regCache[:] = [-1] * 256
 
     async def i2c_read_block(self, register, count):
-        if self.platform.i2c_gotit.is_set():
-            RuntimeError("I2C RX: another already in progress?")
-        self.platform.serialCom.send("I2C {:d} {:d} {:02x} {:d}\n".format(
-            self.channel, self.address, register & 0xFF, count
-        ))
-        await self.platform.i2c_gotit.wait()
-        self.platform.i2c_gotit.clear()
-        rx_len = len(self.platform.i2c_rx_data)
-        if rx_len != count:
-            RuntimeError("I2C RX: Not received enough bytes, ", rx_len)
-        return self.platform.i2c_rx_data
+        # The staged writes come first
+        if self.pending:
+            self.flush()
+        return await self.i2c.request(
+            self.channel, self.address, bytes((register & 0xFF,)), count
+        )
 
     async def i2c_read8(self, register):
-        return self.i2c_read_block(register, 1)
+        return (await self.i2c_read_block(register, 1))[0]
@@ -0,0 +1,67 @@
+""" Opt-in latency histograms of the serial hot paths """
+from time import perf_counter
+from fantastic_platform.fantastic_histogram import FanTasTicHistogram
+
+
+class FanTasTicLatency:
+    """
+    Latency histograms [us] of the paths a switch event and a command take
+    through the platform. Enabled with `latency_stats: true`, otherwise the
+    platform and communicators keep None instead of this object.
+
+        rx_framing      _parse_msg() got the bytes -> the callback of one
+                        message starts
+        rx_handler      run time of that callback
+        sw_dispatch     _parse_msg() got an `SE:` -> all its switches are
+                        handed to MPF
+        switch_to_tx    _parse_msg() got an `SE:` -> the commands queued
+                        by the switch handlers (`OUT` of a driver, ...) are
+                        written
+        tx_control      control command queued -> written
+        tx_bulk         bulk data (LED frame, I2C) queued -> written
+        sw_roundtrip    `SW?` queued -> `SW:` received
+        i2c_roundtrip   `I2C` queued -> `I2:` received
+
+    The timestamps are perf_counter() values, taken only while enabled.
+    The tx_ paths use the loop.time() stamps the transmit lanes keep anyway.
+    """
+    __slots__ = [
+        "rxFraming", "rxHandler", "swDispatch", "switchToTx", "txControl",
+        "txBulk", "swRoundTrip", "i2cRoundTrip", "tRx", "tTrigger"
+    ]
+
+    def __init__(self) -> None:
+        self.rxFraming = FanTasTicHistogram("rx_framing", "us")
+        self.rxHandler = FanTasTicHistogram("rx_handler", "us")
+        self.swDispatch = FanTasTicHistogram("sw_dispatch", "us")
+        self.switchToTx = FanTasTicHistogram("switch_to_tx", "us")
+        self.txControl = FanTasTicHistogram("tx_control", "us")
+        self.txBulk = FanTasTicHistogram("tx_bulk", "us")
+        self.swRoundTrip = FanTasTicHistogram("sw_roundtrip", "us")
+        self.i2cRoundTrip = FanTasTicHistogram("i2c_roundtrip", "us")
+        # When _parse_msg() got the data being parsed
+        self.tRx = 0.0
+        # While the switches of an `SE:` are dispatched: its tRx
+        self.tTrigger = None
+
+    @staticmethod
+    def now() -> float:
+        return perf_counter()
+
+    @staticmethod
+    def record(hist, tStart: float):
+        """ Record the time since `tStart` (a now() value) in `hist` """
+        hist.record(int((perf_counter() - tStart) * 1e6))
+
+    def histograms(self) -> list:
+        return [getattr(self, name) for name in FanTasTicLatency.__slots__[:8]]
+
+    def reset(self):
+        for hist in self.histograms():
+            hist.reset()
+
+    def get_stats(self) -> dict:
+        return {hist.name: hist.get_stats() for hist in self.histograms()}
+
+    def __str__(self):
+        return "\n".join(str(hist) for hist in self.histograms())
@@ -0,0 +1,180 @@
+""" Preallocated frame buffers for the WS2811 LED channels """
+import numpy
+
+
+class FanTasTicLedFrame:
+    """
+    Keeps the `LED <channel> <len>\\n` header and the LED payload of one
+    WS2811 channel in a single preallocated bytearray:
+
+        | ... unused ... | LED 2 1234\\n | payload (up to 3 * 1024 bytes) |
+                          ^ hdrStart     ^ HEADER_LEN
+
+    The header is written right-aligned in front of the payload, so a
+    complete frame is a contiguous slice of `buf` and can be queued as a
+    memoryview, without copying. It is copied once when it is written to
+    the serial transport: by the join of all chunks of a flush, or by
+    pyserial, which converts memoryviews to bytes. Only the bulk writer
+    thread writes it as it is, with `writev()`.
+
+    Lights write their brightness values directly into `buf`, at
+    `HEADER_LEN + <payload index>`. The bulk API of the platform writes
+    through `leds`, a numpy view of the payload with shape (MAX_LEDS, 3).
+    `data` is the same view, flat.
+
+    Optionally a lookup table (gamma, white balance, dimming) is applied to
+    the payload when the frame is sent. Then the frame is assembled in a
+    second, private buffer, so the state in `buf` stays linear.
+
+    With a back buffer (see `enable_back_buffer()`), frames are assembled
+    from a copy of the payload instead. `snapshot()` copies the dirty part
+    on the event loop, then `get_frame()` can run in the writer thread while
+    the lights keep writing to `buf`.
+    """
+    MAX_LEDS = 1024                 # per channel, must match the firmware
+    MAX_BYTES = MAX_LEDS * 3        # r, g, b
+    HEADER_LEN = 16                 # len(b"LED 2 3072\n") == 11
+    __slots__ = [
+        "channel", "index", "buf", "view", "data", "leds", "nBytes",
+        "dirtyLen", "_headers", "_hdrStart", "_hdrLen", "_txBuf", "_txView",
+        "_lut", "_lutOffset", "_lutInd", "_outData", "_srcData", "_backBuf"
+    ]
+
+    def __init__(self, channel: int, index: int = None) -> None:
+        self.channel = channel
+        # Position in the list of the LED frames of all boards
+        self.index = channel if index is None else index
+        self.buf = bytearray(
+            FanTasTicLedFrame.HEADER_LEN + FanTasTicLedFrame.MAX_BYTES
+        )
+        self.view = memoryview(self.buf)
+        self.data = numpy.frombuffer(
+            self.buf,
+            dtype=numpy.uint8,
+            offset=FanTasTicLedFrame.HEADER_LEN
+        )
+        self.leds = self.data.reshape(FanTasTicLedFrame.MAX_LEDS, 3)
+        # Number of payload bytes in use (highest configured LED byte + 1)
+        self.nBytes = 0
+        # Number of leading payload bytes which changed since the last frame
+        self.dirtyLen = 0
+        # Encoded headers, by payload length. Filled on demand
+        self._headers = dict()
+        # Payload length the header currently in `buf` was written for
+        self._hdrLen = -1
+        self._hdrStart = FanTasTicLedFrame.HEADER_LEN
+        # Buffer the frames are sent from: `buf` (or the back buffer), or
+        # `outBuf` with a LUT
+        self._txBuf = self.buf
+        self._txView = self.view
+        self._lut = None
+        # Payload the frames are assembled from: `data` or the back buffer
+        self._srcData = self.data
+        self._backBuf = None
+
+    def enable_back_buffer(self):
+        """
+        Assemble the frames from a copy of the payload, taken by
+        `snapshot()`
+        """
+        if self._backBuf is not None:
+            return
+        self._backBuf = bytearray(len(self.buf))
+        self._srcData = numpy.frombuffer(
+            self._backBuf,
+            dtype=numpy.uint8,
+            offset=FanTasTicLedFrame.HEADER_LEN
+        )
+        if self._lut is None:
+            self._txBuf = self._backBuf
+            self._txView = memoryview(self._backBuf)
+        self._hdrLen = -1
+
+    def snapshot(self, nBytes: int):
+        """
+        Copy the first `nBytes` of the payload to the back buffer (if any).
+        Everything after them did not change since the previous snapshot.
+        """
+        if self._backBuf is None:
+            return
+        hl = FanTasTicLedFrame.HEADER_LEN
+        self._backBuf[hl:hl + nBytes] = self.view[hl:hl + nBytes]
+
+    def set_lut(self, lut):
+        """
+        Set the lookup table which is applied to the payload when the frame
+        is sent.
+
+        Args:
+            lut: uint8 array of shape (3, 256). `lut[colorIndex][value]` is
+                sent instead of `value`. None disables the lookup table.
+        """
+        self._hdrLen = -1
+        if lut is None:
+            self._lut = None
+            if self._backBuf is None:
+                self._txBuf = self.buf
+                self._txView = self.view
+            else:
+                self._txBuf = self._backBuf
+                self._txView = memoryview(self._backBuf)
+            return
+        n = FanTasTicLedFrame.MAX_BYTES
+        self._lut = numpy.ascontiguousarray(lut, dtype=numpy.uint8).reshape(-1)
+        # Index of each payload byte into the flat LUT is
+        # `value + 256 * colorIndex`
+        self._lutOffset = (numpy.arange(n) % 3 * 256).astype(numpy.uint16)
+        self._lutInd = numpy.empty(n, dtype=numpy.uint16)
+        outBuf = bytearray(len(self.buf))
+        self._outData = numpy.frombuffer(
+            outBuf, dtype=numpy.uint8, offset=FanTasTicLedFrame.HEADER_LEN
+        )
+        self._txBuf = outBuf
+        self._txView = memoryview(outBuf)
+
+    def extend(self, nBytes: int):
+        """ Make sure at least `nBytes` of payload are in use """
+        if nBytes > FanTasTicLedFrame.MAX_BYTES:
+            raise ValueError(
+                "LED channel {0} supports max. {1} LEDs".format(
+                    self.channel, FanTasTicLedFrame.MAX_LEDS
+                )
+            )
+        if nBytes > self.nBytes:
+            self.nBytes = nBytes
+            # Make sure the new LEDs get initialized with the next frame
+            self.dirtyLen = nBytes
+
+    def clear(self):
+        """ Set all payload bytes in use to zero (all LEDs off) """
+        hl = FanTasTicLedFrame.HEADER_LEN
+        self.buf[hl:hl + self.nBytes] = bytes(self.nBytes)
+        self.dirtyLen = self.nBytes
+
+    def get_frame(self, nBytes: int) -> memoryview:
+        """
+        Returns a memoryview of the `LED` command, sending the first `nBytes`
+        of the payload. The header is only re-written if `nBytes` differs
+        from the previous call.
+        """
+        hl = FanTasTicLedFrame.HEADER_LEN
+        if self._lut is not None:
+            ind = self._lutInd[:nBytes]
+            numpy.add(
+                self._srcData[:nBytes], self._lutOffset[:nBytes], out=ind
+            )
+            numpy.take(self._lut, ind, out=self._outData[:nBytes], mode='clip')
+        if nBytes != self._hdrLen:
+            hdr = self._headers.get(nBytes)
+            if hdr is None:
+                hdr = "LED {0} {1}\n".format(self.channel, nBytes).encode()
+                self._headers[nBytes] = hdr
+            self._hdrStart = hl - len(hdr)
+            self._txBuf[self._hdrStart:hl] = hdr
+            self._hdrLen = nBytes
+        return self._txView[self._hdrStart:hl + nBytes]
+
+    def get_payload(self) -> memoryview:
+        """ Returns a memoryview of the payload bytes in use """
+        hl = FanTasTicLedFrame.HEADER_LEN
+        return self.view[hl:hl + self.nBytes]
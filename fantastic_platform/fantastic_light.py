@@ -1,39 +1,71 @@
 from asyncio import AbstractEventLoop
-from mpf.platforms.interfaces.light_platform_interface import LightPlatformSoftwareFade
+from mpf.platforms.interfaces.light_platform_interface import LightPlatformInterface
+from fantastic_platform.fantastic_led_frame import FanTasTicLedFrame
+from fantastic_platform.fantastic_board import FanTasTicBoard, \
+    split_board_number
 
-class FanTasTicLight( LightPlatformSoftwareFade ):
-    __slots__ = ["arrs", "inds"]
+class FanTasTicLight( LightPlatformInterface ):
+    __slots__ = ["loop", "fadeEngine", "frames", "inds"]
 
-    def __init__(self, loop: AbstractEventLoop, software_fade_ms: int, number: str, ledByteArrayRefs: list ) -> None:
+    def __init__(self, loop: AbstractEventLoop, number: str, ledFrames: list, fadeEngine ) -> None:
         """
-            ledByteArrayRef:
-                reference to the raw bytesarray with all LED data. This is indexed and written to
+            ledFrames:
+                reference to the FanTasTicLedFrame objects of all LED channels
+                of all boards (3 per board). Their `buf` is indexed and
+                written to
+
+            fadeEngine:
+                FanTasTicFadeEngine of the platform, doing all software fades
 
             targetIndex:
                 where to write the brightness to
         """
-        super().__init__(number, loop, software_fade_ms)
+        super().__init__(number)
+        self.loop = loop
+        self.fadeEngine = fadeEngine
 
         # number = "<colorIndex>, 1-38, 1-39"
         ns = number.split(",")
         colorIndex = int( ns.pop(0).strip() )
-        # ns = [' 1-38', ' 1-39']
-        self.arrs = list()
+        # ns = [' 1-38', ' b1-1-39']
+        self.frames = list()
         self.inds = list()
         for n in ns:
             #----------------------------------------------
-            # Find the right led-byte-array and index
+            # Find the right led-frame and index
             #----------------------------------------------
-            ledChannel, ledNumber = n.strip().split("-")
-            ledByteArrayRef = ledByteArrayRefs[ int(ledChannel) ]
+            board, n = split_board_number(n)
+            ledChannel, ledNumber = n.split("-")
+            ledFrame = ledFrames[
+                board * FanTasTicBoard.N_LED_CHANNELS + int(ledChannel)
+            ]
             targetIndex = int(ledNumber)*3 + colorIndex
             #----------------------------------------------
-            # Check if LED byte array needs to be extended
+            # Check if more of the LED frame needs to be used
             #----------------------------------------------
-            if targetIndex >= len( ledByteArrayRef ): # index does not exist, we need to extend the array
-                ledByteArrayRef += b"\x00"*( (targetIndex+1)-len(ledByteArrayRef) )
-            self.arrs.append( ledByteArrayRef )    # This is hopefully by reference
-            self.inds.append( targetIndex )
+            ledFrame.extend( targetIndex+1 )
+            self.frames.append( ledFrame )
+            # Index into `ledFrame.buf`, which holds the header first
+            self.inds.append( FanTasTicLedFrame.HEADER_LEN + targetIndex )
+
+    def set_fade(self, start_brightness, start_time, target_brightness, target_time):
+        """Perform a fade to a brightness.
+
+        The fade is done by the fade engine of the platform, right before
+        the next LED frames are sent.
+        """
+        hl = FanTasTicLedFrame.HEADER_LEN
+        if target_time <= self.loop.time():
+            for frame, ind in zip(self.frames, self.inds):
+                self.fadeEngine.cancel( frame.index, ind - hl )
+            self.set_brightness( target_brightness )
+            return
+        for frame, ind in zip(self.frames, self.inds):
+            self.fadeEngine.set_fade(
+                frame.index, ind - hl,
+                start_brightness, start_time,
+                target_brightness, target_time
+            )
 
     def set_brightness(self, brightness: float):
         """Set the light to the specified brightness.
@@ -44,8 +76,16 @@ class FanTasTicLight( LightPlatformSoftwareFade ):
         Returns:
             None
         """
-        for arr, ind in zip(self.arrs, self.inds):
-            arr[ ind ] = int( brightness * 255 )
+        val = int( brightness * 255 )
+        for frame, ind in zip(self.frames, self.inds):
+            buf = frame.buf
+            if buf[ ind ] == val:
+                continue
+            buf[ ind ] = val
+            # Remember the highest changed byte of this channel
+            nDirty = ind - FanTasTicLedFrame.HEADER_LEN + 1
+            if nDirty > frame.dirtyLen:
+                frame.dirtyLen = nDirty
 
     def get_board_name(self):
         """Return the name of the board of this driver."""
@@ -0,0 +1,134 @@
+""" Binary log of the serial traffic of a board, for replaying it later """
+import struct
+import threading
+from time import monotonic_ns
+
+
+class FanTasTicRecorder:
+    """
+    Appends every chunk received from and written to a board to a binary
+    file. After an 8 byte file header, each record is
+
+        uint64  time.monotonic_ns() when the chunk was received / written
+        uint8   direction, RX = 0, TX = 1
+        uint32  length of the chunk
+        bytes   the chunk
+
+    little endian. An existing file is appended to, with a new file header,
+    so an old recording is never overwritten.
+
+    Recording costs the event loop a copy of the data into a buffer. A
+    thread writes the buffer to the file every FLUSH_INTERVAL [s], or as
+    soon as it holds FLUSH_SIZE bytes, so the loop never waits for the
+    disk and a crash loses at most the last second. The bulk writer
+    thread records too, a lock keeps the records whole.
+    """
+    MAGIC = b"FTTREC\x01\n"
+    RECORD = struct.Struct("<QBI")
+    RX = 0
+    TX = 1
+    FLUSH_INTERVAL = 1.0
+    FLUSH_SIZE = 1 << 18
+    __slots__ = [
+        "path", "nRecords", "nBytes", "nFlushes", "_file", "_buffer",
+        "_lock", "_wake", "_running", "_thread"
+    ]
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.nRecords = 0
+        self.nBytes = 0
+        self.nFlushes = 0
+        self._file = open(path, "ab")
+        self._file.write(FanTasTicRecorder.MAGIC)
+        # Records not written to the file yet
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="FanTasTicRecorder", daemon=True
+        )
+        self._thread.start()
+
+    def record(self, direction: int, data):
+        """ Append one chunk (bytes, bytearray or memoryview) """
+        header = FanTasTicRecorder.RECORD.pack(
+            monotonic_ns(), direction, len(data)
+        )
+        with self._lock:
+            if not self._running:
+                return
+            self._buffer += header
+            self._buffer += data
+            self.nRecords += 1
+            self.nBytes += len(data)
+            if len(self._buffer) >= FanTasTicRecorder.FLUSH_SIZE:
+                self._wake.set()
+
+    def _run(self):
+        try:
+            while self._running:
+                self._wake.wait(FanTasTicRecorder.FLUSH_INTERVAL)
+                self._wake.clear()
+                self._flush()
+            self._flush()
+        except OSError:
+            # Disk full or gone: stop recording, do not fill up the memory
+            with self._lock:
+                self._running = False
+                self._buffer = bytearray()
+        finally:
+            self._file.close()
+
+    def _flush(self):
+        """ In the thread, write the buffered records """
+        with self._lock:
+            data = self._buffer
+            self._buffer = bytearray()
+        if data:
+            self._file.write(data)
+            self._file.flush()
+            self.nFlushes += 1
+
+    def close(self):
+        """ Write the buffered records, end the thread and close the file """
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+        self._wake.set()
+        self._thread.join()
+
+    def get_stats(self) -> dict:
+        return {
+            "records": self.nRecords, "bytes": self.nBytes,
+            "flushes": self.nFlushes
+        }
+
+
+def read_recording(path: str):
+    """
+    Yields (time [ns], direction, data) for each record of a file written
+    by FanTasTicRecorder. A record cut short at the end (the machine was
+    killed while recording) is ignored. The recordings appended to the
+    file are read one after the other.
+    """
+    size = FanTasTicRecorder.RECORD.size
+    unpack = FanTasTicRecorder.RECORD.unpack
+    with open(path, "rb") as f:
+        if f.read(len(FanTasTicRecorder.MAGIC)) != FanTasTicRecorder.MAGIC:
+            raise ValueError("{0} is not a Fan-Tas-Tic recording".format(path))
+        while True:
+            header = f.read(size)
+            if len(header) < size:
+                return
+            if header.startswith(FanTasTicRecorder.MAGIC):
+                # The next recording starts
+                f.seek(len(FanTasTicRecorder.MAGIC) - size, 1)
+                continue
+            t, direction, n = unpack(header)
+            data = f.read(n)
+            if len(data) < n:
+                return
+            yield t, direction, data
@@ -0,0 +1,189 @@
+""" Quick-fire rule slots of one Fan-Tas-Tic board """
+from collections import defaultdict     # For dict of lists
+
+
+class FanTasTicRuleSlots:
+    """
+    Keeps the quick-fire rules configured in the slots of one board and
+    turns changes to them into the minimal set of `RUL` / `RULE` / `OUT`
+    commands.
+
+    A rule is a tuple `(id, hwIndexSw, hwIndexOut, trHoldOff, tPulse,
+    pwmHigh, pwmLow, posEdge)`, the key of a rule is the same tuple without
+    the id. Identical rules share one slot. Disabled rules stay in their
+    slot, so they can be re-enabled with a short `RULE <id> 1`.
+
+    All changes happen between `begin()` and `commit()` (or `rollback()`).
+    """
+    MAX_QUICK_RULES = 64    # must match bit_rules.h
+    __slots__ = [
+        "configuredRules", "freeRuleSlots", "inactiveRuleSlots",
+        "ruleSlotIndex", "ruleRefCounts", "swNameToRuleIdDict",
+        "_txSnapshot", "_txSlots", "_txCleared"
+    ]
+
+    def __init__(self) -> None:
+        n = FanTasTicRuleSlots.MAX_QUICK_RULES
+        # List to store all configured rules (active and inactive) in tuple fmt
+        self.configuredRules = [None] * n
+        # Bitmap of the rule slots holding no rule at all (bit n = slot n)
+        self.freeRuleSlots = (1 << n) - 1
+        # Bitmap of the slots holding a disabled rule. These are re-enabled
+        # with `RULE <id> 1` or overwritten when no free slot is left
+        self.inactiveRuleSlots = 0
+        # Reverse index of `configuredRules`: rule tuple without id --> id
+        self.ruleSlotIndex = dict()
+        # Number of times each (identical) rule is in use
+        self.ruleRefCounts = [0] * n
+        self.swNameToRuleIdDict = defaultdict(list)
+        # Rule state when the transaction started, bitmap of the touched
+        # slots and the rules cleared in it
+        self._txSnapshot = None
+        self._txSlots = 0
+        self._txCleared = list()
+
+    def alloc(self):
+        """
+        Returns the lowest free rule slot. If there is none, the lowest slot
+        with a disabled rule is reused.
+        """
+        slots = self.freeRuleSlots or self.inactiveRuleSlots
+        if not slots:
+            raise OverflowError(
+                "alloc(): No free slot for quick-fire rule found!"
+            )
+        # Isolate the lowest set bit
+        rulId = (slots & -slots).bit_length() - 1
+        if self.freeRuleSlots:
+            self.freeRuleSlots &= ~(1 << rulId)
+        else:
+            self.inactiveRuleSlots &= ~(1 << rulId)
+            del self.ruleSlotIndex[self.configuredRules[rulId][1:]]
+        return rulId
+
+    def enable(self, rulKey):
+        """
+        Make sure the rule `rulKey` (rule tuple without the id) is active.
+        Identical rules share one slot.
+        """
+        rulId = self.ruleSlotIndex.get(rulKey)
+        if rulId is None:
+            rulId = self.alloc()
+            self.configuredRules[rulId] = (rulId,) + rulKey
+            self.ruleSlotIndex[rulKey] = rulId
+        elif self.ruleRefCounts[rulId] <= 0:
+            self.inactiveRuleSlots &= ~(1 << rulId)
+        self.ruleRefCounts[rulId] += 1
+        self._txSlots |= 1 << rulId
+        # Remember which rules are associated with this switch-name
+        self.swNameToRuleIdDict[rulKey[0]].append(rulId)
+
+    def disable(self, rulId):
+        """
+        Release one user of rule slot `rulId`. The rule stays configured, so
+        it can be re-enabled cheaply.
+        """
+        self.ruleRefCounts[rulId] -= 1
+        if self.ruleRefCounts[rulId] <= 0:
+            self.inactiveRuleSlots |= 1 << rulId
+        self._txSlots |= 1 << rulId
+        self._txCleared.append(self.configuredRules[rulId][1:])
+
+    def clear(self, hwIndexSw, hwIndexOut):
+        """ Disable all rules of switch `hwIndexSw` driving `hwIndexOut` """
+        rulIds = self.swNameToRuleIdDict.pop(hwIndexSw, [])
+        keepIds = list()
+        for rulId in rulIds:
+            if self.configuredRules[rulId][2] != hwIndexOut:
+                keepIds.append(rulId)
+                continue
+            # Disable the rule, but keep it around for re-enabling
+            self.disable(rulId)
+        if keepIds:
+            self.swNameToRuleIdDict[hwIndexSw] = keepIds
+
+    def begin(self):
+        """ Remember the current state, see `commit()` and `rollback()` """
+        self._txSnapshot = (
+            list(self.configuredRules),
+            list(self.ruleRefCounts),
+            dict(self.ruleSlotIndex),
+            {k: list(v) for k, v in self.swNameToRuleIdDict.items()},
+            self.freeRuleSlots,
+            self.inactiveRuleSlots
+        )
+        self._txSlots = 0
+        self._txCleared.clear()
+
+    def rollback(self):
+        """ Forget all rule changes since `begin()` """
+        rules, refCounts, slotIndex, swRules, free, inactive = \
+            self._txSnapshot
+        self.configuredRules[:] = rules
+        self.ruleRefCounts[:] = refCounts
+        self.ruleSlotIndex = slotIndex
+        self.swNameToRuleIdDict = defaultdict(list, swRules)
+        self.freeRuleSlots = free
+        self.inactiveRuleSlots = inactive
+        self._txSnapshot = None
+        self._txSlots = 0
+        self._txCleared.clear()
+
+    def commit(self):
+        """
+        Returns the commands which bring the slots on the board from the
+        state at `begin()` to the current one (empty string if nothing
+        changed).
+        """
+        oldRules, oldRefCounts, oldIndex = self._txSnapshot[:3]
+        self._txSnapshot = None
+        disables = ""
+        enables = ""
+        slots = self._txSlots
+        self._txSlots = 0
+        while slots:
+            bit = slots & -slots
+            slots ^= bit
+            rulId = bit.bit_length() - 1
+            rulTuple = self.configuredRules[rulId]
+            isActive = self.ruleRefCounts[rulId] > 0
+            if rulTuple != oldRules[rulId]:
+                # New rule in this slot. `RUL` enables it
+                enables += "RUL {0} {1} {2} {3} {4} {5} {6} {7}\n".format(
+                    *rulTuple
+                )
+                if not isActive:
+                    enables += "RULE {0} 0\n".format(rulId)
+            elif isActive != (oldRefCounts[rulId] > 0):
+                if isActive:
+                    enables += "RULE {0} 1\n".format(rulId)
+                else:
+                    disables += "RULE {0} 0\n".format(rulId)
+        # Just in case a flipper is still in hold state, reset the coils of
+        # the rules which got disabled. Once per coil.
+        coils = dict()
+        for rulKey in self._txCleared:
+            rulId = oldIndex.get(rulKey)
+            if rulId is None or oldRefCounts[rulId] <= 0:
+                continue
+            if self.ruleRefCounts[rulId] <= 0 or \
+                    self.configuredRules[rulId][1:] != rulKey:
+                coils[rulKey[1]] = None
+        self._txCleared.clear()
+        CMD = disables
+        for coil in coils:
+            CMD += "OUT {0} 0\n".format(coil)
+        CMD += enables
+        return CMD
+
+    def get_shadow_cmd(self):
+        """ Commands which set up the rule slots of a freshly reset board """
+        CMD = ""
+        # Slots which were never used are still disabled
+        for rulId, rulTuple in enumerate(self.configuredRules):
+            if rulTuple is None:
+                continue
+            CMD += "RUL {0} {1} {2} {3} {4} {5} {6} {7}\n".format(*rulTuple)
+            if self.ruleRefCounts[rulId] <= 0:
+                CMD += "RULE {0} 0\n".format(rulId)
+        return CMD
@@ -1,8 +1,126 @@
 '''Fantastic serial communicator.'''
+import asyncio
 from mpf.platforms.base_serial_communicator import BaseSerialCommunicator
+from fantastic_platform.fantastic_writer import FanTasTicBulkWriter
+from fantastic_platform.fantastic_recorder import FanTasTicRecorder
+from fantastic_platform.fantastic_telemetry import FanTasTicTelemetry, \
+    RX_INDEX, RX_OTHER
+
+
+class FanTasTicTxLane:
+    '''
+    One priority class of the transmit scheduler. A FIFO of messages with
+    queue depth and wait time (enqueue -> write) statistics.
+
+    Messages are bytes, or callables which return the message (or None) at
+    the time it is written. A callable may return another callable, to
+    leave the rest of the work to the writer thread (see
+    FanTasTicBulkWriter). While a message with a `key` is queued, further
+    messages with the same key are dropped. Together with a callable this
+    means the newest data is sent, instead of a backlog of stale data.
+
+    While the communicator is corked, only the messages put with
+    `whileCorked` are drained, the others stay queued.
+    '''
+    __slots__ = [
+        "name", "queue", "keys", "nWhileCorked", "nQueued", "nSent",
+        "nDropped", "maxDepth", "waitSum", "waitMax", "hist"
+    ]
+
+    def __init__(self, name: str, hist=None) -> None:
+        self.name = name
+        # Optional FanTasTicHistogram of the wait times [us]
+        self.queue = list()     # of (enqueueTime, key, msg, whileCorked)
+        self.keys = set()
+        # Number of queued messages which are written while corked
+        self.nWhileCorked = 0
+        self.nQueued = 0
+        self.nSent = 0
+        self.nDropped = 0
+        self.maxDepth = 0
+        self.waitSum = 0.0
+        self.waitMax = 0.0
+        self.hist = hist
+
+    def put(self, msg, now: float, key=None, whileCorked=False) -> bool:
+        '''Returns False if a message with the same key is already queued'''
+        if key is not None:
+            if key in self.keys:
+                self.nDropped += 1
+                return False
+            self.keys.add(key)
+        self.queue.append((now, key, msg, whileCorked))
+        if whileCorked:
+            self.nWhileCorked += 1
+        self.nQueued += 1
+        if len(self.queue) > self.maxDepth:
+            self.maxDepth = len(self.queue)
+        return True
+
+    def drain(self, chunks: list, now: float, inThread=False, corked=False):
+        '''Move all queued messages to `chunks`. With `inThread`, the
+        writer thread finishes (encodes) them. With `corked`, only the
+        messages put with `whileCorked`'''
+        held = None
+        for entry in self.queue:
+            tQueued, key, msg, whileCorked = entry
+            if corked and not whileCorked:
+                if held is None:
+                    held = list()
+                held.append(entry)
+                continue
+            if callable(msg):
+                msg = msg()
+                if callable(msg) and not inThread:
+                    msg = msg()
+                if msg is None:
+                    continue
+            if type(msg) is str and not inThread:
+                msg = msg.encode()
+            chunks.append(msg)
+            wait = now - tQueued
+            self.waitSum += wait
+            if wait > self.waitMax:
+                self.waitMax = wait
+            if self.hist is not None:
+                self.hist.record(int(wait * 1e6))
+            self.nSent += 1
+        self.queue.clear()
+        self.keys.clear()
+        self.nWhileCorked = 0
+        if held is not None:
+            self.queue += held
+            self.keys.update(e[1] for e in held if e[1] is not None)
+
+    def clear(self):
+        '''Drop all queued messages'''
+        self.nDropped += len(self.queue)
+        self.queue.clear()
+        self.keys.clear()
+        self.nWhileCorked = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "depth": len(self.queue),
+            "max_depth": self.maxDepth,
+            "queued": self.nQueued,
+            "sent": self.nSent,
+            "dropped": self.nDropped,
+            "wait_avg": self.waitSum / self.nSent if self.nSent else 0.0,
+            "wait_max": self.waitMax
+        }
 
 
 class FanTasTicSerialCommunicator(BaseSerialCommunicator):
+    # Retry interval [s] for bulk data while the transport is busy
+    BULK_RETRY = 0.001
+    # Initial size of the rx buffer, grows when needed
+    RX_BUFFER_LEN = 4096
+    # Bytes per read from the port. A burst of reports is framed in a few
+    # large chunks instead of one _parse_msg() call per 128 bytes
+    RX_READ_LEN = 4096
+    # Error code of a firmware reset, the board lost all its state
+    ERR_WATCHDOG = 0x0101
     # from https://docs.google.com/spreadsheets/d/1QlxT6QhTLHodxV4uOGEEIK3jQQLPyiI4lmSObMyx4UE/edit?usp=sharing
     errStrs = {
         0x0000: "I2CMCommand() not added to queue",
@@ -46,20 +164,76 @@ class FanTasTicSerialCommunicator(BaseSerialCommunicator):
         0x0101: "Watchdog timer expired"
     }
 
-    def __init__(self, platform, port: str, serialCommandCallbacks=dict()):
+    def __init__(self, platform, port: str, serialCommandCallbacks=dict(),
+                 bulkWriterThread=False, recordFile=None):
         '''
             serialCommandCallbacks
                 dict(), key is command type (b'ID') value is a
                 callback function `receive_id( msg )`
+
+            bulkWriterThread
+                write the bulk data from a background thread, see
+                FanTasTicBulkWriter. Control commands wait while it writes
+
+            recordFile
+                record all received and written data to this file, see
+                FanTasTicRecorder
         '''
         # baudrate is ignored by hardware
         super().__init__(platform, port, 115200)
-        self._rxBuffer = bytearray()
+        # Incoming data, complete messages are between _rxStart and the
+        # last separator before _rxEnd
+        self._rxBuffer = bytearray(FanTasTicSerialCommunicator.RX_BUFFER_LEN)
+        self._rxView = memoryview(self._rxBuffer)
+        self._rxStart = 0
+        self._rxEnd = 0
+        # loop.time() when the data being parsed was received
+        self.rxTime = 0.0
         self._serialCommands = {
             b'ID': self._receive_id,  # Received a processor ID and version
             b'ER': self._receive_er   # Received an error code
         }
         self._serialCommands.update(serialCommandCallbacks)
+        # Commands sent within one event loop iteration are collected in
+        # two priority lanes and written to the transport at once.
+        # Control commands (OUT, RUL, ...) are always written first.
+        # Bulk data (LED, I2C) only while the transport has nothing buffered,
+        # so it can never delay control commands by more than one write.
+        # Optional FanTasTicLatency of the platform
+        self.latency = platform.latency
+        latency = self.latency
+        self._txControl = FanTasTicTxLane(
+            "control", latency and latency.txControl
+        )
+        self._txBulk = FanTasTicTxLane("bulk", latency and latency.txBulk)
+        # Oldest `SE:` receive time (tRx) of the queued control commands,
+        # which were sent by switch handlers
+        self._txTrigger = None
+        self._txChunks = list()
+        self._txFlushHandle = None
+        self._txFlushSoon = False
+        # While corked, control commands are only queued. See cork()
+        self._txCorked = False
+        # Statistics of the write coalescing
+        self.txCommands = 0
+        self.txWrites = 0
+        # Commands, messages and bytes per type, error codes
+        self.telemetry = FanTasTicTelemetry()
+        self.recorder = None
+        if recordFile:
+            self.recorder = FanTasTicRecorder(recordFile)
+        self.bulkWriter = None
+        if bulkWriterThread:
+            self.bulkWriter = FanTasTicBulkWriter(
+                self.machine.clock.loop, port, self.flush, self.log
+            )
+            self.bulkWriter.recorder = self.recorder
+            self.bulkWriter.telemetry = self.telemetry
+
+    async def connect(self):
+        await super().connect()
+        if self.bulkWriter is not None:
+            self.bulkWriter.start()
 
     async def _identify_connection(self):
         '''Initialise and identify connection.'''
@@ -78,77 +252,367 @@ class FanTasTicSerialCommunicator(BaseSerialCommunicator):
         )
         await self.start_read_loop()
 
+    async def reconnect(self):
+        '''Close the serial connection and connect again.
+        Messages queued while the link was down are dropped. They are stale
+        by now (late coil pulses), the platform restores the state of the
+        board instead, see FanTasTicHardwarePlatform._recover().'''
+        if self.read_task:
+            self.read_task.cancel()
+            self.read_task = None
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        if self.bulkWriter is not None:
+            self.bulkWriter.stop()
+        self._rxStart = self._rxEnd = 0
+        self._txCorked = False
+        self._txControl.clear()
+        self._txBulk.clear()
+        self._txTrigger = None
+        await self.connect()
+
+    async def read(self, n=-1):
+        '''Read up to `n` bytes. Returns None when the connection is lost,
+        without stopping the machine (unlike the base class).'''
+        try:
+            resp = await self.reader.read(n)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.log.warning("Serial error: {}".format(e))
+            return None
+        if not resp:
+            self.log.warning("Serial closed.")
+            return None
+        if self.debug:
+            self.log.debug("%s received: %s", self, resp)
+        return resp
+
+    async def _socket_reader(self):
+        while True:
+            resp = await self.read(
+                FanTasTicSerialCommunicator.RX_READ_LEN
+            )
+            if resp is None:
+                break
+            if self.recorder is not None:
+                self.recorder.record(FanTasTicRecorder.RX, resp)
+            self._parse_msg(resp)
+        # Let the platform reconnect and restore the state of the board
+        self.platform.connection_lost(self)
+
     def send(self, msg):
-        '''Send a message to the remote processor over the serial connection.
+        '''Queue a control command for the remote processor.
+
+        All messages sent within one iteration of the event loop are written
+        to the serial connection at once, at the end of the iteration.
+        Use flush() to write them right away.
 
         Args:
-            msg: Bytes or str of the message you want to send.
+            msg: Bytes, memoryview or str of the message you want to send.
         '''
         if type(msg) is str:
             msg = bytes(msg, 'utf8')
+        self._txControl.put(msg, self.machine.clock.loop.time())
+        self.txCommands += 1
+        latency = self.latency
+        if latency is not None and latency.tTrigger is not None and \
+                self._txTrigger is None:
+            self._txTrigger = latency.tTrigger
+        self._schedule_flush()
+
+    def send_bulk(self, msg, key=None, whileCorked=False) -> bool:
+        '''Queue bulk data (LED frames, I2C transactions).
+
+        Bulk data is written after all queued control commands and only
+        when the transport has no more data buffered. While corked, it is
+        held back as well, unless `whileCorked` is set.
+
+        Args:
+            msg: Bytes, memoryview or str of the message you want to send.
+                Or a callable, returning the message (or None) when it is
+                written.
+            key: while a message with the same key is queued, further
+                messages with this key are dropped.
+            whileCorked: also write it while corked. For I2C requests,
+                which devices may await while the platform is configured.
+
+        Returns False if the message was dropped.
+        '''
+        if not self._txBulk.put(
+            msg, self.machine.clock.loop.time(), key, whileCorked
+        ):
+            return False
+        self.txCommands += 1
+        self._schedule_flush()
+        return True
+
+    def cork(self):
+        '''Hold back all control commands and bulk data until uncork().
+
+        Used while the platform is being configured, to write the whole
+        configuration in one burst instead of hundreds of small writes.
+        The order of the commands is kept, bulk data (LED frames) follows
+        the configuration. Only bulk data sent with `whileCorked` (I2C
+        requests) is written right away.
+        '''
+        self._txCorked = True
+
+    def uncork(self):
+        '''Write everything held back since cork(), right away.'''
+        self._txCorked = False
+        self.flush()
+
+    def _schedule_flush(self, delay=0):
+        loop = self.machine.clock.loop
+        if self._txFlushHandle is not None:
+            # A flush at the end of this iteration is already scheduled, or
+            # we want a delayed one (bulk retry) and one is already scheduled
+            if self._txFlushSoon or delay > 0:
+                return
+            # Don't let control commands wait for the bulk retry
+            self._txFlushHandle.cancel()
+        if delay > 0:
+            self._txFlushSoon = False
+            self._txFlushHandle = loop.call_later(delay, self._scheduled_flush)
+        else:
+            self._txFlushSoon = True
+            self._txFlushHandle = loop.call_soon(self._scheduled_flush)
+
+    def _scheduled_flush(self):
+        self._txFlushHandle = None
+        self.flush()
+
+    def flush(self, forceBulk=False):
+        '''Write all queued messages to the serial connection, in one write.
+        For latency critical commands.
+
+        Bulk data stays queued while the transport is still busy, unless
+        `forceBulk` is set. Then another flush is scheduled.
+        '''
+        if self.writer is None:
+            return
+        bulkWriter = self.bulkWriter
+        if bulkWriter is not None and bulkWriter.busy:
+            # Control commands too, the thread flushes again when done
+            return
+        now = self.machine.clock.loop.time()
+        chunks = self._txChunks
+        corked = self._txCorked
+        if not corked:
+            self._txControl.drain(chunks, now)
+        if self._txBulk.queue and (not corked or self._txBulk.nWhileCorked):
+            if bulkWriter is not None:
+                # Control commands first, the bulk data once they are out
+                self._write(chunks)
+                if self.writer.transport.get_write_buffer_size() <= 0:
+                    bulk = list()
+                    self._txBulk.drain(bulk, now, True, corked)
+                    if bulk:
+                        bulkWriter.put(bulk)
+                else:
+                    self._schedule_flush(
+                        FanTasTicSerialCommunicator.BULK_RETRY
+                    )
+                return
+            if forceBulk or \
+                    self.writer.transport.get_write_buffer_size() <= 0:
+                self._txBulk.drain(chunks, now, corked=corked)
+            else:
+                self._schedule_flush(FanTasTicSerialCommunicator.BULK_RETRY)
+        self._write(chunks)
+
+    def _write(self, chunks):
+        '''Write and clear `chunks` with a single write.
+        The join copies LED frames along with the commands. Writing them on
+        their own would not avoid the copy, pyserial converts memoryviews
+        to bytes, and would cost a syscall per frame.'''
+        if not chunks:
+            return
+        countTx = self.telemetry.count_tx
+        if len(chunks) == 1:
+            msg = chunks[0]
+            countTx(msg)
+        else:
+            for chunk in chunks:
+                countTx(chunk)
+            msg = b''.join(chunks)
+        chunks.clear()
+        self.txWrites += 1
         super().send(msg)
+        if self.recorder is not None:
+            self.recorder.record(FanTasTicRecorder.TX, msg)
+        if self._txTrigger is not None and not self._txCorked:
+            self.latency.record(self.latency.switchToTx, self._txTrigger)
+            self._txTrigger = None
+
+    def get_tx_stats(self) -> dict:
+        '''Queue depth and wait time [s] statistics per priority lane'''
+        stats = {
+            "control": self._txControl.get_stats(),
+            "bulk": self._txBulk.get_stats(),
+            "commands": self.txCommands,
+            "writes": self.txWrites
+        }
+        if self.bulkWriter is not None:
+            stats["bulk_writer"] = self.bulkWriter.get_stats()
+        if self.recorder is not None:
+            stats["recorder"] = self.recorder.get_stats()
+        return stats
+
+    def get_telemetry(self, now) -> dict:
+        '''Traffic counters and rates, sampled at `now` [s], and the
+        current backlog of the link'''
+        self.telemetry.sample(now)
+        stats = self.telemetry.get_stats()
+        stats["queue_depth"] = {
+            "control": len(self._txControl.queue),
+            "bulk": len(self._txBulk.queue)
+        }
+        stats["write_buffer"] = 0
+        if self.writer is not None:
+            stats["write_buffer"] = \
+                self.writer.transport.get_write_buffer_size()
+        stats["bulk_writer_busy"] = \
+            self.bulkWriter is not None and self.bulkWriter.busy
+        return stats
+
+    def stop(self):
+        '''Write what is still queued, then close the serial connection.'''
+        self._txCorked = False
+        if self.bulkWriter is not None:
+            # The rest goes through the transport
+            self.bulkWriter.stop()
+            self.bulkWriter = None
+        self.flush(forceBulk=True)
+        super().stop()
+        if self.recorder is not None:
+            self.recorder.close()
 
-    def _addToRxBuffer(self, msg, sep='\n'):
+    def _addToRxBuffer(self, msg, sep=b'\n'):
         '''
-        adds msg data to rx buffer until sep is found,
-        then returns a complete message, (without sep).
+        adds msg data to rx buffer and yields all complete messages
+        (without sep) as memoryviews into the buffer.
 
-        If sep is not found, it returns b''
+        The buffer is scanned with a moving offset. It is only compacted
+        when there is no space left for new data at its end, and it is
+        reset to the start when all data has been consumed.
+        A message is consumed when it is yielded, it is not yielded again
+        if the caller stops early or a callback raises.
+        The memoryviews are only valid until the next call.
         '''
-        self._rxBuffer.extend(msg)
+        nMsg = len(msg)
+        if self._rxEnd + nMsg > len(self._rxBuffer):
+            self._compactRxBuffer(nMsg)
+        buf = self._rxBuffer
+        view = self._rxView
+        find = buf.find
+        end = self._rxEnd + nMsg
+        buf[self._rxEnd:end] = msg
+        self._rxEnd = end
+        pos = self._rxStart
         while True:
-            fullBuff, part, remaindBuff = self._rxBuffer.partition(b'\n')
-            if part != b'\n':   # Found not even one complete message
+            sepPos = find(sep, pos, end)
+            if sepPos < 0:  # Found not even one complete message
                 break
-            self._rxBuffer = remaindBuff
-            yield fullBuff
+            start = pos
+            pos = self._rxStart = sepPos + 1
+            yield view[start:sepPos]
+        # Not reached if the caller stopped early
+        if pos >= end:
+            self._rxStart = self._rxEnd = 0
+        else:
+            self._rxStart = pos
+
+    def _compactRxBuffer(self, nNew):
+        '''
+        Moves the unprocessed data to the start of the rx buffer,
+        makes sure there is space for nNew more bytes.
+        '''
+        nRemain = self._rxEnd - self._rxStart
+        remain = self._rxBuffer[self._rxStart:self._rxEnd]
+        if nRemain + nNew > len(self._rxBuffer):
+            # Views handed out before may still exist, which prevents
+            # resizing. Use a new buffer instead.
+            self._rxBuffer = bytearray(
+                max(2 * len(self._rxBuffer), nRemain + nNew)
+            )
+            self._rxView = memoryview(self._rxBuffer)
+        self._rxBuffer[:nRemain] = remain
+        self._rxStart = 0
+        self._rxEnd = nRemain
 
     def _parse_msg(self, msg):
         '''Parse a message.
         Sends an incoming message from the fantastic controller to the proper
         method for servicing.
         Msg may be partial.
+        The payload is passed to the callbacks as a memoryview into the rx
+        buffer. It is only valid during the callback.
         Args:
             msg: Bytes of the message (part) received.
         '''
+        self.rxTime = self.machine.clock.loop.time()
+        latency = self.latency
+        if latency is not None:
+            tPrev = latency.tRx = latency.now()
         # Take care of buffering partials and returns only complete messages
+        serialCommands = self._serialCommands
+        telemetry = self.telemetry
+        telemetry.rxBytes += len(msg)
+        rxCount = telemetry.rxCount
+        rxIndex = RX_INDEX.get
         for completeMsg in self._addToRxBuffer(msg):
-            if completeMsg[2:3] != b':':
+            if len(completeMsg) < 3 or completeMsg[2] != 0x3A:     # b':'
+                rxCount[RX_OTHER] += 1
                 self.send(b'\n')   # Clear previous commands
-                self._rxBuffer.clear()
+                self._rxStart = self._rxEnd = 0
                 self.log.error(
                     'Serial communicator : Received malformed message: %s',
-                    completeMsg
+                    bytes(completeMsg)
                 )
                 return
-            cmd = bytes(completeMsg[0:2])
-            payload = completeMsg[3:]
+            cmd = completeMsg[0:2].tobytes()
+            rxCount[rxIndex(cmd, RX_OTHER)] += 1
+            callback = serialCommands.get(cmd)
             # Can't use try since it swallows too many errors for now
-            if cmd in self._serialCommands:
-                self._serialCommands[cmd](payload)
+            if latency is not None:
+                tStart = latency.now()
+                latency.rxFraming.record(int((tStart - tPrev) * 1e6))
+            if callback is not None:
+                callback(completeMsg[3:])
             else:
                 self.log.error(
                     'Received unknown serial command? %s',
-                    completeMsg
+                    bytes(completeMsg)
                 )
+            if latency is not None:
+                tPrev = latency.now()
+                latency.rxHandler.record(int((tPrev - tStart) * 1e6))
 
     def _receive_id(self, payload):
         ''' Parses the ID payload. Not really used, more of a demonstration '''
         self.log.info(
             'Received Fan-Tas-Tic firmware version: %s',
-            payload.decode()
+            str(payload, 'utf8')
         )
 
     def _receive_er(self, payload):
         ''' Recived an error code like ER:xxxx\n '''
-        errCode = int(payload)
+        errCode = int(bytes(payload))
+        self.telemetry.count_error(errCode)
 
         errStr = FanTasTicSerialCommunicator.errStrs.get(errCode, "")
-        errStr = 'FanTasTic Hardware Error: 0x%04X. {:}'.format(
+        errStr = 'FanTasTic Hardware Error: 0x{:04X}. {:}'.format(
             errCode, errStr
         )
 
-        if (errCode >= 0x0100):
+        if errCode == FanTasTicSerialCommunicator.ERR_WATCHDOG:
+            errStr += ' Board was reset, restoring its state.'
+            self.log.error(errStr)
+            self.platform.connection_lost(self)
+        elif (errCode >= 0x0100):
             errStr += ' Fatal! Shutting down!'
             self.log.error(errStr)
             self.machine.stop(errStr)
@@ -1,14 +1,21 @@
 from typing import Any
 from mpf.platforms.interfaces.switch_platform_interface import SwitchPlatformInterface
+from fantastic_platform.fantastic_board import parse_board_number
 
 class FanTasTicSwitch(SwitchPlatformInterface):
-    """ Represents a switch input """
-    __slots__ = ["serialCom", "hwIndex"]
+    """
+    Represents a switch input. The number MPF sees is `hwIndex` on board 0
+    and `board * N_SWITCHES + hwIndex` on the other boards.
+    """
+    N_SWITCHES = 0x140
+    __slots__ = ["serialCom", "board", "hwIndex"]
 
     def __init__(self, config: "SwitchConfig", number: Any, serialCom) -> None:
         self.serialCom = serialCom
-        self.hwIndex = int(number)
-        super().__init__(config, self.hwIndex)
+        self.board, self.hwIndex = parse_board_number(number)
+        super().__init__(
+            config, self.board * FanTasTicSwitch.N_SWITCHES + self.hwIndex
+        )
         # sanity check the hwIndex
         if (
             self.hwIndex < 0 or
@@ -19,15 +26,20 @@ class FanTasTicSwitch(SwitchPlatformInterface):
                 "Invalid switch hwIndex: 0x{0:02x}".format(self.hwIndex)
             )
 
+        self.serialCom.send(self.get_config_cmd())
+
+    def get_config_cmd(self):
+        """ The commands which configure this switch on the board """
         # Enable / disable the debouncing with DEB command
-        if config.debounce:
-            self.serialCom.send("DEB {0:d} 1\n".format(self.hwIndex))
+        if self.config.debounce:
+            cmd = "DEB {0:d} 1\n".format(self.hwIndex)
         else:
-            self.serialCom.send("DEB {0:d} 0\n".format(self.hwIndex))
+            cmd = "DEB {0:d} 0\n".format(self.hwIndex)
 
         # Enable PCF internal pullups
         if self.hwIndex >= 0x48:
-            self.serialCom.send("HI {0:d}\n".format(self.hwIndex))
+            cmd += "HI {0:d}\n".format(self.hwIndex)
+        return cmd
 
     def get_board_name(self):
         """Return the name of the board of this driver."""
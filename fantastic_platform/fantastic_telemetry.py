@@ -0,0 +1,193 @@
+""" Traffic counters of the serial link of one board """
+from collections import deque
+
+# Command types of the host, index into the tx counters
+TX_TYPES = (
+    "LED", "OUT", "RUL", "RULE", "I2C", "SW?", "SWE", "SOE", "DEB", "HI",
+    "LEC", "*IDN?", "other"
+)
+(TX_LED, TX_OUT, TX_RUL, TX_RULE, TX_I2C, TX_SWQ, TX_SWE, TX_SOE, TX_DEB,
+ TX_HI, TX_LEC, TX_IDN, TX_OTHER) = range(len(TX_TYPES))
+# Message types of the board, index into the rx counters
+RX_TYPES = ("SE", "SW", "I2", "ER", "ID", "other")
+RX_SE, RX_SW, RX_I2, RX_ER, RX_ID, RX_OTHER = range(len(RX_TYPES))
+# Command type by the first byte, -1: see tx_type()
+TX_FIRST = [TX_OTHER] * 256
+TX_FIRST[0x4C] = TX_FIRST[0x52] = TX_FIRST[0x53] = -1       # L, R, S
+TX_FIRST[0x4F] = TX_OUT                                     # O
+TX_FIRST[0x49] = TX_I2C                                     # I
+TX_FIRST[0x44] = TX_DEB                                     # D
+TX_FIRST[0x48] = TX_HI                                      # H
+TX_FIRST[0x2A] = TX_IDN                                     # *
+# Message type by the first two bytes, as used to look up its handler
+RX_INDEX = {
+    b"SE": RX_SE, b"SW": RX_SW, b"I2": RX_I2, b"ER": RX_ER, b"ID": RX_ID
+}
+
+
+def tx_type(msg, i: int, n: int) -> int:
+    """ Type of the command starting at `msg[i]`, `n` = len(msg) """
+    c = msg[i]
+    t = TX_FIRST[c]
+    if t >= 0:
+        return t
+    if c == 0x4C:                                   # L
+        if i + 2 < n and msg[i + 2] == 0x43:        # LEC
+            return TX_LEC
+        return TX_LED
+    if c == 0x52:                                   # R
+        if i + 3 < n and msg[i + 3] == 0x45:        # RULE
+            return TX_RULE
+        return TX_RUL
+    if i + 2 < n:                                   # S
+        if msg[i + 1] == 0x4F:                      # SOE
+            return TX_SOE
+        if msg[i + 2] == 0x3F:                      # SW?
+            return TX_SWQ
+        return TX_SWE
+    return TX_OTHER
+
+
+class FanTasTicTelemetry:
+    """
+    Counts commands and bytes per type in both directions, and the error
+    codes of the board. The counters are preallocated lists indexed by the
+    type, which is found from the first bytes by table lookups, so counting
+    creates no strings, tuples or dict entries per message.
+
+    RX is counted by the communicator while parsing: `rxCount` per message,
+    `rxBytes` per chunk read. TX is counted when the data is written (by the
+    event loop or the bulk writer thread). The bulk writer only writes LED
+    frames and I2C commands, which the loop never writes while it exists,
+    so both never update the same counter.
+
+    `sample()` adds a point to the rolling window of the byte totals, the
+    platform calls it with each export. The rates are taken over the window.
+    """
+    WINDOW = 10     # Number of samples in the rolling window
+    __slots__ = [
+        "txCount", "txBytes", "rxCount", "rxBytes", "errCounts", "_samples"
+    ]
+
+    def __init__(self) -> None:
+        self.txCount = [0] * len(TX_TYPES)
+        self.txBytes = [0] * len(TX_TYPES)
+        self.rxCount = [0] * len(RX_TYPES)
+        self.rxBytes = 0
+        # error code: number of times received
+        self.errCounts = dict()
+        # (time, tx bytes, rx bytes)
+        self._samples = deque(maxlen=FanTasTicTelemetry.WINDOW)
+
+    def count_tx(self, chunk):
+        """
+        Count the commands in `chunk`, which is written in one piece.
+        An `LED` command is followed by binary data, it is always the only
+        command of its chunk.
+        """
+        n = len(chunk)
+        if n <= 0:
+            return
+        t = TX_FIRST[chunk[0]]
+        if t < 0:
+            t = tx_type(chunk, 0, n)
+            if t == TX_LED:
+                # Binary frame (a memoryview), not split into lines
+                self.txCount[t] += 1
+                self.txBytes[t] += n
+                return
+        if chunk.find(b"\n", 0, n - 1) < 0:
+            # Most chunks are a single command
+            self.txCount[t] += 1
+            self.txBytes[t] += n
+            return
+        txCount = self.txCount
+        txBytes = self.txBytes
+        find = chunk.find
+        i = 0
+        while i < n:
+            end = find(b"\n", i)
+            end = n if end < 0 else end + 1
+            t = tx_type(chunk, i, n)
+            txCount[t] += 1
+            txBytes[t] += end - i
+            i = end
+
+    def count_error(self, errCode: int):
+        self.errCounts[errCode] = self.errCounts.get(errCode, 0) + 1
+
+    def sample(self, now: float):
+        """ Add the current byte totals to the rolling window """
+        self._samples.append((now, sum(self.txBytes), self.rxBytes))
+
+    def get_rates(self):
+        """ (tx, rx) bytes / s over the rolling window """
+        if len(self._samples) < 2:
+            return 0.0, 0.0
+        t0, tx0, rx0 = self._samples[0]
+        t1, tx1, rx1 = self._samples[-1]
+        if t1 <= t0:
+            return 0.0, 0.0
+        return (tx1 - tx0) / (t1 - t0), (rx1 - rx0) / (t1 - t0)
+
+    def get_stats(self) -> dict:
+        txRate, rxRate = self.get_rates()
+        return {
+            "tx": {
+                name: {"commands": self.txCount[t], "bytes": self.txBytes[t]}
+                for t, name in enumerate(TX_TYPES) if self.txBytes[t]
+            },
+            "rx": {
+                name: self.rxCount[t]
+                for t, name in enumerate(RX_TYPES) if self.rxCount[t]
+            },
+            "rx_bytes": self.rxBytes,
+            "errors": dict(self.errCounts),
+            "tx_bytes_per_s": txRate,
+            "rx_bytes_per_s": rxRate
+        }
+
+
+def format_prometheus(boardStats: dict) -> str:
+    """
+    Prometheus text format of the telemetry of all boards, as returned by
+    FanTasTicHardwarePlatform.get_telemetry()
+    """
+    metrics = (
+        ("tx_commands_total", "counter", "Commands written to the board"),
+        ("tx_bytes_total", "counter", "Bytes written to the board"),
+        ("rx_messages_total", "counter", "Messages received from the board"),
+        ("rx_bytes_total", "counter", "Bytes received from the board"),
+        ("errors_total", "counter", "Error codes reported by the board"),
+        ("tx_bytes_per_second", "gauge", "Rolling TX rate"),
+        ("rx_bytes_per_second", "gauge", "Rolling RX rate"),
+        ("queue_depth", "gauge", "Messages queued per TX lane"),
+        ("write_buffer_bytes", "gauge", "Bytes buffered by the transport")
+    )
+    samples = {name: list() for name, _, _ in metrics}
+    for board, stats in boardStats.items():
+        b = 'board="{0}"'.format(board)
+        for name, tx in stats["tx"].items():
+            lbl = '{0},type="{1}"'.format(b, name)
+            samples["tx_commands_total"].append((lbl, tx["commands"]))
+            samples["tx_bytes_total"].append((lbl, tx["bytes"]))
+        for name, count in stats["rx"].items():
+            lbl = '{0},type="{1}"'.format(b, name)
+            samples["rx_messages_total"].append((lbl, count))
+        samples["rx_bytes_total"].append((b, stats["rx_bytes"]))
+        for code, count in stats["errors"].items():
+            lbl = '{0},code="0x{1:04X}"'.format(b, code)
+            samples["errors_total"].append((lbl, count))
+        samples["tx_bytes_per_second"].append((b, stats["tx_bytes_per_s"]))
+        samples["rx_bytes_per_second"].append((b, stats["rx_bytes_per_s"]))
+        for lane, depth in stats["queue_depth"].items():
+            lbl = '{0},lane="{1}"'.format(b, lane)
+            samples["queue_depth"].append((lbl, depth))
+        samples["write_buffer_bytes"].append((b, stats["write_buffer"]))
+    lines = list()
+    for name, kind, helpText in metrics:
+        lines.append("# HELP fantastic_{0} {1}".format(name, helpText))
+        lines.append("# TYPE fantastic_{0} {1}".format(name, kind))
+        for lbl, value in samples[name]:
+            lines.append("fantastic_{0}{{{1}}} {2}".format(name, lbl, value))
+    return "\n".join(lines) + "\n"
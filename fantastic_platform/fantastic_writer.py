@@ -0,0 +1,183 @@
+""" Optional writer thread for the bulk data of a serial communicator """
+import os
+import select
+import threading
+
+
+class FanTasTicBulkWriter:
+    """
+    Writes the bulk data (LED frames, I2C commands) of a serial communicator
+    from a background thread, through a second, blocking file descriptor of
+    the serial port.
+
+    The communicator hands over all bulk messages of one flush with
+    `put()`, once the asyncio transport has nothing buffered. Messages can
+    be bytes, str (encoded here) or callables which return the message when
+    called in the thread. The platform uses them to apply the LED lookup
+    table to the back buffer of a frame. All messages are written with a
+    single `writev()`, which does not hold the GIL while the link is busy.
+
+    Only one side writes at a time, or a partial write of one side could
+    be split by the other: while `busy`, the communicator holds back its
+    control commands too. So a coil pulse waits for the whole bulk write
+    in progress (LED frames of ~3 kB). This gives up the priority of the
+    control commands over bulk data which the communicator has without
+    the thread. In benchmarks/bench_led_writer.py the loop CPU time per
+    frame and the loop lag with the thread are within the noise of
+    writing from the loop, so the thread is off by default.
+
+    The port is opened with `os.open()`, so it must be a device path on a
+    POSIX system, see `supports_port()`. It is non-blocking: a write to a
+    stalled port waits in `select()`, and `stop()` ends it within
+    POLL_INTERVAL [s].
+    """
+    POLL_INTERVAL = 0.05
+    # Max. time [s] stop() waits for the thread
+    STOP_TIMEOUT = 1.0
+    __slots__ = [
+        "loop", "port", "onDone", "log", "recorder", "telemetry", "busy",
+        "nWrites", "nBytes", "_msgs", "_wake", "_idle", "_running",
+        "_thread"
+    ]
+
+    def __init__(self, loop, port: str, onDone, log) -> None:
+        self.loop = loop
+        self.port = port
+        # Called on the event loop after each write
+        self.onDone = onDone
+        self.log = log
+        # Optional FanTasTicRecorder of the communicator
+        self.recorder = None
+        # Optional FanTasTicTelemetry of the communicator
+        self.telemetry = None
+        # Set on the event loop by put(), cleared when the write is done
+        self.busy = False
+        self.nWrites = 0
+        self.nBytes = 0
+        self._msgs = None
+        self._wake = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._running = False
+        self._thread = None
+
+    @staticmethod
+    def supports_port(port) -> bool:
+        """
+        False for ports the thread can not open: Windows `COMx` ports and
+        pyserial URLs like `socket://`
+        """
+        return os.name == "posix" and isinstance(port, str) and \
+            "://" not in port
+
+    def start(self):
+        """ Open the port (again) and start the thread """
+        if self._running:
+            return
+        fd = os.open(
+            self.port, os.O_WRONLY | os.O_NOCTTY | os.O_NONBLOCK
+        )
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, args=(fd,), name="FanTasTicBulkWriter",
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        End the thread, it closes the port. A write still waiting for the
+        port is given up
+        """
+        if not self._running:
+            return
+        self._running = False
+        self._wake.set()
+        self._thread.join(FanTasTicBulkWriter.STOP_TIMEOUT)
+        if self._thread.is_alive():
+            self.log.warning("Bulk writer thread did not stop")
+        self._thread = None
+        self.busy = False
+
+    def put(self, msgs: list):
+        """ Write `msgs` in the thread. Only call while not `busy` """
+        self.busy = True
+        self._idle.clear()
+        self._msgs = msgs
+        self._wake.set()
+
+    def wait_idle(self, timeout=None) -> bool:
+        """ Block until the current write is done """
+        return self._idle.wait(timeout)
+
+    def _run(self, fd):
+        try:
+            while True:
+                self._wake.wait()
+                self._wake.clear()
+                msgs = self._msgs
+                self._msgs = None
+                if msgs is not None:
+                    self._write(fd, msgs)
+                    self._idle.set()
+                    self.loop.call_soon_threadsafe(self._done)
+                if not self._running:
+                    return
+        finally:
+            os.close(fd)
+
+    def _write(self, fd, msgs):
+        chunks = list()
+        for msg in msgs:
+            if callable(msg):
+                msg = msg()
+                if msg is None:
+                    continue
+            if type(msg) is str:
+                msg = msg.encode()
+            chunks.append(msg)
+        nTotal = sum(len(chunk) for chunk in chunks)
+        try:
+            if not self._write_all(fd, chunks, nTotal):
+                return
+        except OSError as e:
+            # The read loop notices when the connection is lost
+            self.log.warning("Bulk write failed: %s", e)
+            return
+        self.nWrites += 1
+        self.nBytes += nTotal
+        if self.telemetry is not None:
+            for chunk in chunks:
+                self.telemetry.count_tx(chunk)
+        if self.recorder is not None:
+            self.recorder.record(self.recorder.TX, b"".join(chunks))
+
+    def _write_all(self, fd, chunks, nTotal) -> bool:
+        """ Write `chunks` to `fd`. False if stop() was called meanwhile """
+        n = 0
+        data = None
+        while n < nTotal:
+            if not self._running:
+                return False
+            try:
+                if data is None:
+                    n = os.writev(fd, chunks)
+                    if n < nTotal:
+                        # The rest goes out piece by piece
+                        data = memoryview(b"".join(chunks))
+                else:
+                    n += os.write(fd, data[n:])
+            except BlockingIOError:
+                # Wait for room in the port, or for stop()
+                select.select(
+                    (), (fd,), (), FanTasTicBulkWriter.POLL_INTERVAL
+                )
+        return True
+
+    def _done(self):
+        """ On the event loop, after the thread wrote everything """
+        self.busy = False
+        self.onDone()
+
+    def get_stats(self) -> dict:
+        return {"writes": self.nWrites, "bytes": self.nBytes}
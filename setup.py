@@ -32,7 +32,7 @@ setup(
     # MANIFEST.in picks up the rest
     packages=['fantastic_platform'],
 
-    install_requires=['mpf'],
+    install_requires=['mpf', 'numpy'],
 
     entry_points='''
     [mpf.platforms]